@@ -4,7 +4,13 @@ ib_rest - call the Infoblox REST API.
 Author:  Philip Harper
 Edited:  1/8/2025
 """
-import requests
+import queue
+import threading
+import time
+from ib_rest.governor import RetryPolicy, RateLimiter
+from ib_rest.page_sizer import PageSizer
+from ib_rest.schema_cache import SchemaCache, UnknownFieldException
+from ib_rest.session_store import SessionStore
 
 
 class NotLoggedInException(Exception):
@@ -15,6 +21,24 @@ class NotLoggedInException(Exception):
         super().__init__(self.message)
 
 
+class WapiException(Exception):
+    """"""
+    def __init__(self, response):
+        """"""
+        self.response = response
+        self.status_code = response.status_code
+        self.message = "WAPI request failed with status {}: {}".format(response.status_code, response.text)
+        super().__init__(self.message)
+
+
+class UnitializedException(Exception):
+    """"""
+    def __init__(self):
+        """"""
+        self.message = "Initialize the Connection with an URL before use!"
+        super().__init__(self.message)
+
+
 def loggedin_check(func):
     """
     If the wrapped instance method is called without the IB WAPI having
@@ -33,13 +57,47 @@ class Connection:
     A Connection instance will allow login and logout to an Infoblox REST
     API (WAPI), store the authentication and abstract the HTTP requests.
     """
-    def __init__(self, url="", certificate_bundle=""):
-        """"""
+    def __init__(self, url="", certificate_bundle="", schema_cache=None, session_store=None, object_cache=None,
+                 retry=None, rate_limiter=None, timeout=None, thread_safe=False, pool_connections=10, pool_maxsize=10,
+                 instrumentation=None, json_loads=None, transport=None):
+        """
+        Pass a SessionStore as session_store to reuse the session cookie and schema
+        of an earlier login, by this or another process, for the same URL and user.
+        Pass an ObjectCache as object_cache to cache get_by_reference responses.
+        Pass a RetryPolicy as retry to resend failed idempotent requests, a RateLimiter
+        (which may be shared by several Connections) as rate_limiter to limit the
+        requests per second and the seconds to wait for the Grid Master as timeout.
+        Set thread_safe to share this Connection between threads, each thread using its
+        own session which shares the login cookie and a pool of up to pool_maxsize
+        connections per host.
+        Pass an Instrumentation as instrumentation to measure every call.
+        Pages are decoded with json_loads, by default the fastest JSON library installed.
+        Requests are sent through transport (see the transport module), by default a
+        RequestsTransport with keep-alive connections and compressed responses.
+        """
         self.url=""
         self.certificate_bundle=False
-        self.session = requests.Session()
+        self._local = threading.local()
+        self._auth_lock = threading.Lock()
+        self._auth_count = 0
+        self.thread_safe = thread_safe
+        if transport is None:
+            from ib_rest.transport import RequestsTransport
+            transport = RequestsTransport(pool_connections, pool_maxsize)
+        self.transport = transport
+        self._session = self.transport.session()
         self.schema = dict()
+        self.schema_cache = schema_cache if schema_cache else SchemaCache()
+        self.session_store = session_store
+        self.object_cache = object_cache
+        self._credentials = None
+        self.retry = retry
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.instrumentation = instrumentation
+        self.json_loads = json_loads
         self.response = None
+        self.page_stats = dict()
         if url:
             self.initialize(url, certificate_bundle)
             
@@ -53,20 +111,165 @@ class Connection:
     def login(self, user:str, password:str):
         """
         Log in to the Infoblox Grid Manager REST API (WAPI) with API enabled credentials.  
+        With a session store, a stored session for this URL and user is reused instead.
         """
         if self.isloggedin:
             self.logout()
-        self.response = self.session.get(self.url+"/?_schema", auth=(user,password), verify=self.certificate_bundle)
+        self._credentials = (user, password)
+        if self.session_store is not None:
+            saved = self.session_store.load(self.url, user)
+            if saved.get("schema"):
+                self.session_store.restore(self.session, saved)
+                self.schema.update(saved["schema"])
+                return
+        self._authenticate(user, password)
+
+    @property
+    def session(self):
+        """
+        The requests Session used to send requests.  In thread safe mode each thread
+        has its own session, sharing the cookies of this Connection's main session.
+        """
+        if not self.thread_safe:
+            return self._session
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self.worker_session()
+        return session
+
+    @session.setter
+    def session(self, session):
+        """"""
+        self._session = session
+        self._local = threading.local()
+
+    @property
+    def response(self):
+        """
+        The last response received by the current thread.
+        """
+        return getattr(self._local, "response", None)
+
+    @response.setter
+    def response(self, response):
+        """"""
+        self._local.response = response
+
+    def _authenticate(self, user:str, password:str):
+        """
+        Send the credentials, which starts a new session (ibapauth cookie), and save
+        the schema.  With a session store the new session is stored for reuse.
+        """
+        self._auth_count += 1
+        self.response = self.session.get(self.url+"/?_schema", auth=(user,password), verify=self.certificate_bundle, timeout=self.timeout)
         if self.response.status_code == 200:
             self.schema.update(self.response.json())
+            if self.session_store is not None:
+                self.session_store.save(self.url, user, self.session.cookies, self.schema)
 
-    def logout(self):
+    def logout(self, end_session=None):
         """
         Invalidate the stored session credentials and indicate that the previous login
         is now logged out.
-        """
-        self.response = self.session.post(self.url+"/logout")
+        With a session store the session is left open on the Grid Master, for reuse by
+        the next login, unless end_session is set.
+        """
+        if end_session is None:
+            end_session = self.session_store is None
+        if end_session:
+            self.response = self.session.post(self.url+"/logout", verify=self.certificate_bundle, timeout=self.timeout)
+            if self.session_store is not None and self._credentials:
+                self.session_store.remove(self.url, self._credentials[0])
         self.schema = dict()
+        self._credentials = None
+
+    def _wapi_type(self, uri:str) -> str:
+        """
+        The WAPI object type a request URI is for, or "file" for a file transfer URL.
+        """
+        if not uri.startswith(self.url+"/"):
+            return "file"
+        return uri[len(self.url)+1:].split("/")[0]
+
+    def _request(self, method:str, uri:str, session=None, **kwargs):
+        """
+        Send an HTTP request, through session when given instead of self.session, and
+        return the response.  If the session has expired (401) and the credentials of
+        the login are known, log in again and resend the request once.
+        With a retry policy a request which fails with a connection error, a timeout
+        or a retryable status is sent again after a backoff.
+        With instrumentation the request is recorded as a call named after its method.
+        """
+        if self.instrumentation is None:
+            return self._send(method, uri, session, None, **kwargs)
+        record = self.instrumentation.start(method.lower(), self._wapi_type(uri))
+        try:
+            return self._send(method, uri, session, record, **kwargs)
+        finally:
+            self.instrumentation.finish(record)
+
+    def _send(self, method:str, uri:str, session, record, **kwargs):
+        """
+        Send the request for _request, adding its status, bytes and retries to the
+        instrumentation record when given.  A file-like body (data) is rewound before
+        the request is sent again.
+        """
+        import requests
+        session = session if session is not None else self.session
+        kwargs.setdefault("timeout", self.timeout)
+        body = kwargs.get("data")
+        body_position = body.tell() if hasattr(body, "seek") and hasattr(body, "tell") else None
+        attempt = 0
+        reauthenticated = False
+        while True:
+            if body_position is not None:
+                body.seek(body_position)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            auth_count = self._auth_count
+            try:
+                response = session.request(method, uri, verify=self.certificate_bundle, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if self.retry is None or not self.retry.should_retry(method, attempt):
+                    raise
+                time.sleep(self.retry.delay(attempt))
+                attempt += 1
+                if record is not None:
+                    record["retries"] += 1
+                continue
+            if record is not None:
+                self._measure(record, response, kwargs.get("stream", False))
+            if response.status_code == 401 and self._credentials and not reauthenticated:
+                reauthenticated = True
+                with self._auth_lock:
+                    if auth_count == self._auth_count:
+                        self._authenticate(*self._credentials)
+                if session.cookies is not self._session.cookies:
+                    session.cookies.update(self._session.cookies)
+                continue
+            if self.retry is not None and self.retry.should_retry(method, attempt, response):
+                time.sleep(self.retry.delay(attempt, response))
+                attempt += 1
+                if record is not None:
+                    record["retries"] += 1
+                continue
+            return response
+
+    def _measure(self, record:dict, response, stream:bool):
+        """
+        Add the status and the bytes sent and received of a response to a record.
+        The body of a streamed response is counted from its Content-Length, as
+        reading it here would load it in to memory.
+        """
+        record["status"] = response.status_code
+        body = response.request.body if response.request is not None else None
+        if body is not None and hasattr(body, "__len__"):
+            record["request_bytes"] += len(body)
+        if stream:
+            length = response.headers.get("Content-Length", "")
+            record["response_bytes"] += int(length) if length.isdigit() else 0
+        else:
+            record["response_bytes"] += len(response.content)
         
     @property
     def isloggedin(self) -> bool:
@@ -76,102 +279,266 @@ class Connection:
         return bool(self.schema)
     
     @loggedin_check
-    def get(self, wapi_type:str, params={}):
+    def object_schema(self, wapi_type:str) -> dict:
+        """
+        Return the schema of the WAPI object type, with the details of its fields,
+        from the schema cache.
+        """
+        return self.schema_cache.get(self, wapi_type)
+
+    def _field_params(self, wapi_type:str, params:dict, fields) -> dict:
+        """
+        Return a copy of params requesting only the named fields, as _return_fields,
+        after validating them against the schema of the WAPI object type.
+        """
+        if not fields:
+            return params
+        field_params = dict()
+        field_params.update(params)
+        field_params.update({"_return_fields": self.schema_cache.return_fields(self, wapi_type, fields)})
+        return field_params
+
+    @loggedin_check
+    def get(self, wapi_type:str, params={}, fields=None):
         """
         Send an HTTP GET request and return the response.
+        If fields are named only those fields are returned for each object.
         """
-        self.response = self.session.get(self.url+"/"+wapi_type, verify=self.certificate_bundle, params=params)
+        params = self._field_params(wapi_type, params, fields)
+        self.response = self._request("GET", self.url+"/"+wapi_type, params=params)
         return self.response
     
     @loggedin_check
-    def get_by_reference(self, reference:str, params={}) -> dict:
+    def get_by_reference(self, reference:str, params={}, fields=None) -> dict:
         """
         If the WAPI object reference (_ref) has already been determined use that to
         get the specific WAPI object.
         Return the REST API object.
-        """
+        With an object cache a cached response is returned while it is fresh.
+        """
+        params = self._field_params(reference.split("/")[0], params, fields)
+        if self.object_cache is not None:
+            cached = self.object_cache.get(reference, params)
+            if cached is not None:
+                self.response = cached
+                return cached
+            generation = self.object_cache.generation(reference)
         uri = self.url+"/"+reference
-        self.response = self.session.get(uri, params=params)
+        self.response = self._request("GET", uri, params=params)
+        if self.object_cache is not None and self.response.status_code == 200:
+            self.object_cache.set(reference, params, self.response, generation)
         return self.response
     
-    @loggedin_check
-    def get_paged(self, wapi_type:str, params={}, page_size=20) -> list:
+    def _pages(self, wapi_type:str, params:dict, page_size, session=None, call="get_paged", record_type=None):
         """
-        When a long list of objects is expected a paged query is prefered.
+        Generate the result list of each page of a paged query, following next_page_id.
+        The responses are not stored in self.response so that the pages may be fetched
+        on a background thread.  If a page fails raise WapiException, with the page_id
+        of the failed page so that the query can be resumed from it by passing
+        _page_id in params.
+
+        page_size is the _max_results of every page or, for an adaptive page size, a
+        PageSizer (or "auto") whose statistics are kept in self.page_stats[wapi_type].
+        The pages are requested through session, when given, instead of self.session.
+        With instrumentation the query is recorded as one call, named call, once it
+        has ended.  Each page is decoded once, into records when given a record_type.
         """
-        def add_objects():
-            """
-            Extend the list (wapi_objects_l) with the new page of WAPI objects.
-            """
-            self.response = self.get(wapi_type, get_parms)
-            if self.response.status_code == 200:
-                 wapi_objects_l.extend(self.response.json()["result"])
-            else:
-                print(self.response.status_code)
-        wapi_objects_l = list()
+        sizer = PageSizer() if page_size == "auto" else page_size if isinstance(page_size, PageSizer) else None
         get_parms = dict()
         get_parms.update(params)
         page_params = {
             "_paging": "1",
             "_return_as_object": "1",
-            "_max_results": page_size
+            "_max_results": sizer.size if sizer else page_size
             }
         get_parms.update(page_params)
-        add_objects()
+        from ib_rest.decoder import PageDecoder
+        record = self.instrumentation.start(call, wapi_type) if self.instrumentation is not None else None
+        decode_page = PageDecoder(record_type, self.json_loads)
+        try:
+            yield from self._query_pages(wapi_type, get_parms, sizer, session, record, decode_page)
+        finally:
+            if record is not None:
+                self.instrumentation.finish(record)
+
+    def _query_pages(self, wapi_type:str, get_parms:dict, sizer, session, record, decode_page):
+        """
+        Generate the pages for _pages.
+        """
         while True:
-            next_page_id = self.response.json().get("next_page_id")
+            start = time.perf_counter()
+            response = self._send("GET", self.url+"/"+wapi_type, session, record, params=get_parms)
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                if sizer and sizer.istoolarge(response) and sizer.shrink():
+                    get_parms.update({"_max_results": sizer.size})
+                    continue
+                error = WapiException(response)
+                error.page_id = get_parms.get("_page_id")
+                raise error
+            page = decode_page(response.content)
+            if record is not None:
+                record["pages"] += 1
+            if sizer:
+                get_parms.update({"_max_results": sizer.update(len(page["result"]), elapsed, len(response.content))})
+                self.page_stats[wapi_type] = sizer.stats()
+            yield page["result"]
+            next_page_id = page.get("next_page_id")
             if next_page_id is None:
                 break
             get_parms.update({"_page_id":next_page_id})
-            add_objects()
-        return wapi_objects_l
 
-    @loggedin_check
-    def stream(self, wapi_type:str, params={}, page_size=20):
+    def _prefetch(self, pages, prefetch:int):
         """
-        When a long list of objects is expected generate in a stream.
+        Run the page generator on a background thread which stays up to prefetch pages
+        ahead of the consumer.  Pages are generated in order and an exception raised
+        while fetching is raised again to the consumer.  Closing this generator stops
+        the fetcher once its current request completes.
         """
-        def get_objects():
+        page_q = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        def put(item) -> bool:
+            """
+            Wait for room in the queue unless the consumer has gone away.
+            """
+            while not stop.is_set():
+                try:
+                    page_q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        def fetch():
             """
-            Set the list (wapi_objects_l) with the new page of WAPI objects.
-            Yield from the resulting list
+            Fetch pages in to the queue, ending with a done or error item.
             """
-            nonlocal wapi_objects_l
-            self.response = self.get(wapi_type, get_parms)
-            if self.response.status_code == 200:
-                 wapi_objects_l = self.response.json()["result"]
-            else:
-                print(self.response.status_code)
+            try:
+                for page in pages:
+                    if not put(("page", page)):
+                        return
+                put(("done", None))
+            except Exception as e:
+                put(("error", e))
+            finally:
+                pages.close()
+        fetcher = threading.Thread(target=fetch, name="ib_rest-prefetch", daemon=True)
+        fetcher.start()
+        try:
+            while True:
+                kind, value = page_q.get()
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    break
+                yield value
+        finally:
+            stop.set()
+
+    def _record_type(self, wapi_type:str, records, fields):
+        """
+        Return the records.Record type to decode objects into, if records are wanted:
+        records may be a Record type or True for the built in type of the WAPI type, or
+        a type made for the named fields.  Return the fields to request with it.
+        """
+        if not records:
+            return None, fields
+        from ib_rest.records import Record, record_type
+        if not (isinstance(records, type) and issubclass(records, Record)):
+            records = record_type(wapi_type, fields)
+        return records, records.fields()
+
+    @loggedin_check
+    def get_paged(self, wapi_type:str, params={}, page_size=20, fields=None, records=False, columnar=False):
+        """
+        When a long list of objects is expected a paged query is prefered.
+        Set page_size to "auto", or a PageSizer, to adapt the page size to the
+        time taken by each page.
+        Set records to return compact records (see the records module) instead of dicts.
+        Set columnar to True, for the named fields, or pass a columnar.Columnar to
+        collect the fields in columns and return the Columnar instead of a list.
+        If a page fails WapiException is raised with the objects already received as
+        result and the page_id to resume from.
+        """
+        if columnar is not False:
+            return self._get_columnar(wapi_type, params, page_size, fields, columnar)
         wapi_objects_l = list()
-        get_parms = dict()
-        get_parms.update(params)
-        page_params = {
-            "_paging": "1",
-            "_return_as_object": "1",
-            "_max_results": page_size
-            }
-        get_parms.update(page_params)
-        get_objects()
-        for wapi_object in wapi_objects_l:
-            yield wapi_object
-        
-        while True:
-            next_page_id = self.response.json().get("next_page_id")
-            if next_page_id is None:
-                break
-            get_parms.update({"_page_id":next_page_id})
-            get_objects()
-            for wapi_object in wapi_objects_l:
-                yield wapi_object
+        record_type, fields = self._record_type(wapi_type, records, fields)
+        params = self._field_params(wapi_type, params, fields)
+        try:
+            for page in self._pages(wapi_type, params, page_size, record_type=record_type):
+                wapi_objects_l.extend(page)
+        except WapiException as error:
+            error.result = wapi_objects_l
+            raise
+        return wapi_objects_l
 
+    def _get_columnar(self, wapi_type:str, params:dict, page_size, fields, columnar):
+        """
+        Collect a paged query in a Columnar, for get_paged.
+        """
+        from ib_rest.columnar import Columnar
+        if not isinstance(columnar, Columnar):
+            if not fields:
+                raise ValueError("Name the fields to collect in columns.")
+            columnar = Columnar(fields)
+        params = self._field_params(wapi_type, params, columnar.fields)
+        try:
+            for page in self._pages(wapi_type, params, page_size):
+                columnar.append_page(page)
+        except WapiException as error:
+            error.result = columnar
+            raise
+        finally:
+            columnar.close()
+        return columnar
+
+    @loggedin_check
+    def stream(self, wapi_type:str, params={}, page_size=20, prefetch=0, fields=None, records=False):
+        """
+        When a long list of objects is expected generate in a stream.
+        With prefetch set, up to that many pages are fetched on a background thread
+        ahead of the consumer.  A failed page raises WapiException.
+        Set records to generate compact records instead of dicts, as for get_paged.
+        """
+        record_type, fields = self._record_type(wapi_type, records, fields)
+        params = self._field_params(wapi_type, params, fields)
+        pages = self._pages(wapi_type, params, page_size, call="stream", record_type=record_type)
+        if prefetch:
+            pages = self._prefetch(pages, prefetch)
+        try:
+            for page in pages:
+                yield from page
+        finally:
+            pages.close()
+
+    @loggedin_check
+    def scan(self, wapi_type:str, shard_by, params={}, workers=4, page_size=1000, ordered=True, buffer_pages=None):
+        """
+        Generate every object of a large WAPI type by splitting the query into disjoint
+        shards (see the scan module for shard_by) which are paged concurrently by
+        workers threads, each with its own session sharing this login.
+        With ordered False objects are generated as soon as any shard's page arrives;
+        otherwise up to buffer_pages pages of later shards are held until their turn.
+        """
+        from ib_rest.scan import scan
+        return scan(self, wapi_type, shard_by, params, workers, page_size, ordered, buffer_pages)
+
+    def worker_session(self):
+        """
+        Return a new session of the transport, for use on another thread, which shares
+        the cookies (so the login), the connection pool and the headers of this Connection.
+        """
+        session = self.transport.session()
+        session.headers.update(self._session.headers)
+        session.cookies = self._session.cookies
+        return session
 
-    
     @loggedin_check
     def post(self, wapi_type:str, data:dict, params={}, headers={}):
         """
         Send an HTTP POST request and return the response.
         """
-        self.response = self.session.post(self.url+"/"+wapi_type, verify=self.certificate_bundle, json=data, params=params, headers=headers)
+        self.response = self._request("POST", self.url+"/"+wapi_type, json=data, params=params, headers=headers)
         return self.response
     
     @loggedin_check
@@ -179,7 +546,14 @@ class Connection:
         """
         Send an HTTP PUT request and return the response.
         """
-        self.response = self.session.put(self.url+"/"+reference, verify=self.certificate_bundle, json=data)
+        if self.object_cache is None:
+            self.response = self._request("PUT", self.url+"/"+reference, json=data)
+            return self.response
+        self.object_cache.invalidate(reference)
+        try:
+            self.response = self._request("PUT", self.url+"/"+reference, json=data)
+        finally:
+            self.object_cache.invalidate(reference)
         return self.response
     
     @loggedin_check
@@ -187,9 +561,35 @@ class Connection:
         """
         Send an HTTP DELETE request and return the response.
         """
-        self.response = self.session.delete(self.url+"/"+reference)
+        if self.object_cache is None:
+            self.response = self._request("DELETE", self.url+"/"+reference)
+            return self.response
+        self.object_cache.invalidate(reference)
+        try:
+            self.response = self._request("DELETE", self.url+"/"+reference)
+        finally:
+            self.object_cache.invalidate(reference)
         return self.response
-        
+
+    @loggedin_check
+    def multi(self, operations:list, chunk_size=100, on_error="continue") -> list:
+        """
+        Send a list of operations, in the format of the WAPI "request" object, in
+        chunks of chunk_size per HTTP request.
+        Return a BatchResponse for each operation in the same order.
+        """
+        from ib_rest.batch import send
+        return send(self, operations, chunk_size, on_error)
+
+    @loggedin_check
+    def batch(self, chunk_size=100, on_error="continue"):
+        """
+        Return a Batch which accumulates get, post, put and delete calls and sends
+        them through the WAPI "request" object when flushed.
+        """
+        from ib_rest.batch import Batch
+        return Batch(self, chunk_size, on_error)
+
     def __enter__(self):
         """
         Enable an instance of this class to be used as a Context Manager as
@@ -207,34 +607,25 @@ class Connection:
             self.logout()
         
 
+def __getattr__(name):
+    """
+    Import the optional asyncio Connection only when it is requested so that the
+    async HTTP client is not required by the synchronous Connection.
+    """
+    if name == "AsyncConnection":
+        from ib_rest.async_connection import AsyncConnection
+        return AsyncConnection
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
 if __name__ == "__main__":
     """"""
-    from ltlddslta01_info import url, certificate_bundle
-    import os
-    with Connection(url=url, certificate_bundle=certificate_bundle) as ib_conn:
-        ib_conn.login(os.environ["ib-account-ro"], os.environ["ib-password-ro"])
-        #response = ib_conn.get("networkview", params={"name":"default"})
-        #response = ib_conn.get("networkview", params={"is_default":"True"})
-        #response = ib_conn.get_by_reference("networkview/ZG5zLm5ldHdvcmtfdmlldyQw:default/true")
+    from ib_rest.config import load_config
+    config = load_config()
+    with Connection(url=config["url"], certificate_bundle=config["certificate_bundle"]) as ib_conn:
+        ib_conn.login(config["user"], config["password"])
         response = ib_conn.get("grid")
         print(response.json()[0])
-        #response = ib_conn.get_by_reference(response.json()[0]["_ref"], params={"_return_fields":"name,allow_recursive_deletion"})
-        #print(type(response))
-        """
-        print(ib_conn.isloggedin)
-        for key, value in ib_conn.schema.items():
-            print("{}\t{}\n".format(key, value))
-        """
-        #results = ib_conn.get_paged("zone_auth", page_size=200)
-        """
-        for dhcp_range in ib_conn.stream("range", params={"_return_fields":"network,member","server_association_type":"MEMBER"}):
-            print(dhcp_range)
-        """
-        #print(len(results))
-        """
-        for result in results:
-            print("zone:\t{}\tview:\t{}".format(result.get("fqdn"), result.get("view")))
-        """
 
     if not ib_conn.isloggedin:
         print("logged out.")
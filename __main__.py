@@ -0,0 +1,122 @@
+"""
+__main__ - the ib_rest command line: python -m ib_rest backup|hosts|export.
+
+Only the standard library is imported until a command runs, and the session of the
+last run is reused (see session_store), so that short jobs started often, from
+cron, start quickly.
+"""
+import argparse
+import json
+import sys
+from ib_rest.config import ConfigException, load_config
+
+
+def connect(config:dict):
+    """
+    Return a Connection logged in to the configured grid.  Raise ConfigException if
+    the grid cannot be reached or the login fails.
+    """
+    import requests
+    from ib_rest import Connection
+    from ib_rest.session_store import SessionStore
+    session_store = SessionStore() if config["reuse_session"] else None
+    ib_connection = Connection(config["url"], config["certificate_bundle"], session_store=session_store,
+                               timeout=config["timeout"])
+    try:
+        ib_connection.login(config["user"], config["password"])
+    except requests.exceptions.RequestException as e:
+        raise ConfigException("Cannot connect to {}: {}".format(config["url"], e))
+    if not ib_connection.isloggedin:
+        response = ib_connection.response
+        raise ConfigException("Login to {} failed: {}".format(config["url"], response.text if response is not None else ""))
+    return ib_connection
+
+
+def backup(ib_connection, args) -> dict:
+    """
+    Download the grid backup into a folder or a chunk store.
+    """
+    from ib_rest.grid_backup import BandwidthLimiter, download
+    throttle = BandwidthLimiter(args.bandwidth) if args.bandwidth else None
+    chunk_store = None
+    if args.chunk_store:
+        from ib_rest.chunk_store import ChunkStore
+        chunk_store = ChunkStore(args.chunk_store)
+    return download(ib_connection, args.folder, throttle, chunk_store)
+
+
+def hosts(ib_connection, args) -> dict:
+    """
+    Look up record:host objects by name, given as arguments or one per line of a
+    file ("-" for stdin).
+    """
+    from ib_rest.record_host import find_hosts
+    names = list(args.names)
+    if args.file:
+        names_file = sys.stdin if args.file == "-" else open(args.file)
+        with names_file:
+            names.extend(line.strip() for line in names_file if line.strip())
+    found = find_hosts(ib_connection, names, args.view, args.fields, args.strategy)
+    missing = [name for name, host in found.items() if host is None]
+    return {"result": not missing, "hosts": found, "missing": missing}
+
+
+def export(ib_connection, args) -> dict:
+    """
+    Export every object of a WAPI type to a CSV file.
+    """
+    from ib_rest.bulk import csv_export
+    return csv_export(ib_connection, args.wapi_type, args.file)
+
+
+def parser() -> argparse.ArgumentParser:
+    """"""
+    arg_parser = argparse.ArgumentParser(prog="python -m ib_rest", description="Infoblox WAPI tasks.")
+    arg_parser.add_argument("--config", default="", help="INI config file (default $IB_REST_CONFIG or ~/.ib_rest/config.ini)")
+    arg_parser.add_argument("--grid", default="default", help="section of the config file to use")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    backup_parser = commands.add_parser("backup", help="download the grid backup")
+    backup_parser.add_argument("folder", help="folder to save the backup in")
+    backup_parser.add_argument("--chunk-store", default="", help="store the backup, deduplicated, in this chunk store instead")
+    backup_parser.add_argument("--bandwidth", type=int, default=0, help="maximum bytes per second")
+    backup_parser.set_defaults(run=backup)
+
+    hosts_parser = commands.add_parser("hosts", help="look up record:host objects by name")
+    hosts_parser.add_argument("names", nargs="*", help="host names (FQDN)")
+    hosts_parser.add_argument("--file", default="", help="read more names from this file, one per line, - for stdin")
+    hosts_parser.add_argument("--view", default="default")
+    hosts_parser.add_argument("--fields", default="", help="fields to return, comma separated (name is always returned)")
+    hosts_parser.add_argument("--strategy", default="auto", choices=["auto", "zone", "exact"])
+    hosts_parser.set_defaults(run=hosts)
+
+    export_parser = commands.add_parser("export", help="export a WAPI type to CSV")
+    export_parser.add_argument("wapi_type", help="for example record:host, network or range")
+    export_parser.add_argument("file", help="CSV file to write")
+    export_parser.set_defaults(run=export)
+    return arg_parser
+
+
+def main(argv=None) -> int:
+    """
+    Run a command and print its result as JSON.  Return 0 if it succeeded, 1 if it
+    failed and 2 for a configuration or login error.
+    """
+    args = parser().parse_args(argv)
+    try:
+        config = load_config(args.grid, args.config)
+        ib_connection = connect(config)
+    except ConfigException as e:
+        print(e.message, file=sys.stderr)
+        return 2
+    try:
+        result = args.run(ib_connection, args)
+    finally:
+        ib_connection.logout()
+    print(json.dumps(result, default=str))
+    return 0 if result.get("result") else 1
+
+
+if __name__ == "__main__":
+    """"""
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+async_connection - asyncio version of the ib_rest Connection built on httpx.
+"""
+import asyncio
+import httpx
+from ib_rest import UnitializedException, WapiException, loggedin_check
+
+
+class AsyncConnection:
+    """
+    An AsyncConnection instance provides the same login, logout and HTTP request
+    methods as a Connection, but each method is a coroutine.
+
+    All requests share one HTTP client with a bounded pool of max_connections
+    connections to the Grid Master and at most max_concurrency requests are in
+    flight at once, so many independent calls can be gathered without
+    overwhelming the WAPI.  With http2 the requests are multiplexed over one HTTP/2
+    connection when the Grid Master supports it (requires httpx[http2]).
+    """
+    def __init__(self, url="", certificate_bundle="", max_connections=10, max_concurrency=10, http2=False):
+        """"""
+        self.url = ""
+        self.certificate_bundle = False
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.http2 = http2
+        self.client = None
+        self.schema = dict()
+        self.response = None
+        self._semaphore = None
+        if url:
+            self.initialize(url, certificate_bundle)
+
+    def initialize(self, url:str, certificate_bundle:str):
+        """
+        Reset the target Grid Manager and HTTPS certificate bundle.
+        """
+        self.url = url
+        self.certificate_bundle = certificate_bundle if certificate_bundle else False
+
+    def _open(self):
+        """
+        Create the pooled HTTP client and the concurrency limit on first use.
+        """
+        if self.client is None:
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections
+                )
+            self.client = httpx.AsyncClient(verify=self.certificate_bundle, limits=limits, http2=self.http2)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _request(self, method:str, uri:str, **kwargs):
+        """
+        Send an HTTP request once a concurrency slot is free and return the response.
+        """
+        self._open()
+        async with self._semaphore:
+            response = await self.client.request(method, uri, **kwargs)
+        self.response = response
+        return response
+
+    async def login(self, user:str, password:str):
+        """
+        Log in to the Infoblox Grid Manager REST API (WAPI) with API enabled credentials.
+        """
+        if self.isloggedin:
+            await self.logout()
+        response = await self._request("GET", self.url+"/?_schema", auth=(user,password))
+        if response.status_code == 200:
+            self.schema.update(response.json())
+
+    async def logout(self):
+        """
+        Invalidate the stored session credentials and indicate that the previous login
+        is now logged out.
+        """
+        await self._request("POST", self.url+"/logout")
+        self.schema = dict()
+
+    async def close(self):
+        """
+        Close the pooled HTTP client.
+        """
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    @property
+    def isloggedin(self) -> bool:
+        """
+        Has this AsyncConnection been, successfully, logged into?
+        """
+        return bool(self.schema)
+
+    @loggedin_check
+    async def get(self, wapi_type:str, params={}):
+        """
+        Send an HTTP GET request and return the response.
+        """
+        return await self._request("GET", self.url+"/"+wapi_type, params=params)
+
+    @loggedin_check
+    async def get_by_reference(self, reference:str, params={}):
+        """
+        If the WAPI object reference (_ref) has already been determined use that to
+        get the specific WAPI object.
+        """
+        return await self._request("GET", self.url+"/"+reference, params=params)
+
+    @loggedin_check
+    async def get_paged(self, wapi_type:str, params={}, page_size=20) -> list:
+        """
+        When a long list of objects is expected a paged query is prefered.
+        """
+        return [wapi_object async for wapi_object in self.stream(wapi_type, params, page_size)]
+
+    @loggedin_check
+    async def stream(self, wapi_type:str, params={}, page_size=20):
+        """
+        When a long list of objects is expected generate in a stream.
+        """
+        get_parms = dict()
+        get_parms.update(params)
+        get_parms.update({
+            "_paging": "1",
+            "_return_as_object": "1",
+            "_max_results": page_size
+            })
+        while True:
+            response = await self.get(wapi_type, get_parms)
+            if response.status_code != 200:
+                raise WapiException(response)
+            page = response.json()
+            for wapi_object in page["result"]:
+                yield wapi_object
+            next_page_id = page.get("next_page_id")
+            if next_page_id is None:
+                break
+            get_parms.update({"_page_id":next_page_id})
+
+    @loggedin_check
+    async def post(self, wapi_type:str, data:dict, params={}, headers={}):
+        """
+        Send an HTTP POST request and return the response.
+        """
+        return await self._request("POST", self.url+"/"+wapi_type, json=data, params=params, headers=headers)
+
+    @loggedin_check
+    async def put(self, reference:str, data:dict):
+        """
+        Send an HTTP PUT request and return the response.
+        """
+        return await self._request("PUT", self.url+"/"+reference, json=data)
+
+    @loggedin_check
+    async def delete(self, reference:str):
+        """
+        Send an HTTP DELETE request and return the response.
+        """
+        return await self._request("DELETE", self.url+"/"+reference)
+
+    async def __aenter__(self):
+        """
+        Enable an instance of this class to be used as an asynchronous Context Manager
+        as long as the AsyncConnection is initialized with at least an URL.
+        """
+        if not self.url:
+            raise UnitializedException
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        """
+        When exiting the Context Manager log out if logged in and close the client.
+        """
+        if self.isloggedin:
+            await self.logout()
+        await self.close()
+
+
+if __name__ == "__main__":
+    """"""
+    from ib_rest.config import load_config
+    config = load_config()
+
+    async def main():
+        """"""
+        async with AsyncConnection(url=config["url"], certificate_bundle=config["certificate_bundle"]) as ib_conn:
+            await ib_conn.login(config["user"], config["password"])
+            response = await ib_conn.get("grid")
+            print(response.json()[0])
+
+    asyncio.run(main())
@@ -0,0 +1,277 @@
+"""
+batch - send many WAPI operations in a few calls to the multiple object "request" type.
+"""
+
+
+class BatchResponse:
+    """
+    The outcome of one operation sent through the WAPI "request" object.
+
+    It mimics the parts of a requests Response used by callers (status_code,
+    ok, text and json) so that functions such as record_host.create_host can
+    be handed a Batch in place of a Connection.  The status_code is None
+    until the operation has been sent.
+    """
+    def __init__(self, operation:dict):
+        """"""
+        self.operation = operation
+        self.status_code = None
+        self.text = ""
+        self.result = None
+
+    @property
+    def ok(self) -> bool:
+        """
+        Was the operation sent and did it succeed?
+        """
+        return self.status_code is not None and self.status_code < 400
+
+    def json(self):
+        """
+        Return the result of the operation, as the WAPI would for a single call.
+        """
+        return self.result
+
+    def __repr__(self):
+        """"""
+        return "<BatchResponse [{}] {} {}>".format(
+            self.status_code, self.operation.get("method"), self.operation.get("object"))
+
+
+def operation(method:str, wapi_object:str, data=None, args=None, discard=False, assign_state=None, enable_substitution=False) -> dict:
+    """
+    Return one operation in the format of the WAPI "request" object.
+
+    assign_state saves fields of this operation's result (for example
+    {"host_ref": "_ref"}) which later operations in the same request, with
+    enable_substitution set, can reference as ##STATE:host_ref:##.
+    """
+    operation_d = {"method": method.upper(), "object": wapi_object}
+    if data:
+        operation_d.update({"data": data})
+    if args:
+        operation_d.update({"args": args})
+    if discard:
+        operation_d.update({"discard": True})
+    if assign_state:
+        operation_d.update({"assign_state": assign_state})
+    if enable_substitution:
+        operation_d.update({"enable_substitution": True})
+    return operation_d
+
+
+def split_params(params:dict) -> tuple:
+    """
+    Split GET parameters into the search fields (data) and the WAPI arguments,
+    such as _return_fields, which start with an underscore (args).
+    """
+    data = {key: value for key, value in params.items() if not key.startswith("_")}
+    args = {key: value for key, value in params.items() if key.startswith("_")}
+    return data, args
+
+
+def chunk_operations(operations:list, chunk_size:int) -> list:
+    """
+    Split the operations into chunks of at most chunk_size.  An operation with
+    enable_substitution is kept in the same chunk as the operation before it, since
+    the saved state does not survive from one request to the next.
+    """
+    chunks = list()
+    chunk = list()
+    for operation_d in operations:
+        if chunk and len(chunk) >= chunk_size and not operation_d.get("enable_substitution"):
+            chunks.append(chunk)
+            chunk = list()
+        chunk.append(operation_d)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _record_results(responses:list, response):
+    """
+    Hand out the list of results of a successful request, in order, to the
+    responses of the operations which were not discarded.
+    """
+    results = response.json()
+    results_iter = iter(results if isinstance(results, list) else [results])
+    for batch_response in responses:
+        batch_response.status_code = 201 if batch_response.operation["method"] == "POST" else 200
+        if not batch_response.operation.get("discard"):
+            batch_response.result = next(results_iter, None)
+
+
+def _record_failure(responses:list, response):
+    """
+    Mark every operation of a failed request with the error returned for the request.
+    """
+    for batch_response in responses:
+        batch_response.status_code = response.status_code
+        batch_response.text = response.text
+        try:
+            batch_response.result = response.json()
+        except ValueError:
+            batch_response.result = None
+
+
+def send(ib_connection, operations:list, chunk_size=100, on_error="continue") -> list:
+    """
+    Send the operations to the WAPI "request" object in chunks of chunk_size and
+    return a BatchResponse for each operation, in the same order.
+
+    Each chunk is processed by the Grid Master as a single transaction, so when one
+    operation fails the whole chunk is rolled back.  on_error selects what happens next:
+    "continue" - mark the operations of the failed chunk and send the remaining chunks.
+    "stop" - mark the operations of the failed chunk and send nothing more.
+    "split" - resend the operations of the failed chunk one at a time so that only
+    the failing operations are lost.
+    """
+    if on_error not in ("continue", "stop", "split"):
+        raise ValueError("on_error must be one of continue, stop or split.")
+    responses = [BatchResponse(operation_d) for operation_d in operations]
+    _invalidate(ib_connection, operations)
+    try:
+        _send_chunks(ib_connection, operations, responses, chunk_size, on_error)
+    finally:
+        _invalidate(ib_connection, operations)
+    return responses
+
+
+def _invalidate(ib_connection, operations:list):
+    """
+    Invalidate the cached reads, if the Connection has an object cache, of the objects
+    updated or deleted by the operations.
+    """
+    object_cache = getattr(ib_connection, "object_cache", None)
+    if object_cache is not None:
+        for operation_d in operations:
+            if operation_d["method"] in ("PUT", "DELETE"):
+                object_cache.invalidate(operation_d["object"])
+
+
+def _send_chunks(ib_connection, operations:list, responses:list, chunk_size:int, on_error:str):
+    """
+    Send the operations in chunks, recording the results in their responses.
+    """
+    position = 0
+    for chunk in chunk_operations(operations, max(1, chunk_size)):
+        chunk_responses = responses[position:position+len(chunk)]
+        position += len(chunk)
+        response = ib_connection.post("request", chunk)
+        if response.status_code in (200, 201):
+            _record_results(chunk_responses, response)
+            continue
+        if on_error == "split" and len(chunk) > 1:
+            for batch_response in chunk_responses:
+                single = ib_connection.post("request", [batch_response.operation])
+                if single.status_code in (200, 201):
+                    _record_results([batch_response], single)
+                else:
+                    _record_failure([batch_response], single)
+            continue
+        _record_failure(chunk_responses, response)
+        if on_error == "stop":
+            break
+
+
+class Batch:
+    """
+    Accumulate GET, POST, PUT and DELETE operations and send them in chunks through
+    the WAPI "request" object.
+
+    A Batch offers the get, get_by_reference, post, put and delete methods of a
+    Connection, each returning a BatchResponse which is filled in when the batch is
+    flushed.  Used as a Context Manager the batch is flushed on exit:
+
+        with ib_conn.batch(chunk_size=200) as batch:
+            for name, ip_s in hosts:
+                create_host(batch, name, [ip_s,])
+
+    Pending operations are sent automatically once a full chunk has accumulated.
+    """
+    def __init__(self, ib_connection, chunk_size=100, on_error="continue", auto_flush=True):
+        """"""
+        self.ib_connection = ib_connection
+        self.chunk_size = chunk_size
+        self.on_error = on_error
+        self.auto_flush = auto_flush
+        self.pending = list()
+        self.responses = list()
+
+    def add(self, method:str, wapi_object:str, data=None, args=None, discard=False, assign_state=None, enable_substitution=False) -> BatchResponse:
+        """
+        Queue one operation and return its (not yet filled in) BatchResponse.
+        """
+        operation_d = operation(method, wapi_object, data, args, discard, assign_state, enable_substitution)
+        if self.auto_flush and len(self.pending) >= self.chunk_size and not enable_substitution:
+            self.flush()
+        batch_response = BatchResponse(operation_d)
+        self.pending.append(batch_response)
+        self.responses.append(batch_response)
+        return batch_response
+
+    def get(self, wapi_type:str, params={}) -> BatchResponse:
+        """
+        Queue a search for WAPI objects.
+        """
+        data, args = split_params(params)
+        return self.add("GET", wapi_type, data, args)
+
+    def get_by_reference(self, reference:str, params={}) -> BatchResponse:
+        """
+        Queue a read of the referenced WAPI object.
+        """
+        data, args = split_params(params)
+        return self.add("GET", reference, data, args)
+
+    def post(self, wapi_type:str, data:dict, params={}, headers={}) -> BatchResponse:
+        """
+        Queue the creation of a WAPI object.  The headers are not used in a batch.
+        """
+        return self.add("POST", wapi_type, data, params)
+
+    def put(self, reference:str, data:dict) -> BatchResponse:
+        """
+        Queue an update of the referenced WAPI object.
+        """
+        return self.add("PUT", reference, data)
+
+    def delete(self, reference:str) -> BatchResponse:
+        """
+        Queue the deletion of the referenced WAPI object.
+        """
+        return self.add("DELETE", reference)
+
+    def flush(self) -> list:
+        """
+        Send the pending operations and return their BatchResponses.
+        """
+        pending = self.pending
+        self.pending = list()
+        if not pending:
+            return []
+        sent = send(self.ib_connection, [batch_response.operation for batch_response in pending], self.chunk_size, self.on_error)
+        for batch_response, sent_response in zip(pending, sent):
+            batch_response.status_code = sent_response.status_code
+            batch_response.text = sent_response.text
+            batch_response.result = sent_response.result
+        return pending
+
+    @property
+    def failed(self) -> list:
+        """
+        The BatchResponses of operations which were sent and did not succeed.
+        """
+        return [batch_response for batch_response in self.responses
+                if batch_response.status_code is not None and not batch_response.ok]
+
+    def __enter__(self):
+        """"""
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        """
+        Send whatever is still pending unless leaving because of an exception.
+        """
+        if exc_type is None:
+            self.flush()
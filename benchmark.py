@@ -0,0 +1,138 @@
+"""
+benchmark - measure the throughput and latency of ib_rest against a local mock WAPI.
+"""
+import json
+import tempfile
+import time
+from ib_rest import Connection
+from ib_rest.batch import operation
+from ib_rest.grid_backup import download
+from ib_rest.metrics import Instrumentation
+from ib_rest.mock_wapi import MockWapi
+from ib_rest.transport import Http2Transport
+
+
+def bench_get_paged(ib_connection, page_size=1000) -> dict:
+    """
+    Read every record:host with get_paged.
+    """
+    start = time.perf_counter()
+    count = len(ib_connection.get_paged("record:host", page_size=page_size))
+    return {"objects": count, "seconds": time.perf_counter() - start}
+
+
+def bench_stream(ib_connection, page_size=1000, prefetch=2) -> dict:
+    """
+    Read every record:host with stream, prefetching pages.
+    """
+    start = time.perf_counter()
+    count = sum(1 for host in ib_connection.stream("record:host", page_size=page_size, prefetch=prefetch))
+    return {"objects": count, "seconds": time.perf_counter() - start}
+
+
+def bench_batch_writes(ib_connection, count=1000, chunk_size=100) -> dict:
+    """
+    Create count record:host objects through the "request" object.
+    """
+    operations = [
+        operation("POST", "record:host", {
+            "name": "bench{:07d}.example.com".format(index),
+            "ipv4addrs": [{"ipv4addr": "172.16.{}.{}".format(index >> 8 & 255, index & 255)}]
+            })
+        for index in range(count)
+        ]
+    start = time.perf_counter()
+    responses = ib_connection.multi(operations, chunk_size=chunk_size)
+    return {
+        "objects": count,
+        "failed": sum(1 for batch_response in responses if not batch_response.ok),
+        "seconds": time.perf_counter() - start
+        }
+
+
+def bench_backup_download(ib_connection) -> dict:
+    """
+    Download the backup file to a temporary folder.
+    """
+    with tempfile.TemporaryDirectory() as backup_folder_path:
+        start = time.perf_counter()
+        download_d = download(ib_connection, backup_folder_path)
+        seconds = time.perf_counter() - start
+    return {"bytes": download_d.get("bytes", 0), "result": download_d["result"], "seconds": seconds}
+
+
+def run(sizes=(1000, 100000), latency=0.0, writes=1000, backup_size=64*1024*1024, page_size=1000,
+        compress=False, http2=False) -> list:
+    """
+    Run every benchmark against a mock WAPI with each number of hosts in sizes, with
+    compressed JSON responses when compress and through an Http2Transport when http2
+    (over HTTP/1.1, as the mock does not serve TLS or HTTP/2).
+    Return a result per benchmark and size with its throughput, the JSON bytes sent
+    by the mock and the latency of its requests from Instrumentation.
+    """
+    results = list()
+    for size in sizes:
+        with MockWapi(hosts=size, latency=latency, backup_size=backup_size, compress=compress) as mock:
+            instrumentation = Instrumentation()
+            transport = Http2Transport(max_connections=4) if http2 else None
+            ib_connection = Connection(mock.url, "", instrumentation=instrumentation, pool_maxsize=4, transport=transport)
+            ib_connection.login(*mock.credentials)
+            benchmarks = [
+                ("get_paged", lambda: bench_get_paged(ib_connection, page_size)),
+                ("stream", lambda: bench_stream(ib_connection, page_size)),
+                ("batch_writes", lambda: bench_batch_writes(ib_connection, min(writes, size))),
+                ("backup_download", lambda: bench_backup_download(ib_connection))
+                ]
+            for name, benchmark in benchmarks:
+                instrumentation.reset()
+                requests_before = mock.requests
+                bytes_before = mock.bytes_sent
+                result = {"benchmark": name, "size": size, "latency": latency}
+                result.update(benchmark())
+                result.update({"requests": mock.requests - requests_before, "json_bytes": mock.bytes_sent - bytes_before})
+                if result.get("objects"):
+                    result.update({"objects_per_second": result["objects"] / result["seconds"]})
+                if result.get("bytes"):
+                    result.update({"mb_per_second": result["bytes"] / result["seconds"] / 1024 / 1024})
+                summary = instrumentation.summary()
+                if summary:
+                    result.update({"p50_seconds": summary[0]["p50_seconds"], "p95_seconds": summary[0]["p95_seconds"]})
+                results.append(result)
+            ib_connection.logout()
+    return results
+
+
+def report(results:list) -> str:
+    """
+    Format the results as a table.
+    """
+    lines = ["{:<16}{:>10}{:>10}{:>10}{:>14}{:>10}".format("benchmark", "size", "seconds", "requests", "throughput", "p95")]
+    for result in results:
+        if "objects_per_second" in result:
+            throughput = "{:.0f} obj/s".format(result["objects_per_second"])
+        else:
+            throughput = "{:.1f} MB/s".format(result.get("mb_per_second", 0))
+        lines.append("{:<16}{:>10}{:>10.2f}{:>10}{:>14}{:>10}".format(
+            result["benchmark"], result["size"], result["seconds"], result["requests"], throughput, result.get("p95_seconds", "")))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    """"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark ib_rest against a local mock WAPI.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000], help="numbers of record:host objects, e.g. 1000 100000 1000000")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the mock adds to every request")
+    parser.add_argument("--writes", type=int, default=1000, help="record:host objects created by the batch benchmark")
+    parser.add_argument("--backup-mb", type=int, default=64, help="size of the backup file downloaded")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--json", help="also write the results to this file, to compare runs")
+    parser.add_argument("--compress", action="store_true", help="gzip the JSON responses")
+    parser.add_argument("--http2", action="store_true", help="send through an Http2Transport (httpx, HTTP/1.1 to the mock)")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.latency, args.writes, args.backup_mb*1024*1024, args.page_size, args.compress, args.http2)
+    print(report(results))
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
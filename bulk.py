@@ -0,0 +1,221 @@
+"""
+bulk - export and import whole WAPI object types as CSV through file operations (fileop).
+"""
+import csv
+import os
+import time
+from ib_rest.grid_backup import force_download, send_download_complete
+
+
+def csv_export(ib_connection, wapi_object: str, file_path: str) -> dict:
+    """
+    Have the Grid Master export every object of the WAPI type (for example record:host,
+    network or range) to a CSV file in one job, then stream the file to file_path and
+    send the download complete.
+    """
+    headers = {"Content-Type":"application/json"}
+    response = ib_connection.post(
+        "fileop",
+        {"_object": wapi_object},
+        params={"_function":"csv_export"},
+        headers=headers
+        )
+    if response.status_code != 200:
+        return {"result": False, "message": response.text}
+    export_d = response.json()
+    if not isinstance(export_d, dict) or "token" not in export_d or "url" not in export_d:
+        return {"result": False, "message": "No download token was returned: {}".format(response.text)}
+    token = export_d["token"]
+    try:
+        result = force_download(ib_connection, export_d["url"], file_path, resume=False)
+    finally:
+        send_download_complete(ib_connection, token)
+    return result
+
+
+def read_csv(file_path: str):
+    """
+    Generate a dict per object row of an Infoblox CSV file, read one line at a time.
+
+    Each header row (header-<type>,field,...) names the fields of the rows of that
+    type which follow it.  The trailing * marking required fields is removed from the
+    names and the row type is given under _type.
+    """
+    fields = dict()
+    with open(file_path, newline="", encoding="utf-8-sig") as csv_file:
+        for row in csv.reader(csv_file):
+            if not row or not row[0]:
+                continue
+            row_type = row[0].lower()
+            if row_type.startswith("header-"):
+                fields.update({row_type[7:]: [field.rstrip("*") for field in row[1:]]})
+                continue
+            wapi_object = {"_type": row_type}
+            wapi_object.update(zip(fields.get(row_type, []), row[1:]))
+            yield wapi_object
+
+
+def export_objects(ib_connection, wapi_object: str, file_path: str) -> dict:
+    """
+    Export the WAPI type to file_path.  Return the result of the export with, under
+    objects, a generator of its objects as dicts (see read_csv).
+    """
+    result = csv_export(ib_connection, wapi_object, file_path)
+    if result["result"]:
+        result.update({"objects": read_csv(file_path)})
+    return result
+
+
+def write_csv(file_path: str, csv_type: str, fields: list, rows) -> int:
+    """
+    Write rows (dicts) of one CSV import type, such as hostrecord or network, with a
+    header row for the fields.  Required fields should be named with their trailing *
+    as the Grid Master expects; the rows are looked up without it.
+    Return the number of rows written.
+    """
+    count = 0
+    with open(file_path, "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["header-"+csv_type] + list(fields))
+        for row in rows:
+            writer.writerow([csv_type] + [row.get(field.rstrip("*"), "") for field in fields])
+            count += 1
+    return count
+
+
+class MultipartFile:
+    """
+    A file-like multipart/form-data body holding one file, read from disk as it is
+    sent rather than loaded into memory.  Its length is known so the upload has a
+    Content-Length, and it can be rewound (seek) to be sent again.
+    """
+    def __init__(self, file_path: str, boundary: str):
+        """"""
+        file_name = os.path.basename(file_path)
+        self.head = "".join([
+            "--{}\r\n".format(boundary),
+            'Content-Disposition: form-data; name="name"\r\n\r\n{}\r\n'.format(file_name),
+            "--{}\r\n".format(boundary),
+            'Content-Disposition: form-data; name="filedata"; filename="{}"\r\n'.format(file_name),
+            "Content-Type: application/octet-stream\r\n\r\n"
+            ]).encode()
+        self.tail = "\r\n--{}--\r\n".format(boundary).encode()
+        self.length = len(self.head) + os.path.getsize(file_path) + len(self.tail)
+        self.file = open(file_path, "rb")
+        self.parts = [self.head, None, self.tail]
+        self.position = 0
+
+    def __len__(self):
+        """"""
+        return self.length
+
+    def read(self, size=-1) -> bytes:
+        """
+        Return up to size bytes of the body.
+        """
+        data = b""
+        while self.parts and (size < 0 or len(data) < size):
+            part = self.parts[0]
+            wanted = -1 if size < 0 else size - len(data)
+            if part is None:
+                chunk = self.file.read(wanted)
+                if not chunk or wanted < 0:
+                    data += chunk
+                    self.parts.pop(0)
+                    continue
+                data += chunk
+            else:
+                chunk = part if wanted < 0 else part[:wanted]
+                data += chunk
+                if len(chunk) == len(part):
+                    self.parts.pop(0)
+                else:
+                    self.parts[0] = part[len(chunk):]
+        self.position += len(data)
+        return data
+
+    def tell(self) -> int:
+        """"""
+        return self.position
+
+    def seek(self, offset: int, whence=0) -> int:
+        """
+        Move to offset bytes from the start of the body (whence 0 only).
+        """
+        if whence != 0:
+            raise OSError("MultipartFile can only seek from the start.")
+        self.file.seek(0)
+        self.parts = [self.head, None, self.tail]
+        self.position = 0
+        while self.position < offset and self.read(min(offset - self.position, 64*1024)):
+            pass
+        return self.position
+
+    def close(self):
+        """"""
+        self.file.close()
+
+
+def upload(ib_connection, file_path: str) -> dict:
+    """
+    Upload a file to the Grid Master: fileop uploadinit returns a token and URL, then
+    the file is streamed to the URL.  Return the token to use in a later fileop.
+    """
+    headers = {"Content-Type":"application/json"}
+    response = ib_connection.post("fileop", {}, params={"_function":"uploadinit"}, headers=headers)
+    if response.status_code != 200:
+        return {"result": False, "message": response.text}
+    token = response.json()["token"]
+    boundary = "ib_rest-"+os.urandom(12).hex()
+    body = MultipartFile(file_path, boundary)
+    try:
+        response = ib_connection._request(
+            "POST",
+            response.json()["url"],
+            data=body,
+            headers={"Content-Type": "multipart/form-data; boundary="+boundary}
+            )
+    finally:
+        body.close()
+    if response.status_code not in (200, 201, 204):
+        return {"result": False, "message": response.text}
+    return {"result": True, "token": token}
+
+
+def csv_import(ib_connection, file_path: str, operation="INSERT", on_error="CONTINUE", poll_seconds=1.0, max_poll_seconds=30.0, timeout=3600) -> dict:
+    """
+    Upload the CSV file and have the Grid Master import it in one job.
+    operation is INSERT, UPDATE, REPLACE, DELETE or CUSTOM and on_error CONTINUE or STOP.
+
+    The import task (csvimporttask) is then polled, starting every poll_seconds and
+    backing off to every max_poll_seconds, until it has finished or timeout seconds
+    have passed.  Return the result with the last status of the task.
+    """
+    upload_d = upload(ib_connection, file_path)
+    if not upload_d["result"]:
+        return upload_d
+    headers = {"Content-Type":"application/json"}
+    response = ib_connection.post(
+        "fileop",
+        {"token": upload_d["token"], "operation": operation, "on_error": on_error},
+        params={"_function":"csv_import"},
+        headers=headers
+        )
+    if response.status_code != 200:
+        return {"result": False, "message": response.text}
+    task = response.json().get("csv_import_task")
+    if not isinstance(task, dict) or "_ref" not in task:
+        return {"result": False, "message": "No csv_import_task was returned: {}".format(response.text)}
+    deadline = time.monotonic() + timeout
+    while task.get("status") not in ("COMPLETED", "FAILED", "STOPPED"):
+        if time.monotonic() > deadline:
+            return {"result": False, "message": "CSV import did not finish in time.", "task": task}
+        time.sleep(poll_seconds)
+        poll_seconds = min(poll_seconds * 1.5, max_poll_seconds)
+        response = ib_connection.get(
+            task["_ref"],
+            params={"_return_fields": "status,lines_processed,lines_failed,lines_warning,end_time"}
+            )
+        if response.status_code == 200:
+            task.update(response.json())
+    return {"result": task["status"] == "COMPLETED" and not task.get("lines_failed"), "task": task}
@@ -0,0 +1,337 @@
+"""
+chunk_store - deduplicated storage of backup files split into content defined chunks.
+"""
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#
+# Gear rolling hash table: one fixed pseudo random 32 bit value per byte value.
+#
+
+gear_random = random.Random(0x1B5E57)
+GEAR = tuple(gear_random.getrandbits(32) for byte in range(256))
+GEAR_ARRAY = numpy.array(GEAR, dtype=numpy.uint32) if numpy is not None else None
+HASH_BLOCK = 64*1024
+
+
+class ChunkStore:
+    """
+    A ChunkStore keeps files (backups) as content defined chunks, each saved once
+    under root/chunks by its SHA-256, and a manifest per file under root/manifests
+    listing its chunks in order.
+
+    Chunk boundaries are found with a Gear rolling hash over the data, cutting where
+    the top bits of the hash are zero, so that a change in one part of a file only
+    changes the chunks around it and the rest are shared with earlier files.  Chunks
+    are at least min_size and at most max_size bytes, averaging around avg_size
+    (a power of two).  The first min_size bytes of each chunk are not hashed.
+
+    With numpy installed the hash is computed a block at a time with array
+    operations, at over 100 MB/s per core, which keeps up with a backup download
+    over a WAN; without it each byte is hashed in Python, at only a few MB/s, and
+    chunking is then likely to be slower than the download itself.  Both find the
+    same chunks.
+    """
+    def __init__(self, root:str, min_size=256*1024, avg_size=1024*1024, max_size=4*1024*1024):
+        """"""
+        if avg_size & (avg_size - 1):
+            raise ValueError("avg_size must be a power of two.")
+        self.root = root
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        bits = avg_size.bit_length() - 1
+        self.mask = ((1 << bits) - 1) << (32 - bits)
+        self.chunks_path = os.path.join(root, "chunks")
+        self.manifests_path = os.path.join(root, "manifests")
+        os.makedirs(self.chunks_path, exist_ok=True)
+        os.makedirs(self.manifests_path, exist_ok=True)
+
+    def chunk_path(self, chunk_hash:str) -> str:
+        """
+        The file path of a chunk, in a sub folder named by its first two hex digits.
+        """
+        return os.path.join(self.chunks_path, chunk_hash[:2], chunk_hash)
+
+    def manifest_path(self, name:str) -> str:
+        """
+        The file path of the manifest of the named file.
+        """
+        safe_name = "".join(character if character.isalnum() or character in "-_." else "_" for character in name)
+        return os.path.join(self.manifests_path, safe_name+".json")
+
+    def put_chunk(self, chunk:bytes) -> tuple:
+        """
+        Save the chunk unless already stored.  Return its hash and whether it was new.
+        A chunk already stored has its modified time updated, so that gc keeps it
+        within the grace period while the file now referring to it is written.  A new
+        chunk is written to a temporary file of its own and then renamed, so that
+        writers saving the same chunk at once do not mix their writes.
+        """
+        chunk_hash = hashlib.sha256(chunk).hexdigest()
+        file_path = self.chunk_path(chunk_hash)
+        try:
+            os.utime(file_path)
+            return chunk_hash, False
+        except FileNotFoundError:
+            pass
+        folder_path = os.path.dirname(file_path)
+        os.makedirs(folder_path, exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(suffix=".tmp", dir=folder_path)
+        try:
+            with os.fdopen(file_descriptor, "wb") as chunk_file:
+                chunk_file.write(chunk)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return chunk_hash, True
+
+    def writer(self, name:str):
+        """
+        Return a ChunkWriter which stores the data written to it as the named file.
+        """
+        return ChunkWriter(self, name)
+
+    def manifest(self, name:str) -> dict:
+        """
+        Return the manifest of the named file.
+        """
+        with open(self.manifest_path(name)) as manifest_file:
+            return json.load(manifest_file)
+
+    def manifests(self) -> list:
+        """
+        Return every manifest, oldest first.
+        """
+        manifests = list()
+        for file_name in os.listdir(self.manifests_path):
+            if file_name.endswith(".json"):
+                with open(os.path.join(self.manifests_path, file_name)) as manifest_file:
+                    manifests.append(json.load(manifest_file))
+        return sorted(manifests, key=lambda manifest: manifest["created"])
+
+    def restore(self, name:str, file_path:str) -> dict:
+        """
+        Reassemble the named file at file_path, verifying its SHA-256.
+        """
+        manifest = self.manifest(name)
+        sha256 = hashlib.sha256()
+        size = 0
+        temp_path = file_path+".part"
+        with open(temp_path, "wb") as restored_file:
+            for chunk_hash, chunk_length in manifest["chunks"]:
+                with open(self.chunk_path(chunk_hash), "rb") as chunk_file:
+                    chunk = chunk_file.read()
+                restored_file.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+        if sha256.hexdigest() != manifest["sha256"]:
+            os.remove(temp_path)
+            return {"result": False, "message": "SHA-256 of the restored file does not match the manifest."}
+        os.replace(temp_path, file_path)
+        return {"result": True, "path": file_path, "bytes": size, "sha256": manifest["sha256"]}
+
+    def gc(self, keep=0, keep_names=(), grace_seconds=3600) -> dict:
+        """
+        Remove the manifests other than the newest keep (all if keep is 0) and those
+        named in keep_names, then remove the chunks no remaining manifest refers to.
+        Chunks saved within grace_seconds are kept since they may belong to a file
+        still being written.
+        """
+        manifests = self.manifests()
+        kept = manifests[len(manifests)-keep:] if keep else manifests
+        kept_names = {manifest["name"] for manifest in kept}.union(keep_names)
+        removed_manifests = 0
+        for manifest in manifests:
+            if manifest["name"] not in kept_names:
+                os.remove(self.manifest_path(manifest["name"]))
+                removed_manifests += 1
+        referenced = {chunk_hash for manifest in manifests if manifest["name"] in kept_names
+                      for chunk_hash, chunk_length in manifest["chunks"]}
+        removed_chunks = 0
+        freed = 0
+        now = time.time()
+        for folder_path, folder_names, file_names in os.walk(self.chunks_path):
+            for file_name in file_names:
+                file_path = os.path.join(folder_path, file_name)
+                if file_name in referenced or now - os.path.getmtime(file_path) < grace_seconds:
+                    continue
+                freed += os.path.getsize(file_path)
+                os.remove(file_path)
+                removed_chunks += 1
+        return {"manifests_removed": removed_manifests, "chunks_removed": removed_chunks, "bytes_freed": freed}
+
+
+class ChunkWriter:
+    """
+    Split the data written to it into content defined chunks, saving each new chunk
+    in the ChunkStore, and save the manifest when closed.
+    """
+    def __init__(self, chunk_store:ChunkStore, name:str):
+        """"""
+        self.chunk_store = chunk_store
+        self.name = name
+        self.buffer = bytearray()
+        self.position = 0
+        self.rolling_hash = 0
+        self.chunks = list()
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.new_chunks = 0
+        self.new_bytes = 0
+
+    def write(self, data:bytes):
+        """
+        Add data to the file, saving every chunk completed by it.
+        """
+        self.sha256.update(data)
+        self.size += len(data)
+        self.buffer += data
+        while True:
+            boundary = self._boundary()
+            if boundary is None:
+                break
+            self._save(bytes(self.buffer[:boundary]))
+            del self.buffer[:boundary]
+
+    def _boundary(self):
+        """
+        Continue the rolling hash through the buffer and return the length of the chunk
+        if a boundary is found, or None once the buffer is exhausted.
+        """
+        if numpy is not None:
+            return self._boundary_blocks()
+        store = self.chunk_store
+        buffer = self.buffer
+        limit = min(len(buffer), store.max_size)
+        position = max(self.position, store.min_size)
+        rolling_hash = self.rolling_hash
+        mask = store.mask
+        gear = GEAR
+        while position < limit:
+            rolling_hash = ((rolling_hash << 1) + gear[buffer[position]]) & 0xFFFFFFFF
+            position += 1
+            if not rolling_hash & mask:
+                return self._reset(position)
+        if limit == store.max_size:
+            return self._reset(limit)
+        self.position = position
+        self.rolling_hash = rolling_hash
+        return None
+
+    def _boundary_blocks(self):
+        """
+        _boundary with numpy, a block of up to HASH_BLOCK (or avg_size) bytes at a
+        time.  The hash after each byte only depends on the last 32 bytes (each older
+        byte is shifted out), so the hashes of a block are the sums of the gear values
+        of the last 32 bytes shifted by 0 to 31 places, found by doubling the window
+        in five steps, plus the hash before the block shifted out over its first 31
+        bytes.
+        """
+        store = self.chunk_store
+        block = min(HASH_BLOCK, store.avg_size)
+        limit = min(len(self.buffer), store.max_size)
+        position = max(self.position, store.min_size)
+        rolling_hash = self.rolling_hash
+        scratch = numpy.empty(block, dtype=numpy.uint32)
+        view = memoryview(self.buffer)
+        try:
+            while position < limit:
+                end = min(position+block, limit)
+                hashes = GEAR_ARRAY.take(numpy.frombuffer(view[position:end], dtype=numpy.uint8))
+                length = len(hashes)
+                for width in (1, 2, 4, 8, 16):
+                    if width < length:
+                        shifted = scratch[:length-width]
+                        numpy.left_shift(hashes[:-width], width, out=shifted)
+                        numpy.add(hashes[width:], shifted, out=hashes[width:])
+                carried = min(31, length)
+                hashes[:carried] += numpy.uint32(rolling_hash) << numpy.arange(1, carried+1, dtype=numpy.uint32)
+                numpy.bitwise_and(hashes, numpy.uint32(store.mask), out=scratch[:length])
+                boundaries = numpy.flatnonzero(scratch[:length] == 0)
+                if len(boundaries):
+                    return self._reset(position+int(boundaries[0])+1)
+                rolling_hash = int(hashes[-1])
+                position = end
+        finally:
+            view.release()
+        if limit == store.max_size:
+            return self._reset(limit)
+        self.position = position
+        self.rolling_hash = rolling_hash
+        return None
+
+    def _reset(self, boundary:int) -> int:
+        """
+        Start the rolling hash again for the next chunk.
+        """
+        self.position = 0
+        self.rolling_hash = 0
+        return boundary
+
+    def _save(self, chunk:bytes):
+        """
+        Save one chunk and add it to the manifest.
+        """
+        chunk_hash, new = self.chunk_store.put_chunk(chunk)
+        self.chunks.append([chunk_hash, len(chunk)])
+        if new:
+            self.new_chunks += 1
+            self.new_bytes += len(chunk)
+
+    def close(self) -> dict:
+        """
+        Save the last chunk and the manifest.  Return the manifest with the number of
+        chunks and bytes which were new to the store.
+        """
+        if self.buffer:
+            self._save(bytes(self.buffer))
+            self.buffer = bytearray()
+        manifest = {
+            "name": self.name,
+            "created": time.time(),
+            "size": self.size,
+            "sha256": self.sha256.hexdigest(),
+            "chunks": self.chunks
+            }
+        manifest_path = self.chunk_store.manifest_path(self.name)
+        with open(manifest_path+".tmp", "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(manifest_path+".tmp", manifest_path)
+        result = {"new_chunks": self.new_chunks, "new_bytes": self.new_bytes}
+        result.update(manifest)
+        return result
+
+
+if __name__ == "__main__":
+    """"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Restore, list or clean up backups in a chunk store.")
+    parser.add_argument("root", help="folder of the chunk store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the stored backups")
+    restore_parser = commands.add_parser("restore", help="reassemble a stored backup")
+    restore_parser.add_argument("name")
+    restore_parser.add_argument("file_path")
+    gc_parser = commands.add_parser("gc", help="remove old backups and unreferenced chunks")
+    gc_parser.add_argument("--keep", type=int, default=7, help="number of newest backups to keep")
+    args = parser.parse_args()
+
+    chunk_store = ChunkStore(args.root)
+    if args.command == "list":
+        for manifest in chunk_store.manifests():
+            print("{}\t{}\t{}".format(time.ctime(manifest["created"]), manifest["size"], manifest["name"]))
+    elif args.command == "restore":
+        print(chunk_store.restore(args.name, args.file_path))
+    else:
+        print(chunk_store.gc(keep=args.keep))
@@ -0,0 +1,149 @@
+"""
+chunk_store_tst - Unittests for the chunk_store module.
+
+These tests do not need a WAPI; the backups are random bytes in a temporary folder.
+"""
+import os
+import random
+import tempfile
+import time
+from ib_rest import chunk_store as chunk_store_module
+from ib_rest.chunk_store import ChunkStore
+from unittest import TestCase, TestSuite, makeSuite, TextTestRunner
+from unittest.mock import patch
+
+#
+# Test fixtures.
+#
+
+test_random = random.Random(30)
+backup_1 = test_random.randbytes(600*1024)
+backup_2 = backup_1[:300*1024] + b"changed" + backup_1[300*1024:]
+
+
+def write_backup(chunk_store: ChunkStore, name: str, data: bytes) -> dict:
+    """
+    Write the data to the store in uneven pieces, as a download would.
+    """
+    writer = chunk_store.writer(name)
+    position = 0
+    while position < len(data):
+        writer.write(data[position:position+7000])
+        position += 7000
+    return writer.close()
+
+
+def small_store(root: str) -> ChunkStore:
+    """
+    A store with small chunks so that the fixtures span many chunks.
+    """
+    return ChunkStore(root, min_size=4*1024, avg_size=16*1024, max_size=64*1024)
+
+
+class TestChunking(TestCase):
+    """"""
+    def test_chunk_sizes(self):
+        """
+        Every chunk is within the size bounds, except possibly the last which may be shorter.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            manifest = write_backup(small_store(root), "backup_1", backup_1)
+            sizes = [chunk_length for chunk_hash, chunk_length in manifest["chunks"]]
+            self.assertEqual(sum(sizes), len(backup_1))
+            self.assertTrue(all(4*1024 <= size <= 64*1024 for size in sizes[:-1]))
+            self.assertGreater(len(sizes), 10)
+    def test_without_numpy(self):
+        """
+        The chunks are the same whether the hash is computed with numpy or in Python.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            manifest = write_backup(small_store(root), "backup_1", backup_1)
+        with tempfile.TemporaryDirectory() as root, patch.object(chunk_store_module, "numpy", None):
+            python_manifest = write_backup(small_store(root), "backup_1", backup_1)
+        self.assertEqual(python_manifest["chunks"], manifest["chunks"])
+
+
+class TestDeduplication(TestCase):
+    """"""
+    def test_small_change(self):
+        """
+        A second backup with a small insertion only stores the chunks around the change.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            chunk_store = small_store(root)
+            write_backup(chunk_store, "backup_1", backup_1)
+            manifest = write_backup(chunk_store, "backup_2", backup_2)
+            self.assertLess(manifest["new_bytes"], len(backup_2) // 4)
+    def test_restore(self):
+        """
+        Both backups are restored byte for byte.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            chunk_store = small_store(root)
+            write_backup(chunk_store, "backup_1", backup_1)
+            write_backup(chunk_store, "backup_2", backup_2)
+            for name, data in (("backup_1", backup_1), ("backup_2", backup_2)):
+                file_path = os.path.join(root, name+".bak")
+                self.assertTrue(chunk_store.restore(name, file_path)["result"])
+                with open(file_path, "rb") as restored_file:
+                    self.assertEqual(restored_file.read(), data)
+
+
+class TestGarbageCollection(TestCase):
+    """"""
+    def test_keep_newest(self):
+        """
+        Removing the older backup removes only the chunks it alone referred to.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            chunk_store = small_store(root)
+            write_backup(chunk_store, "backup_1", backup_1)
+            write_backup(chunk_store, "backup_2", backup_2)
+            result = chunk_store.gc(keep=1, grace_seconds=0)
+            self.assertEqual(result["manifests_removed"], 1)
+            self.assertGreater(result["chunks_removed"], 0)
+            self.assertEqual([manifest["name"] for manifest in chunk_store.manifests()], ["backup_2"])
+            self.assertTrue(chunk_store.restore("backup_2", os.path.join(root, "backup_2.bak"))["result"])
+    def test_referenced_again(self):
+        """
+        Old chunks which a backup being written refers to again are kept, though no
+        manifest refers to them yet.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            chunk_store = small_store(root)
+            write_backup(chunk_store, "backup_1", backup_1)
+            os.remove(chunk_store.manifest_path("backup_1"))
+            old = time.time() - 7200
+            for folder_path, folder_names, file_names in os.walk(chunk_store.chunks_path):
+                for file_name in file_names:
+                    os.utime(os.path.join(folder_path, file_name), (old, old))
+            writer = chunk_store.writer("backup_2")
+            writer.write(backup_1)
+            chunk_store.gc()
+            self.assertGreater(len(writer.chunks), 10)
+            self.assertTrue(all(os.path.exists(chunk_store.chunk_path(chunk_hash)) for chunk_hash, chunk_length in writer.chunks))
+            writer.close()
+            self.assertTrue(chunk_store.restore("backup_2", os.path.join(root, "backup_2.bak"))["result"])
+
+#
+# Run the test cases as a suite.
+#
+
+def suite():
+    """
+    Gather all the tests from this module in a test suite.
+    """
+    test_suite = TestSuite()
+    test_suite.addTest(makeSuite(TestChunking))
+    test_suite.addTest(makeSuite(TestDeduplication))
+    test_suite.addTest(makeSuite(TestGarbageCollection))
+    return test_suite
+
+mySuite=suite()
+
+runner=TextTestRunner()
+
+
+if __name__ == "__main__":
+    """"""
+    runner.run(mySuite)
@@ -0,0 +1,305 @@
+"""
+columnar - collect large query results as compact columns instead of a dict per object.
+"""
+import json
+import socket
+import struct
+import sys
+from array import array
+
+#
+# Column kinds: the array typecode holding each, None for a list.
+#
+
+KINDS = {"ip": "I", "int": "q", "float": "d", "bool": "b", "str": None, "object": None}
+IP_FIELDS = ("ip_address", "ipv4addr", "address", "network_address")
+
+
+def ip_to_int(address:str) -> int:
+    """
+    The IPv4 address as an integer; raise ValueError if it is not a dotted quad
+    IPv4 address (an IPv6 address or an empty string).
+    """
+    try:
+        packed = socket.inet_pton(socket.AF_INET, address)
+    except (OSError, TypeError):
+        raise ValueError("{!r} is not an IPv4 address.".format(address))
+    return struct.unpack("!I", packed)[0]
+
+
+def value_kind(value) -> str:
+    """
+    The kind of column a value fits in: ip for an IPv4 address, None for None.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        try:
+            ip_to_int(value)
+        except ValueError:
+            return "str"
+        return "ip"
+    return "object"
+
+
+def int_to_ip(value:int) -> str:
+    """"""
+    return socket.inet_ntoa(struct.pack("!I", value))
+
+
+class Column:
+    """
+    The values of one field: IPv4 addresses packed as 32 bit integers, numbers and
+    booleans in typed arrays, strings in a list with each distinct string stored once
+    (interned) and anything else (lists, dicts) as is.  The positions of missing
+    values of an array kind are kept in nulls.  A value which does not fit the kind
+    of the column, such as an IPv6 address in an ip column, turns it into an object
+    column, which keeps every value as is.
+    """
+    def __init__(self, name:str, kind:str):
+        """"""
+        if kind not in KINDS:
+            raise ValueError("Unknown column kind {}, use one of {}.".format(kind, ", ".join(KINDS)))
+        self.name = name
+        self.kind = kind
+        self.values = array(KINDS[kind]) if KINDS[kind] else list()
+        self.nulls = set()
+
+    def __len__(self):
+        """"""
+        return len(self.values)
+
+    def append(self, value):
+        """"""
+        if self.kind == "object":
+            self.values.append(value)
+        elif value is None:
+            if self.kind != "str":
+                self.nulls.add(len(self.values))
+            self.values.append(None if self.kind == "str" else 0)
+        elif self.kind == "str":
+            if isinstance(value, str):
+                self.values.append(sys.intern(value))
+            else:
+                self.widen()
+                self.values.append(value)
+        elif self.kind == "ip":
+            try:
+                self.values.append(ip_to_int(value))
+            except ValueError:
+                self.widen()
+                self.values.append(value)
+        elif value_kind(value) == self.kind or (self.kind == "float" and value_kind(value) == "int"):
+            self.values.append(value)
+        else:
+            self.widen()
+            self.values.append(value)
+
+    def widen(self):
+        """
+        Turn the column into an object column holding its values as returned by the WAPI.
+        """
+        self.values = self.to_list()
+        self.kind = "object"
+        self.nulls = set()
+
+    def __getitem__(self, index:int):
+        """
+        The value at index as returned by the WAPI, with IPv4 addresses as strings.
+        """
+        if index < 0:
+            index += len(self.values)
+        if index in self.nulls:
+            return None
+        if self.kind == "ip":
+            return int_to_ip(self.values[index])
+        if self.kind == "bool":
+            return bool(self.values[index])
+        return self.values[index]
+
+    def to_list(self) -> list:
+        """"""
+        return [self[index] for index in range(len(self.values))]
+
+    def clear(self):
+        """"""
+        del self.values[:]
+        self.nulls = set()
+
+    def to_arrow(self):
+        """
+        Return the column as a pyarrow Array, IPv4 addresses as uint32.  The values of
+        an object column are strings, lists and dicts written as JSON.
+        """
+        import pyarrow
+        arrow_types = {"ip": pyarrow.uint32(), "int": pyarrow.int64(), "float": pyarrow.float64(), "bool": pyarrow.bool_()}
+        if self.kind in arrow_types:
+            mask = [index in self.nulls for index in range(len(self.values))] if self.nulls else None
+            return pyarrow.array(self.values, type=arrow_types[self.kind], mask=mask)
+        if self.kind == "str":
+            return pyarrow.array(self.values, type=pyarrow.string())
+        return pyarrow.array([None if value is None else json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+                              for value in self.values], type=pyarrow.string())
+
+
+class Columnar:
+    """
+    A Columnar collects the fields of WAPI objects, page by page, as a Column per
+    field (and _ref, unless ref is False).  The kind of each column is taken from
+    types, a dict of field name to kind (ip, int, float, bool, str or object), or
+    else from the values of the first page: ip for fields in IP_FIELDS holding only
+    IPv4 addresses, the kind all the other values share (float for ints and floats)
+    and object for mixed or only missing values.  A later value which does not fit
+    turns the column into an object column (see Column).
+
+    With spill_path the rows are written, every spill_rows rows, to a Parquet file
+    (spill_format "parquet") or an Arrow IPC file ("arrow") and dropped from memory,
+    so that results larger than memory can be collected.  Spilling requires pyarrow.
+    Call close once all pages have been added to write the last rows.
+    """
+    def __init__(self, fields, types=None, ref=True, spill_path="", spill_format="parquet", spill_rows=100000):
+        """"""
+        if spill_format not in ("parquet", "arrow"):
+            raise ValueError("spill_format must be parquet or arrow.")
+        self.fields = [name.strip() for name in fields.split(",") if name.strip()] if isinstance(fields, str) else list(fields)
+        self.types = dict(types) if types else dict()
+        self.names = (["_ref"] if ref else []) + self.fields
+        self.columns = dict()
+        self.spill_path = spill_path
+        self.spill_format = spill_format
+        self.spill_rows = spill_rows
+        self.spilled = 0
+        self.writer = None
+        self.schema = None
+
+    def kind(self, name:str, values:list) -> str:
+        """
+        The kind of the column for a field, given its values on the first page.
+        """
+        if name in self.types:
+            return self.types[name]
+        kinds = {value_kind(value) for value in values}
+        kinds.discard(None)
+        if kinds == {"ip"}:
+            return "ip" if name in IP_FIELDS else "str"
+        if kinds == {"ip", "str"}:
+            return "str"
+        if kinds == {"int", "float"}:
+            return "float"
+        if len(kinds) == 1:
+            return kinds.pop()
+        return "object"
+
+    def append_page(self, wapi_objects:list):
+        """
+        Add the objects of a page to the columns.
+        """
+        if not wapi_objects:
+            return
+        if not self.columns:
+            self.columns = {name: Column(name, self.kind(name, [wapi_object.get(name) for wapi_object in wapi_objects]))
+                            for name in self.names}
+        for name, column in self.columns.items():
+            append = column.append
+            for wapi_object in wapi_objects:
+                append(wapi_object.get(name))
+        if self.spill_path and len(self) >= self.spill_rows:
+            self.spill()
+
+    def __len__(self):
+        """
+        The number of rows held in memory.
+        """
+        return len(self.columns[self.names[0]]) if self.columns else 0
+
+    @property
+    def total(self) -> int:
+        """
+        The number of rows collected, including those spilled to the file.
+        """
+        return self.spilled + len(self)
+
+    def column(self, name:str) -> list:
+        """
+        The values of a field in memory, as returned by the WAPI.
+        """
+        return self.columns[name].to_list() if self.columns else []
+
+    def rows(self):
+        """
+        Generate the rows in memory as dicts.
+        """
+        columns = [self.columns[name] for name in self.names] if self.columns else []
+        for index in range(len(self)):
+            yield {column.name: column[index] for column in columns}
+
+    def to_arrow(self):
+        """
+        Return the rows in memory as a pyarrow Table.
+        """
+        import pyarrow
+        if not self.columns:
+            return pyarrow.table({name: pyarrow.array([], type=pyarrow.string()) for name in self.names})
+        return pyarrow.table({name: self.columns[name].to_arrow() for name in self.names})
+
+    def to_pandas(self, ip_strings=False):
+        """
+        Return the rows in memory as a pandas DataFrame, with IPv4 addresses as
+        integers (uint32) or, with ip_strings, as strings.
+        """
+        import pandas
+        data = dict()
+        for name in self.names:
+            column = self.columns.get(name)
+            if column is None:
+                data[name] = []
+            elif column.kind == "ip" and not ip_strings:
+                data[name] = pandas.array(column.values, dtype="UInt32")
+                if column.nulls:
+                    data[name][list(column.nulls)] = pandas.NA
+            elif column.kind in ("int", "float", "bool") and not column.nulls:
+                data[name] = column.values
+            else:
+                data[name] = column.to_list()
+        return pandas.DataFrame(data, columns=self.names)
+
+    def spill(self):
+        """
+        Write the rows in memory to the spill file and drop them.  Raise ValueError
+        if a column has been turned into an object column since the first spill, as
+        the file cannot change its schema; pass its kind in types.
+        """
+        if not len(self):
+            return
+        table = self.to_arrow()
+        if self.writer is not None and not table.schema.equals(self.schema):
+            raise ValueError("The kinds of the columns changed after the first spill: {}".format(table.schema))
+        if self.writer is None:
+            self.schema = table.schema
+            if self.spill_format == "parquet":
+                import pyarrow.parquet
+                self.writer = pyarrow.parquet.ParquetWriter(self.spill_path, table.schema)
+            else:
+                import pyarrow.ipc
+                self.writer = pyarrow.ipc.new_file(self.spill_path, table.schema)
+        self.writer.write_table(table)
+        self.spilled += len(self)
+        for column in self.columns.values():
+            column.clear()
+
+    def close(self):
+        """
+        Write any rows still in memory and close the spill file, if spilling.
+        """
+        if not self.spill_path:
+            return
+        self.spill()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,87 @@
+"""
+config - the Grid Master and credentials for the command line, from a file or the environment.
+"""
+import configparser
+import os
+import stat
+
+#
+# The settings of a grid and the environment variables overriding them.
+#
+
+ENVIRONMENT = {
+    "url": "IB_REST_URL",
+    "certificate_bundle": "IB_REST_CERTIFICATE_BUNDLE",
+    "user": "IB_REST_USER",
+    "password": "IB_REST_PASSWORD",
+    "password_file": "IB_REST_PASSWORD_FILE",
+    "timeout": "IB_REST_TIMEOUT",
+    "reuse_session": "IB_REST_REUSE_SESSION"
+    }
+DEFAULTS = {"certificate_bundle": "", "password": "", "password_file": "", "timeout": "", "reuse_session": "yes"}
+
+
+class ConfigException(Exception):
+    """"""
+    def __init__(self, message:str):
+        """"""
+        self.message = message
+        super().__init__(self.message)
+
+
+def default_config_path() -> str:
+    """
+    The config file: IB_REST_CONFIG, else config.ini in IB_REST_CACHE or ~/.ib_rest.
+    """
+    if os.environ.get("IB_REST_CONFIG"):
+        return os.environ["IB_REST_CONFIG"]
+    return os.path.join(os.environ.get("IB_REST_CACHE", os.path.join(os.path.expanduser("~"), ".ib_rest")), "config.ini")
+
+
+def _read_secret(file_path:str) -> str:
+    """
+    Read a password from a file which only its owner can read.
+    """
+    try:
+        if os.stat(file_path).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            raise ConfigException("{} is readable by others; chmod 600 it.".format(file_path))
+        with open(file_path) as secret_file:
+            return secret_file.read().strip()
+    except OSError as e:
+        raise ConfigException("Cannot read {}: {}".format(file_path, e))
+
+
+def load_config(grid="default", config_path="") -> dict:
+    """
+    Return the settings of a grid: url, certificate_bundle, user, password, timeout
+    (seconds or None) and reuse_session (bool), from the [grid] section of the INI
+    config file, if it exists, overridden by the IB_REST_* environment variables.
+    The password may be given as password_file, the path of a file holding it.
+    A config file holding a password must be readable by its owner only.
+    """
+    config_path = config_path or default_config_path()
+    settings = dict(DEFAULTS)
+    parser = configparser.ConfigParser(interpolation=None)
+    if parser.read(config_path):
+        if grid not in parser:
+            raise ConfigException("{} has no [{}] section.".format(config_path, grid))
+        settings.update(parser[grid])
+        if parser[grid].get("password") and os.stat(config_path).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+            raise ConfigException("{} holds a password and is readable by others; chmod 600 it.".format(config_path))
+    elif grid != "default":
+        raise ConfigException("The config file {} for grid {} was not found.".format(config_path, grid))
+    settings.update({name: os.environ[variable] for name, variable in ENVIRONMENT.items() if variable in os.environ})
+    for name in ("url", "user"):
+        if not settings.get(name):
+            raise ConfigException("No {} is configured: set {} or add it to {}.".format(name, ENVIRONMENT[name], config_path))
+    if not settings["password"] and settings["password_file"]:
+        settings["password"] = _read_secret(settings["password_file"])
+    try:
+        timeout = float(settings["timeout"]) if settings["timeout"] else None
+    except ValueError:
+        raise ConfigException("The timeout {!r} is not a number of seconds.".format(settings["timeout"]))
+    settings.update({
+        "timeout": timeout,
+        "reuse_session": settings["reuse_session"].strip().lower() in ("1", "yes", "true", "on")
+        })
+    return settings
@@ -0,0 +1,61 @@
+"""
+decoder - decode WAPI pages with the fastest JSON library installed.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def default_loads():
+    """
+    Return the fastest available function decoding JSON bytes: orjson, msgspec or
+    the standard library json, in that order.
+    """
+    if orjson is not None:
+        return orjson.loads
+    if msgspec is not None:
+        return msgspec.json.Decoder().decode
+    return json.loads
+
+
+loads = default_loads()
+
+
+class PageDecoder:
+    """
+    Decode the body of a page (a paged query with _return_as_object) in one pass and
+    return its result list and next_page_id, if any, as a dict.
+
+    With a record type (see the records module) each object is returned as a record.
+    If msgspec is installed, and no loads function is given, the page is decoded
+    into msgspec Structs with the same fields, which skips building a dict per
+    object, and each Struct is converted to a record; otherwise the objects are
+    decoded with loads and then converted.  Either way the records are of the
+    record type.
+    """
+    def __init__(self, record_type=None, loads=None):
+        """"""
+        self.record_type = record_type
+        self.loads = loads if loads is not None else globals()["loads"]
+        self.struct_decoder = None
+        if record_type is not None and msgspec is not None and loads is None:
+            self.struct_decoder = msgspec.json.Decoder(record_type.page_struct())
+
+    def __call__(self, content:bytes) -> dict:
+        """"""
+        if self.struct_decoder is not None:
+            page = self.struct_decoder.decode(content)
+            from_struct = self.record_type.from_struct
+            return {"result": [from_struct(record_struct) for record_struct in page.result], "next_page_id": page.next_page_id}
+        page = self.loads(content)
+        if self.record_type is not None:
+            from_dict = self.record_type.from_dict
+            page["result"] = [from_dict(wapi_object) for wapi_object in page["result"]]
+        return page
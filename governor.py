@@ -0,0 +1,72 @@
+"""
+governor - retry with backoff and rate limiting of the requests a Connection sends.
+"""
+import random
+import threading
+import time
+
+
+class RetryPolicy:
+    """
+    Decide whether a failed request is sent again and how long to wait first.
+
+    Requests with an idempotent method (methods) are retried, up to retries times,
+    after a connection error or timeout or a response with a status in statuses
+    (throttled or a server error).  The wait grows exponentially from backoff seconds
+    up to max_backoff, with full jitter so that many clients do not retry in step,
+    unless the Grid Master gives a Retry-After header.
+    """
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30.0, statuses=(429, 500, 502, 503, 504),
+                 methods=("GET", "HEAD", "OPTIONS", "PUT", "DELETE")):
+        """"""
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.methods = methods
+
+    def should_retry(self, method:str, attempt:int, response=None) -> bool:
+        """
+        Retry the attempt (counting from 0) which failed with this response, or with a
+        connection error when there is no response?
+        """
+        if attempt >= self.retries or method.upper() not in self.methods:
+            return False
+        return response is None or response.status_code in self.statuses
+
+    def delay(self, attempt:int, response=None) -> float:
+        """
+        The seconds to wait before the next attempt.
+        """
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class RateLimiter:
+    """
+    A token bucket, shared by every thread using it, which allows rate requests per
+    second on average with bursts of up to burst requests.
+    """
+    def __init__(self, rate:float, burst=1):
+        """"""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait until a request may be sent.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
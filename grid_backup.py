@@ -2,9 +2,12 @@
 grid_backup - program to download the most recent backup file from the Infoblox WAPI. 
 """
 from ib_rest import Connection
-from requests import get, post
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
-from ib_rest.ltlddslta01_info import url, certificate_bundle
+import re
+import threading
+import time
 """
 grid = "https://ltlddslta01.loutms.tree/"
 wapi_version = "wapi/v2.12"
@@ -33,29 +36,216 @@ def fetch_backup_token(ib_connection) -> dict:
     return result
 
 
-def force_download(file_url, local_file_path):
+class BandwidthLimiter:
+    """
+    Share a maximum download rate, in bytes per second, between threads.  Each
+    thread calls the limiter with the size of every chunk it has received and is
+    made to wait until the chunk fits within the rate, after a first second of burst.
+    """
+    def __init__(self, bytes_per_second:int):
+        """"""
+        self.bytes_per_second = bytes_per_second
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def __call__(self, size:int):
+        """"""
+        with self.lock:
+            now = time.monotonic()
+            self.next_time = max(self.next_time, now) + size / self.bytes_per_second
+            delay = self.next_time - now - 1.0
+        if delay > 0:
+            time.sleep(delay)
+
+
+def force_download(ib_connection, file_url, local_file_path, chunk_size=1024*1024, resume=True, retries=3, throttle=None) -> dict:
     """
     Get the content of the request ignoring the MIME type.
-    Perform a binary copy into the specified filepath.
+    Stream it, chunk_size bytes at a time, through the authenticated session of the
+    Connection into a partial (.part) file, computing the SHA-256 on the way, then
+    rename it to the specified filepath once complete.
+
+    If the connection drops the download is resumed, up to retries times, from the end
+    of the partial file with an HTTP Range request.  With resume set a partial file
+    left by an earlier attempt is resumed in the same way.
+    throttle, if given, is called with the size of each chunk (see BandwidthLimiter).
+    The result gives the number of attempts made.
     """
-    import urllib3
-    import warnings
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    part_path = local_file_path+".part"
+    if not resume and os.path.exists(part_path):
+        os.remove(part_path)
+    result = {"result": False}
+    for attempt in range(retries+1):
+        result = _download_part(ib_connection, file_url, part_path, chunk_size, throttle)
+        result.update({"attempts": attempt+1})
+        if result["result"] or not result.get("retry"):
+            break
+    result.pop("retry", None)
+    if result["result"]:
+        try:
+            os.replace(part_path, local_file_path)
+            result.update({"path": local_file_path})
+        except OSError as e:
+            result.update({"result": False, "message": str(e)})
+    return result
+
+
+def _download_part(ib_connection, file_url, part_path, chunk_size, throttle=None) -> dict:
+    """
+    Download the file, or the rest of it after the bytes already in the partial
+    file, appending to the partial file.  The response is checked by _resume_action,
+    and the download restarts from the beginning when it does not match the partial
+    file.
+    """
+    import requests
     headers = {"Content-type":"application/force-download"}
-    response = get(
-        file_url,
-        headers=headers,
-        verify=False,
-        auth=("ddiapi_superuser",os.environ["TECHLAB_PASSWORD"])
-        )
+    sha256 = hashlib.sha256()
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset:
+        headers.update({"Range": "bytes={}-".format(offset)})
+    try:
+        response = ib_connection._request("GET", file_url, headers=headers, stream=True)
+    except requests.exceptions.RequestException as e:
+        return {"result": False, "retry": True, "message": str(e)}
+    with response:
+        action = _resume_action(response, offset)
+        if action == "complete":
+            return _hash_file(part_path, sha256, chunk_size)
+        if action == "restart":
+            return _restart(ib_connection, file_url, part_path, chunk_size, throttle)
+        if action == "failed":
+            return {"result": False, "message": response.text}
+        if action == "append":
+            _hash_file(part_path, sha256, chunk_size)
+        else:
+            offset = 0
+        try:
+            with open(part_path, "ab" if offset else "wb") as bakfile:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    bakfile.write(chunk)
+                    sha256.update(chunk)
+                    offset += len(chunk)
+                    if throttle is not None:
+                        throttle(len(chunk))
+        except requests.exceptions.RequestException as e:
+            return {"result": False, "retry": True, "message": str(e), "bytes": offset}
+        except OSError as e:
+            return {"result": False, "message": str(e), "bytes": offset}
+    return {"result": True, "bytes": offset, "sha256": sha256.hexdigest()}
+
+
+def _resume_action(response, offset: int) -> str:
+    """
+    What to do with the response to a download of the bytes after offset (a Range
+    request unless offset is 0): "complete" for a 416 giving offset as the size of the
+    file, "append" for a 206 starting at offset, "whole" for a 200 with the whole
+    file, "restart" for a 416 or 206 which does not match the offset (the file
+    served is not the one partly received) and "failed" for any other status.
+    """
+    content_range = _content_range(response.headers.get("Content-Range", ""))
+    if response.status_code == 416 and offset:
+        return "complete" if content_range[2] == offset else "restart"
+    if response.status_code == 206:
+        return "append" if content_range[0] == offset else "restart"
+    if response.status_code == 200:
+        return "whole"
+    return "failed"
+
+
+def _content_range(content_range: str) -> tuple:
+    """
+    Return the start, end and size of a Content-Range header value ("bytes 0-99/1000"
+    or "bytes */1000"), each None if not given.
+    """
+    match = re.fullmatch(r"bytes\s+(?:(\d+)-(\d+)|\*)/(\d+|\*)", content_range.strip())
+    if not match:
+        return None, None, None
+    return tuple(int(value) if value and value != "*" else None for value in match.groups())
+
+
+def _restart(ib_connection, file_url, part_path, chunk_size, throttle=None) -> dict:
+    """
+    Remove the partial file, which does not match the file served, and download the
+    whole file.
+    """
     try:
-        with open(local_file_path, "wb") as bakfile:
-            bakfile.write(response.content)
-        #print("Download is done.")
-    except PermissionError as e:
-        """print(e)"""
-    warnings.resetwarnings()
-    return response
+        os.remove(part_path)
+    except OSError as e:
+        return {"result": False, "message": str(e)}
+    return _download_part(ib_connection, file_url, part_path, chunk_size, throttle)
+
+
+def _hash_file(file_path, sha256, chunk_size) -> dict:
+    """
+    Add the content of the (partial) file to the SHA-256.
+    """
+    size = 0
+    with open(file_path, "rb") as bakfile:
+        for chunk in iter(lambda: bakfile.read(chunk_size), b""):
+            sha256.update(chunk)
+            size += len(chunk)
+    return {"result": True, "bytes": size, "sha256": sha256.hexdigest()}
+
+
+def store_download(ib_connection, file_url, chunk_store, name, chunk_size=1024*1024, retries=3, throttle=None) -> dict:
+    """
+    Stream the file into a chunk_store.ChunkStore as the named backup, so that only
+    the chunks which are not already stored are written to disk.
+    If the connection drops the download is resumed, up to retries times, with an
+    HTTP Range request from the bytes already stored, and restarted from the beginning
+    when the response does not match them (see _resume_action).  The result gives the
+    number of attempts made.
+    """
+    writer = chunk_store.writer(name)
+    result = {"result": False}
+    for attempt in range(retries+1):
+        result = _store_part(ib_connection, file_url, writer, chunk_size, throttle)
+        if result.pop("restart", False):
+            writer = chunk_store.writer(name)
+            result = _store_part(ib_connection, file_url, writer, chunk_size, throttle)
+            result.pop("restart", None)
+        result.update({"attempts": attempt+1})
+        if result["result"] or not result.get("retry"):
+            break
+    result.pop("retry", None)
+    if result["result"]:
+        manifest = writer.close()
+        result.update({
+            "bytes": manifest["size"],
+            "sha256": manifest["sha256"],
+            "manifest": manifest["name"],
+            "new_bytes": manifest["new_bytes"]
+            })
+    return result
+
+
+def _store_part(ib_connection, file_url, writer, chunk_size, throttle=None) -> dict:
+    """
+    Write the file, or the rest of it after the bytes already written, to the
+    chunk_store.ChunkWriter.  Return restart when the response does not follow on
+    from the bytes written (a 200 with the whole file included), which must then be
+    written to a new writer.
+    """
+    import requests
+    headers = {"Content-type":"application/force-download"}
+    if writer.size:
+        headers.update({"Range": "bytes={}-".format(writer.size)})
+    try:
+        with ib_connection._request("GET", file_url, headers=headers, stream=True) as response:
+            action = _resume_action(response, writer.size)
+            if action == "complete":
+                return {"result": True}
+            if action == "failed":
+                return {"result": False, "message": response.text}
+            if action == "restart" or (action == "whole" and writer.size):
+                return {"result": False, "restart": True, "message": "The file served does not follow on from the bytes stored."}
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                writer.write(chunk)
+                if throttle is not None:
+                    throttle(len(chunk))
+    except requests.exceptions.RequestException as e:
+        return {"result": False, "retry": True, "message": str(e)}
+    return {"result": True}
 
 
 def send_download_complete(ib_connection, token) -> dict:
@@ -86,7 +276,7 @@ def parse_file_url(file_url: str) -> tuple:
     return url_l[4][16:], url_l[5]
 
     
-def download(ib_connection, backup_folder_path) -> dict:
+def download(ib_connection, backup_folder_path, throttle=None, chunk_store=None, retries=3) -> dict:
     """
     Perform the steps:
     1) fetch backup token.
@@ -94,44 +284,97 @@ def download(ib_connection, backup_folder_path) -> dict:
     3) send download complete.
 
     in order to download a copy of the backup file stored, locally, on
-    the Infoblox Grid Master.
+    the Infoblox Grid Master.  The download complete is sent even if the
+    download fails.  The seconds taken by each step are returned as timings.
+    With a chunk_store.ChunkStore the backup is stored in it, deduplicated, named
+    after the folder and file name, instead of in backup_folder_path.
+    A dropped download is resumed up to retries times.
     """
     token = ""
     file_url = ""
+    timings = dict()
+    start_time = time.perf_counter()
     token_d = fetch_backup_token(ib_connection)
+    timings.update({"token": time.perf_counter() - start_time})
     if token_d["result"]:
         token = token_d["data"]["token"]
-        print(token)
         file_url = token_d["data"]["url"]
-        print(file_url)
     if token:
-        file_url_parts = parse_file_url(file_url)
-        directory = os.path.join(backup_folder_path, file_url_parts[0])
-        os.makedirs(directory, exist_ok=True)
-        bakfile_p = os.path.join(directory, file_url_parts[1])
-        response = force_download(file_url, bakfile_p)
-        return send_download_complete(ib_conn, token)
-    return {"result": False, "message": "Download not completed."}
-    
-if __name__ == "__main__":
-    """"""
-    #from ltlddslta01_info import url, certificate_bundle
-    from dhcpadmin_info import url, certificate_bundle
-    import time
+        download_d = {"result": False, "message": "Download not completed."}
+        try:
+            file_url_parts = parse_file_url(file_url)
+            start_time = time.perf_counter()
+            if chunk_store is not None:
+                download_d = store_download(ib_connection, file_url, chunk_store, "_".join(file_url_parts), retries=retries,
+                                            throttle=throttle)
+            else:
+                directory = os.path.join(backup_folder_path, file_url_parts[0])
+                os.makedirs(directory, exist_ok=True)
+                bakfile_p = os.path.join(directory, file_url_parts[1])
+                download_d = force_download(ib_connection, file_url, bakfile_p, retries=retries, throttle=throttle)
+            timings.update({"download": time.perf_counter() - start_time})
+        finally:
+            start_time = time.perf_counter()
+            complete_d = send_download_complete(ib_connection, token)
+            timings.update({"complete": time.perf_counter() - start_time})
+        if download_d["result"] and not complete_d["result"]:
+            download_d.update({"result": False, "message": complete_d.get("message", "")})
+        download_d.update({"timings": timings})
+        return download_d
+    return {"result": False, "message": token_d.get("message", "Download not completed."), "timings": timings}
 
-    start_time = time.time()
-    
-    ib_conn = Connection(url=url, certificate_bundle=certificate_bundle)
-    #ib_conn.login(os.environ["TECHLAB_ACCOUNT"],os.environ["TECHLAB_PASSWORD"])
-    ib_conn.login("ddiapi_superuser","<M1>")
-
-    folder_p = "c:\\infoblox\\backup\\"
-    #
-    result = download(ib_conn, folder_p)
-    print(result)
-    #
-    ib_conn.logout()
-    if not ib_conn.isloggedin:
-        print("logged out.")
-
-    print("{:.2f} seconds.".format(time.time() - start_time))
+
+def backup_grid(grid: dict, throttle=None, retries=2) -> dict:
+    """
+    Log in to one grid, download its backup, resuming it up to retries times, and log out.
+    grid is a dict with url, certificate_bundle, user, password, backup_folder_path and,
+    optionally, a name for the report.
+    Return the report for the grid: result, message, bytes, sha256, path, attempts,
+    seconds and the timings of each step of the last attempt.
+    """
+    report = {"name": grid.get("name", grid["url"]), "result": False, "message": "", "bytes": 0, "attempts": 0}
+    start_time = time.perf_counter()
+    ib_connection = Connection(url=grid["url"], certificate_bundle=grid.get("certificate_bundle", ""))
+    try:
+        ib_connection.login(grid["user"], grid["password"])
+        if not ib_connection.isloggedin:
+            report.update({"message": "Login failed."})
+            return report
+        result = download(ib_connection, grid["backup_folder_path"], throttle=throttle, retries=retries)
+        report.update(result)
+        report.update({"attempts": result.get("attempts", 1)})
+    except Exception as e:
+        report.update({"result": False, "message": str(e)})
+    finally:
+        if ib_connection.isloggedin:
+            ib_connection.logout()
+        report.update({"seconds": time.perf_counter() - start_time})
+    return report
+
+
+def backup_all(grids: list, workers=4, bytes_per_second=0, retries=2) -> dict:
+    """
+    Download the backup of every grid, up to workers grids at once, each with its own
+    Connection.  bytes_per_second, if set, limits the total rate of all the downloads.
+    Return the run report: result (True if every grid succeeded), seconds, bytes and
+    the report of each grid, in the order given, from backup_grid.
+    """
+    throttle = BandwidthLimiter(bytes_per_second) if bytes_per_second else None
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grid_backup") as pool:
+        reports = list(pool.map(lambda grid: backup_grid(grid, throttle, retries), grids))
+    return {
+        "result": all(report["result"] for report in reports),
+        "seconds": time.perf_counter() - start_time,
+        "bytes": sum(report.get("bytes", 0) for report in reports),
+        "grids": reports
+        }
+
+
+if __name__ == "__main__":
+    """
+    Download the backup of the configured grid, see python -m ib_rest backup --help.
+    """
+    import sys
+    from ib_rest.__main__ import main
+    sys.exit(main(["backup"] + sys.argv[1:]))
@@ -0,0 +1,159 @@
+"""
+ip_index - local index of the IPv4 addresses assigned in a network view.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from ipaddress import ip_address, ip_network
+
+
+class IpIndex:
+    """
+    Load every IPv4 address assigned to the chosen WAPI object types in a network view,
+    by paging, into a sorted array of 32 bit integers.  Availability, the next free
+    addresses of a network and the number of addresses used in a range are then
+    answered locally by binary search.
+
+    types may include "record:host", "record:a" (of the DNS view dns_view, since
+    A records do not belong to a network view) and "fixedaddress".  The index is only
+    as current as its last load; refresh a network, or use mark_used and
+    mark_available for changes made by the caller, to keep it current.
+    """
+    sources = {
+        "record:host": ("record:host_ipv4addr", "HOST"),
+        "record:a": ("record:a", "A"),
+        "fixedaddress": ("fixedaddress", "FA"),
+        }
+
+    def __init__(self, ib_connection, network_view="default", types=("record:host",), dns_view="default", page_size=1000):
+        """"""
+        unknown = [wapi_type for wapi_type in types if wapi_type not in self.sources]
+        if unknown:
+            raise ValueError("IpIndex types must be among {}.".format(", ".join(self.sources)))
+        self.ib_connection = ib_connection
+        self.network_view = network_view
+        self.types = tuple(types)
+        self.dns_view = dns_view
+        self.page_size = page_size
+        self.addresses = array("I")
+
+    def __len__(self):
+        """"""
+        return len(self.addresses)
+
+    def _source_params(self, wapi_type:str) -> dict:
+        """
+        The search parameters which select the addresses of wapi_type for this index.
+        """
+        params = {"_return_fields": "ipv4addr"}
+        if wapi_type == "record:a":
+            params.update({"view": self.dns_view})
+        else:
+            params.update({"network_view": self.network_view})
+        return params
+
+    def load(self):
+        """
+        Replace the index with every address currently assigned to the chosen types.
+        """
+        used = set()
+        for wapi_type in self.types:
+            source = self.sources[wapi_type][0]
+            for wapi_object in self.ib_connection.stream(source, self._source_params(wapi_type), page_size=self.page_size):
+                used.add(int(ip_address(wapi_object["ipv4addr"])))
+        self.addresses = array("I", sorted(used))
+        return self
+
+    def refresh(self, network:str):
+        """
+        Reload only the addresses of one network (CIDR) from the ipv4address object,
+        keeping those used by the chosen types.
+        """
+        cidr = ip_network(network)
+        types = {self.sources[wapi_type][1] for wapi_type in self.types}
+        params = {
+            "network": cidr.with_prefixlen,
+            "network_view": self.network_view,
+            "status": "USED",
+            "_return_fields": "ip_address,types"
+            }
+        used = sorted({
+            int(ip_address(ipv4address["ip_address"]))
+            for ipv4address in self.ib_connection.stream("ipv4address", params, page_size=self.page_size)
+            if types.intersection(ipv4address.get("types", []))
+            })
+        low = bisect_left(self.addresses, int(cidr.network_address))
+        high = bisect_right(self.addresses, int(cidr.broadcast_address))
+        self.addresses[low:high] = array("I", used)
+        return self
+
+    def isavailable(self, ip_s:str) -> bool:
+        """
+        Return True if the address is not assigned to any of the indexed types.
+        """
+        value = int(ip_address(ip_s))
+        position = bisect_left(self.addresses, value)
+        return position == len(self.addresses) or self.addresses[position] != value
+
+    def mark_used(self, ip_s:str):
+        """
+        Record an address assigned by the caller since the index was loaded.
+        """
+        value = int(ip_address(ip_s))
+        position = bisect_left(self.addresses, value)
+        if position == len(self.addresses) or self.addresses[position] != value:
+            self.addresses.insert(position, value)
+
+    def mark_available(self, ip_s:str):
+        """
+        Record an address released by the caller since the index was loaded.
+        """
+        value = int(ip_address(ip_s))
+        position = bisect_left(self.addresses, value)
+        if position < len(self.addresses) and self.addresses[position] == value:
+            del self.addresses[position]
+
+    def used_count(self, first_ip_s:str, last_ip_s:str) -> int:
+        """
+        Return the number of assigned addresses from first to last, inclusive.
+        """
+        return bisect_right(self.addresses, int(ip_address(last_ip_s))) - bisect_left(self.addresses, int(ip_address(first_ip_s)))
+
+    def occupancy(self, network:str) -> dict:
+        """
+        Return the used, available and total host addresses of a network (CIDR).
+        """
+        cidr = ip_network(network)
+        hosts = cidr.num_addresses - 2 if cidr.prefixlen < 31 else cidr.num_addresses
+        first, last = self._host_bounds(cidr)
+        used = bisect_right(self.addresses, last) - bisect_left(self.addresses, first)
+        return {"network": cidr.with_prefixlen, "used": used, "available": hosts - used, "total": hosts}
+
+    @staticmethod
+    def _host_bounds(cidr) -> tuple:
+        """
+        The first and last host address of the network, as integers.
+        """
+        if cidr.prefixlen < 31:
+            return int(cidr.network_address) + 1, int(cidr.broadcast_address) - 1
+        return int(cidr.network_address), int(cidr.broadcast_address)
+
+    def next_available(self, network:str, count=1, exclude=()) -> list:
+        """
+        Return up to count of the lowest available host addresses of a network (CIDR),
+        skipping any addresses in exclude.
+        """
+        first, last = self._host_bounds(ip_network(network))
+        excluded = {int(ip_address(ip_s)) for ip_s in exclude}
+        available = list()
+        position = bisect_left(self.addresses, first)
+        value = first
+        while value <= last and len(available) < count:
+            while position < len(self.addresses) and self.addresses[position] < value:
+                position += 1
+            if position < len(self.addresses) and self.addresses[position] == value:
+                value += 1
+                continue
+            if value not in excluded:
+                available.append(str(ip_address(value)))
+            value += 1
+        return available
@@ -0,0 +1,120 @@
+"""
+ip_index_tst - Unittests for the ip_index module.
+
+These tests do not need a WAPI; a stand in Connection streams the test fixtures.
+"""
+from ib_rest.ip_index import IpIndex
+from unittest import TestCase, TestSuite, makeSuite, TextTestRunner
+
+#
+# Test fixtures.
+#
+
+class StreamConnection:
+    """
+    Stand in for a Connection which streams fixed objects for each WAPI type.
+    """
+    def __init__(self, objects:dict):
+        """"""
+        self.objects = objects
+    def stream(self, wapi_type:str, params={}, page_size=20):
+        """"""
+        return iter(self.objects.get(wapi_type, []))
+
+
+host_addresses = [{"ipv4addr": ip_s} for ip_s in ("10.32.15.1", "10.32.15.2", "10.32.15.4", "10.32.16.1")]
+fixed_addresses = [{"ipv4addr": "10.32.15.3"}]
+network_addresses = [
+    {"ip_address": "10.32.15.2", "types": ["HOST"]},
+    {"ip_address": "10.32.15.9", "types": ["HOST", "A"]},
+    {"ip_address": "10.32.15.10", "types": ["LEASE"]},
+    ]
+
+ib_conn = StreamConnection({
+    "record:host_ipv4addr": host_addresses,
+    "fixedaddress": fixed_addresses,
+    "ipv4address": network_addresses
+    })
+
+
+class TestLoad(TestCase):
+    """"""
+    def test_available(self):
+        """
+        Loaded host addresses are not available, others are.
+        """
+        ip_index = IpIndex(ib_conn).load()
+        self.assertEqual(len(ip_index), 4)
+        self.assertFalse(ip_index.isavailable("10.32.15.1"))
+        self.assertTrue(ip_index.isavailable("10.32.15.3"))
+        self.assertTrue(ip_index.isavailable("10.32.17.1"))
+    def test_fixed_addresses(self):
+        """
+        Fixed addresses are indexed when requested.
+        """
+        ip_index = IpIndex(ib_conn, types=("record:host", "fixedaddress")).load()
+        self.assertFalse(ip_index.isavailable("10.32.15.3"))
+
+
+class TestQueries(TestCase):
+    """"""
+    def test_next_available(self):
+        """
+        The next available addresses skip the network address, used and excluded addresses.
+        """
+        ip_index = IpIndex(ib_conn).load()
+        self.assertEqual(ip_index.next_available("10.32.15.0/24", 3, exclude=["10.32.15.5"]),
+                         ["10.32.15.3", "10.32.15.6", "10.32.15.7"])
+    def test_occupancy(self):
+        """
+        Count the used addresses of a network and of a range.
+        """
+        ip_index = IpIndex(ib_conn).load()
+        self.assertEqual(ip_index.occupancy("10.32.15.0/24"), {"network": "10.32.15.0/24", "used": 3, "available": 251, "total": 254})
+        self.assertEqual(ip_index.used_count("10.32.15.2", "10.32.16.1"), 3)
+
+
+class TestRefresh(TestCase):
+    """"""
+    def test_refresh_network(self):
+        """
+        Refreshing a network replaces only its addresses, keeping the indexed types.
+        """
+        ip_index = IpIndex(ib_conn).load()
+        ip_index.refresh("10.32.15.0/24")
+        self.assertEqual(ip_index.next_available("10.32.15.0/24", 2), ["10.32.15.1", "10.32.15.3"])
+        self.assertFalse(ip_index.isavailable("10.32.15.9"))
+        self.assertTrue(ip_index.isavailable("10.32.15.10"))
+        self.assertFalse(ip_index.isavailable("10.32.16.1"))
+    def test_mark(self):
+        """
+        Addresses assigned and released by the caller update the index.
+        """
+        ip_index = IpIndex(ib_conn).load()
+        ip_index.mark_used("10.32.15.3")
+        self.assertFalse(ip_index.isavailable("10.32.15.3"))
+        ip_index.mark_available("10.32.15.1")
+        self.assertTrue(ip_index.isavailable("10.32.15.1"))
+
+#
+# Run the test cases as a suite.
+#
+
+def suite():
+    """
+    Gather all the tests from this module in a test suite.
+    """
+    test_suite = TestSuite()
+    test_suite.addTest(makeSuite(TestLoad))
+    test_suite.addTest(makeSuite(TestQueries))
+    test_suite.addTest(makeSuite(TestRefresh))
+    return test_suite
+
+mySuite=suite()
+
+runner=TextTestRunner()
+
+
+if __name__ == "__main__":
+    """"""
+    runner.run(mySuite)
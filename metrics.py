@@ -0,0 +1,190 @@
+"""
+metrics - measure the WAPI calls a Connection makes, by call and object type.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+#
+# Upper bounds, in seconds, of the latency histogram buckets.
+#
+
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class Instrumentation:
+    """
+    Instrumentation receives a record for every call a Connection makes: get, post,
+    put and delete (one HTTP request each, including any retries), and get_paged,
+    stream and each shard of a scan (one record for all the pages of the query, with
+    their number in pages).  A record is a dict of
+
+        call, wapi_type, status, seconds, request_bytes, response_bytes, pages, retries
+
+    where status is that of the last response, or 0 if no response was received.
+    Each record is passed to the callbacks and added to a latency histogram and
+    counters per call and WAPI type, which are returned by summary or written in the
+    OpenMetrics (Prometheus) text format by write_openmetrics.
+    """
+    def __init__(self, callbacks=(), buckets=DEFAULT_BUCKETS):
+        """"""
+        self.callbacks = list(callbacks)
+        self.buckets = tuple(sorted(buckets))
+        self.series = dict()
+        self.lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """
+        Call callback(record) after every call.
+        """
+        self.callbacks.append(callback)
+
+    def start(self, call:str, wapi_type:str) -> dict:
+        """
+        Return a new record for a call which is starting now.  The Connection fills
+        in its status, bytes, pages and retries and then passes it to finish.
+        """
+        return {
+            "call": call,
+            "wapi_type": wapi_type,
+            "status": 0,
+            "seconds": 0.0,
+            "request_bytes": 0,
+            "response_bytes": 0,
+            "pages": 0,
+            "retries": 0,
+            "started": time.perf_counter()
+            }
+
+    def finish(self, record:dict):
+        """
+        Complete the record of a call, add it to the statistics and pass it to the callbacks.
+        A callback which raises an exception is logged and the other callbacks are still
+        called, so that a faulty callback does not fail the call it measured.
+        """
+        record["seconds"] = time.perf_counter() - record.pop("started")
+        self.add(record)
+        for callback in self.callbacks:
+            try:
+                callback(record)
+            except Exception:
+                logger.exception("Instrumentation callback %r failed.", callback)
+
+    def add(self, record:dict):
+        """
+        Add a completed record to the statistics of its call and WAPI type.
+        """
+        key = (record["call"], record["wapi_type"])
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {
+                    "count": 0,
+                    "errors": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "request_bytes": 0,
+                    "response_bytes": 0,
+                    "pages": 0,
+                    "retries": 0,
+                    "statuses": dict(),
+                    "buckets": [0] * (len(self.buckets) + 1)
+                    }
+            series["count"] += 1
+            if not 200 <= record["status"] < 400:
+                series["errors"] += 1
+            series["seconds"] += record["seconds"]
+            series["max_seconds"] = max(series["max_seconds"], record["seconds"])
+            for name in ("request_bytes", "response_bytes", "pages", "retries"):
+                series[name] += record[name]
+            series["statuses"][record["status"]] = series["statuses"].get(record["status"], 0) + 1
+            index = 0
+            while index < len(self.buckets) and record["seconds"] > self.buckets[index]:
+                index += 1
+            series["buckets"][index] += 1
+
+    def percentile(self, buckets:list, fraction:float) -> float:
+        """
+        Estimate a percentile of a histogram as the upper bound of the bucket it falls in.
+        """
+        wanted = fraction * sum(buckets)
+        total = 0
+        for index, count in enumerate(buckets[:-1]):
+            total += count
+            if total >= wanted:
+                return self.buckets[index]
+        return float("inf")
+
+    def summary(self) -> list:
+        """
+        Return the statistics of each call and WAPI type, those taking the most time in
+        total first, with the mean and estimated median and 95th percentile latency.
+        """
+        summary_l = list()
+        with self.lock:
+            for (call, wapi_type), series in self.series.items():
+                summary_d = {"call": call, "wapi_type": wapi_type}
+                summary_d.update({name: value for name, value in series.items() if name != "buckets"})
+                summary_d.update({
+                    "statuses": dict(series["statuses"]),
+                    "mean_seconds": series["seconds"] / series["count"],
+                    "p50_seconds": self.percentile(series["buckets"], 0.5),
+                    "p95_seconds": self.percentile(series["buckets"], 0.95)
+                    })
+                summary_l.append(summary_d)
+        return sorted(summary_l, key=lambda summary_d: summary_d["seconds"], reverse=True)
+
+    def reset(self):
+        """
+        Forget the statistics gathered so far.
+        """
+        with self.lock:
+            self.series = dict()
+
+    def openmetrics(self, prefix="ib_rest") -> str:
+        """
+        Return the statistics in the OpenMetrics text format.
+        """
+        def labels(call, wapi_type, **extra) -> str:
+            """"""
+            label_d = {"call": call, "wapi_type": wapi_type}
+            label_d.update(extra)
+            return "{" + ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                                  for name, value in label_d.items()) + "}"
+        lines = [
+            "# TYPE {}_call_seconds histogram".format(prefix),
+            "# HELP {}_call_seconds Time taken by WAPI calls.".format(prefix)
+            ]
+        with self.lock:
+            series_l = sorted(self.series.items())
+            for (call, wapi_type), series in series_l:
+                total = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series["buckets"]):
+                    total += count
+                    lines.append("{}_call_seconds_bucket{} {}".format(prefix, labels(call, wapi_type, le=bound), total))
+                lines.append("{}_call_seconds_sum{} {}".format(prefix, labels(call, wapi_type), series["seconds"]))
+                lines.append("{}_call_seconds_count{} {}".format(prefix, labels(call, wapi_type), series["count"]))
+            lines.append("# TYPE {}_calls counter".format(prefix))
+            for (call, wapi_type), series in series_l:
+                for status, count in sorted(series["statuses"].items()):
+                    lines.append("{}_calls_total{} {}".format(prefix, labels(call, wapi_type, status=status), count))
+            for name in ("request_bytes", "response_bytes", "pages", "retries"):
+                lines.append("# TYPE {}_{} counter".format(prefix, name))
+                for (call, wapi_type), series in series_l:
+                    lines.append("{}_{}_total{} {}".format(prefix, name, labels(call, wapi_type), series[name]))
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_openmetrics(self, file_path:str, prefix="ib_rest"):
+        """
+        Write the statistics in the OpenMetrics text format to file_path, replacing
+        it in one step so that a collector (such as the node exporter's textfile
+        collector) never reads a partial file.
+        """
+        temp_path = file_path+".tmp"
+        with open(temp_path, "w") as metrics_file:
+            metrics_file.write(self.openmetrics(prefix))
+        os.replace(temp_path, file_path)
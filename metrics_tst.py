@@ -0,0 +1,142 @@
+"""
+metrics_tst - Unittests for the metrics module.
+
+These tests do not need a WAPI; the records are made up.
+"""
+import os
+import tempfile
+from ib_rest.metrics import Instrumentation
+from unittest import TestCase, TestSuite, makeSuite, TextTestRunner
+
+#
+# Test fixtures.
+#
+
+def make_record(call: str, wapi_type: str, status: int, seconds: float, pages=0) -> dict:
+    """
+    A completed record of a call.
+    """
+    return {
+        "call": call,
+        "wapi_type": wapi_type,
+        "status": status,
+        "seconds": seconds,
+        "request_bytes": 10,
+        "response_bytes": 100,
+        "pages": pages,
+        "retries": 1 if status == 0 else 0
+        }
+
+
+def loaded_instrumentation() -> Instrumentation:
+    """
+    Instrumentation holding a few record:host pages and network gets.
+    """
+    instrumentation = Instrumentation()
+    for seconds in (0.02, 0.04, 0.2, 3.0):
+        instrumentation.add(make_record("get_paged", "record:host", 200, seconds, pages=3))
+    instrumentation.add(make_record("get", "network", 200, 0.005))
+    instrumentation.add(make_record("get", "network", 0, 0.5))
+    return instrumentation
+
+
+class TestSummary(TestCase):
+    """"""
+    def test_totals(self):
+        """
+        The call taking the most time is first, with its counts and totals.
+        """
+        summary = loaded_instrumentation().summary()
+        self.assertEqual([(summary_d["call"], summary_d["wapi_type"]) for summary_d in summary],
+                         [("get_paged", "record:host"), ("get", "network")])
+        self.assertEqual(summary[0]["count"], 4)
+        self.assertEqual(summary[0]["pages"], 12)
+        self.assertEqual(summary[0]["response_bytes"], 400)
+        self.assertAlmostEqual(summary[0]["seconds"], 3.26)
+        self.assertEqual(summary[1]["errors"], 1)
+        self.assertEqual(summary[1]["retries"], 1)
+        self.assertEqual(summary[1]["statuses"], {200: 1, 0: 1})
+    def test_percentiles(self):
+        """
+        Percentiles are estimated as the upper bound of their bucket.
+        """
+        summary = loaded_instrumentation().summary()
+        self.assertEqual(summary[0]["p50_seconds"], 0.05)
+        self.assertEqual(summary[0]["p95_seconds"], 5.0)
+    def test_callback(self):
+        """
+        Callbacks receive each finished record.
+        """
+        records = list()
+        instrumentation = Instrumentation(callbacks=[records.append])
+        record = instrumentation.start("get", "network")
+        record["status"] = 200
+        instrumentation.finish(record)
+        self.assertEqual(len(records), 1)
+        self.assertNotIn("started", records[0])
+        self.assertGreaterEqual(records[0]["seconds"], 0)
+
+
+class TestOpenMetrics(TestCase):
+    """"""
+    def test_histogram(self):
+        """
+        The histogram buckets are cumulative and end with +Inf and the count.
+        """
+        text = loaded_instrumentation().openmetrics()
+        self.assertIn('ib_rest_call_seconds_bucket{call="get_paged",wapi_type="record:host",le="0.05"} 2', text)
+        self.assertIn('ib_rest_call_seconds_bucket{call="get_paged",wapi_type="record:host",le="+Inf"} 4', text)
+        self.assertIn('ib_rest_call_seconds_count{call="get_paged",wapi_type="record:host"} 4', text)
+        self.assertIn('ib_rest_calls_total{call="get",wapi_type="network",status="0"} 1', text)
+        self.assertTrue(text.endswith("# EOF\n"))
+    def test_write(self):
+        """
+        The text is written to the file.
+        """
+        instrumentation = loaded_instrumentation()
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = os.path.join(folder, "ib_rest.prom")
+            instrumentation.write_openmetrics(file_path)
+            with open(file_path) as metrics_file:
+                self.assertEqual(metrics_file.read(), instrumentation.openmetrics())
+
+
+class TestCallbacks(TestCase):
+    """"""
+    def test_failing_callback(self):
+        """
+        A callback which raises is logged, and the later callbacks still get the record.
+        """
+        def failing(record):
+            """"""
+            raise RuntimeError("callback failed")
+        received = list()
+        instrumentation = Instrumentation(callbacks=[failing, received.append])
+        with self.assertLogs("ib_rest.metrics", level="ERROR") as logs:
+            instrumentation.finish(instrumentation.start("get", "network"))
+        self.assertIn("callback failed", logs.output[0])
+        self.assertEqual([(record["call"], record["wapi_type"]) for record in received], [("get", "network")])
+        self.assertEqual(instrumentation.summary()[0]["count"], 1)
+
+#
+# Run the test cases as a suite.
+#
+
+def suite():
+    """
+    Gather all the tests from this module in a test suite.
+    """
+    test_suite = TestSuite()
+    test_suite.addTest(makeSuite(TestSummary))
+    test_suite.addTest(makeSuite(TestOpenMetrics))
+    test_suite.addTest(makeSuite(TestCallbacks))
+    return test_suite
+
+mySuite=suite()
+
+runner=TextTestRunner()
+
+
+if __name__ == "__main__":
+    """"""
+    runner.run(mySuite)
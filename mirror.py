@@ -0,0 +1,324 @@
+"""
+mirror - a local SQLite copy of chosen WAPI object types, refreshed incrementally.
+"""
+import ipaddress
+import json
+import sqlite3
+import threading
+import time
+from ib_rest.batch import operation
+
+#
+# The fields mirrored by default and the field each type is looked up by.
+#
+
+DEFAULT_FIELDS = {
+    "record:host": "name,ipv4addrs,view,zone,comment,ttl,extattrs",
+    "record:a": "name,ipv4addr,view,zone,comment,ttl,extattrs",
+    "fixedaddress": "ipv4addr,mac,name,network,network_view,comment,extattrs",
+    "network": "network,network_view,comment,extattrs",
+    "networkcontainer": "network,network_view,comment,extattrs",
+    "range": "start_addr,end_addr,network,network_view,comment,extattrs",
+    "zone_auth": "fqdn,view,comment,extattrs"
+    }
+KEY_FIELDS = {
+    "network": "network",
+    "networkcontainer": "network",
+    "range": "start_addr",
+    "zone_auth": "fqdn",
+    "fixedaddress": "ipv4addr"
+    }
+SCHEMA = """
+create table if not exists objects (
+    ref text primary key,
+    wapi_type text not null,
+    name text,
+    data text not null,
+    synced real not null
+);
+create index if not exists objects_name on objects (wapi_type, name);
+create table if not exists addresses (
+    ip integer not null,
+    ref text not null references objects (ref) on delete cascade
+);
+create index if not exists addresses_ip on addresses (ip);
+create index if not exists addresses_ref on addresses (ref);
+create table if not exists ranges (
+    first integer not null,
+    last integer not null,
+    ref text not null references objects (ref) on delete cascade
+);
+create index if not exists ranges_first on ranges (first, last);
+create index if not exists ranges_ref on ranges (ref);
+create table if not exists sync_state (
+    wapi_type text primary key,
+    params text not null,
+    fields text not null,
+    synced real not null,
+    ea_value text
+);
+"""
+
+
+def ip_int(address:str) -> int:
+    """"""
+    return int(ipaddress.IPv4Address(address))
+
+
+class Mirror:
+    """
+    A Mirror keeps the objects of chosen WAPI types in an SQLite database at db_path,
+    with indexes on the name of each object (KEY_FIELDS, else name), on the IPv4
+    addresses of hosts, A records and fixed addresses, and on the address range of
+    networks, network containers and ranges, so that reports and lookups can be run
+    locally instead of against the Grid Master.
+
+    A type is first read whole by populate (or sync with strategy "full"), then
+    refreshed by sync with strategy:
+      "refs" - page only the _ref of every object, fetch the new ones through the
+               request object and drop those no longer returned.  Changes which do
+               not alter the _ref (for record:host it holds the name) are not seen,
+               so run a full sync now and then.
+      "ea"   - fetch only the objects whose extensible attribute ea (an integer or
+               date stamped by whatever changes them) is at or after the latest value
+               seen, and drop the deleted objects as for "refs".  Until a value has
+               been seen the type is read whole.
+    """
+    def __init__(self, db_path:str, fields=None):
+        """"""
+        self.fields = dict(DEFAULT_FIELDS)
+        self.fields.update(fields or {})
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("pragma foreign_keys = on")
+        self.db.execute("pragma journal_mode = wal")
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        """"""
+        self.db.close()
+
+    def __enter__(self):
+        """"""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """"""
+        self.close()
+
+    #
+    # Loading.
+    #
+
+    def _store(self, wapi_type:str, wapi_objects:list, synced:float):
+        """
+        Insert or replace objects with their address and range index entries.
+        Call with the lock held and inside a transaction.
+        """
+        key_field = KEY_FIELDS.get(wapi_type, "name")
+        refs = [(wapi_object["_ref"],) for wapi_object in wapi_objects]
+        self.db.executemany("delete from addresses where ref = ?", refs)
+        self.db.executemany("delete from ranges where ref = ?", refs)
+        self.db.executemany(
+            "insert or replace into objects (ref, wapi_type, name, data, synced) values (?, ?, ?, ?, ?)",
+            [(wapi_object["_ref"], wapi_type, wapi_object.get(key_field), json.dumps(wapi_object), synced)
+             for wapi_object in wapi_objects]
+            )
+        addresses = list()
+        ranges = list()
+        for wapi_object in wapi_objects:
+            ref = wapi_object["_ref"]
+            for address in wapi_object.get("ipv4addrs", []):
+                if address.get("ipv4addr"):
+                    addresses.append((ip_int(address["ipv4addr"]), ref))
+            if wapi_object.get("ipv4addr"):
+                addresses.append((ip_int(wapi_object["ipv4addr"]), ref))
+            if wapi_type in ("network", "networkcontainer") and wapi_object.get("network"):
+                network = ipaddress.IPv4Network(wapi_object["network"])
+                ranges.append((int(network.network_address), int(network.broadcast_address), ref))
+            elif wapi_object.get("start_addr") and wapi_object.get("end_addr"):
+                ranges.append((ip_int(wapi_object["start_addr"]), ip_int(wapi_object["end_addr"]), ref))
+        self.db.executemany("insert into addresses (ip, ref) values (?, ?)", addresses)
+        self.db.executemany("insert into ranges (first, last, ref) values (?, ?, ?)", ranges)
+
+    def _remove(self, refs):
+        """
+        Delete objects, and their index entries, by _ref.  Call with the lock held.
+        """
+        self.db.executemany("delete from objects where ref = ?", [(ref,) for ref in refs])
+
+    def _params(self, params:dict, return_fields:str) -> dict:
+        """"""
+        query_params = {"_return_fields": return_fields}
+        query_params.update(params)
+        return query_params
+
+    def _save_state(self, wapi_type:str, params:dict, synced:float, ea_value=None):
+        """"""
+        self.db.execute(
+            "insert or replace into sync_state (wapi_type, params, fields, synced, ea_value) values (?, ?, ?, ?, ?)",
+            (wapi_type, json.dumps(params, sort_keys=True), self.fields.get(wapi_type, ""), synced,
+             None if ea_value is None else json.dumps(ea_value))
+            )
+
+    def state(self, wapi_type:str) -> dict:
+        """
+        Return the last sync of the type: its params, fields, time and ea_value, or
+        an empty dict if it has not been synced.
+        """
+        row = self.db.execute("select * from sync_state where wapi_type = ?", (wapi_type,)).fetchone()
+        if row is None:
+            return {}
+        state = dict(row)
+        state.update({"params": json.loads(row["params"]), "ea_value": json.loads(row["ea_value"]) if row["ea_value"] else None})
+        return state
+
+    def populate(self, ib_connection, wapi_type:str, params={}, page_size=1000, ea=None) -> dict:
+        """
+        Read every object of the type matching params through stream and replace the
+        mirrored objects of the type with them.  With ea the latest value of that
+        extensible attribute is kept for "ea" syncs.
+        """
+        if wapi_type not in self.fields:
+            raise ValueError("Name the fields to mirror for {}.".format(wapi_type))
+        synced = time.time()
+        query_params = self._params(params, self.fields[wapi_type])
+        seen = set()
+        page = list()
+        ea_value = None
+        with self.lock, self.db:
+            for wapi_object in ib_connection.stream(wapi_type, query_params, page_size=page_size, prefetch=2):
+                seen.add(wapi_object["_ref"])
+                ea_value = self._latest(wapi_object, ea, ea_value)
+                page.append(wapi_object)
+                if len(page) == page_size:
+                    self._store(wapi_type, page, synced)
+                    page = list()
+            self._store(wapi_type, page, synced)
+            stale = [row["ref"] for row in self.db.execute("select ref from objects where wapi_type = ?", (wapi_type,))
+                     if row["ref"] not in seen]
+            self._remove(stale)
+            self._save_state(wapi_type, params, synced, ea_value)
+        return {"result": True, "wapi_type": wapi_type, "objects": len(seen), "removed": len(stale), "seconds": time.time() - synced}
+
+    def _latest(self, wapi_object:dict, ea, latest):
+        """
+        The later of latest and the value of the extensible attribute ea of the object.
+        """
+        if not ea:
+            return latest
+        value = (wapi_object.get("extattrs") or {}).get(ea, {}).get("value")
+        if value is None or (latest is not None and value <= latest):
+            return latest
+        return value
+
+    def sync(self, ib_connection, wapi_type:str, strategy="refs", params=None, ea=None, page_size=1000, chunk_size=100) -> dict:
+        """
+        Refresh the mirrored objects of the type with the strategy "full", "refs" or
+        "ea" (see the class).  params default to those of the last sync of the type.
+        Return the numbers of objects added or updated and removed.
+        """
+        if strategy not in ("full", "refs", "ea"):
+            raise ValueError("strategy must be full, refs or ea.")
+        state = self.state(wapi_type)
+        params = params if params is not None else state.get("params", {})
+        if strategy == "ea" and not ea:
+            raise ValueError("Name the extensible attribute of the ea strategy.")
+        if (strategy == "full" or not state or state["fields"] != self.fields.get(wapi_type)
+                or (strategy == "ea" and state["ea_value"] is None)):
+            return self.populate(ib_connection, wapi_type, params, page_size, ea)
+        synced = time.time()
+        remote = set()
+        for wapi_object in ib_connection.stream(wapi_type, self._params(params, ""), page_size=page_size, prefetch=2):
+            remote.add(wapi_object["_ref"])
+        local = {row["ref"] for row in self.db.execute("select ref from objects where wapi_type = ?", (wapi_type,))}
+        fetched = list()
+        ea_value = state.get("ea_value")
+        if strategy == "ea":
+            changed_params = {"*"+ea+">": ea_value}
+            changed_params.update(params)
+            changed_params = self._params(changed_params, self.fields[wapi_type])
+            fetched.extend(ib_connection.stream(wapi_type, changed_params, page_size=page_size, prefetch=2))
+        fetched_refs = {wapi_object["_ref"] for wapi_object in fetched}
+        new_refs = [ref for ref in remote if ref not in local and ref not in fetched_refs]
+        operations = [operation("GET", ref, args={"_return_fields": self.fields[wapi_type]}) for ref in new_refs]
+        failed = 0
+        for batch_response in ib_connection.multi(operations, chunk_size=chunk_size) if operations else []:
+            if batch_response.ok and isinstance(batch_response.result, dict):
+                fetched.append(batch_response.result)
+            else:
+                failed += 1
+        for wapi_object in fetched:
+            ea_value = self._latest(wapi_object, ea, ea_value)
+        removed = local - remote
+        with self.lock, self.db:
+            self._store(wapi_type, fetched, synced)
+            self._remove(removed)
+            self._save_state(wapi_type, params, synced, ea_value)
+        return {
+            "result": not failed,
+            "wapi_type": wapi_type,
+            "objects": len(remote),
+            "updated": len(fetched),
+            "removed": len(removed),
+            "failed": failed,
+            "seconds": time.time() - synced
+            }
+
+    #
+    # Queries.
+    #
+
+    def _objects(self, rows) -> list:
+        """"""
+        return [json.loads(row["data"]) for row in rows]
+
+    def get(self, ref:str):
+        """
+        Return the mirrored object with the _ref, or None.
+        """
+        row = self.db.execute("select data from objects where ref = ?", (ref,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def find(self, wapi_type:str, name:str) -> list:
+        """
+        Return the objects of the type whose name (or KEY_FIELDS field) is name.
+        """
+        return self._objects(self.db.execute("select data from objects where wapi_type = ? and name = ?", (wapi_type, name)))
+
+    def search(self, wapi_type:str, pattern:str) -> list:
+        """
+        Return the objects of the type whose name matches an SQL LIKE pattern, such
+        as "web%.example.com".
+        """
+        return self._objects(self.db.execute("select data from objects where wapi_type = ? and name like ?", (wapi_type, pattern)))
+
+    def find_ip(self, address:str) -> list:
+        """
+        Return the hosts, A records and fixed addresses with the IPv4 address.
+        """
+        return self._objects(self.db.execute(
+            "select data from objects where ref in (select ref from addresses where ip = ?)", (ip_int(address),)))
+
+    def containing(self, address:str, wapi_type="") -> list:
+        """
+        Return the networks, network containers and ranges (or only those of
+        wapi_type) containing the IPv4 address, smallest first.
+        """
+        ip = ip_int(address)
+        rows = self.db.execute(
+            "select objects.wapi_type, data from ranges join objects on objects.ref = ranges.ref "
+            "where first <= ? and last >= ? order by last - first", (ip, ip))
+        return [json.loads(row["data"]) for row in rows if not wapi_type or row["wapi_type"] == wapi_type]
+
+    def objects(self, wapi_type:str):
+        """
+        Generate every mirrored object of the type.
+        """
+        for row in self.db.execute("select data from objects where wapi_type = ?", (wapi_type,)):
+            yield json.loads(row["data"])
+
+    def count(self, wapi_type:str) -> int:
+        """"""
+        return self.db.execute("select count(*) from objects where wapi_type = ?", (wapi_type,)).fetchone()[0]
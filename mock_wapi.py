@@ -0,0 +1,790 @@
+"""
+mock_wapi - a local stand in for the Infoblox REST API (WAPI) for tests and benchmarks.
+"""
+import base64
+import csv
+import gzip
+import hashlib
+import io
+import ipaddress
+import json
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+#
+# The object types served and their fields.
+#
+
+FIELDS = {
+    "record:host": ["name", "ipv4addrs", "view", "zone", "comment", "ttl", "use_ttl", "configure_for_dns", "extattrs"],
+    "network": ["network", "network_view", "comment", "extattrs"],
+    "ipv4address": ["ip_address", "status", "names", "network", "network_view", "usage", "types", "mac_address"]
+    }
+BLOCK_SIZE = 1024*1024
+
+
+def host_object(index:int) -> dict:
+    """
+    The generated record:host at index, with a fixed address in 10.0.0.0/8.
+    """
+    name = "host{:07d}.example.com".format(index)
+    address = "10.{}.{}.{}".format(index >> 16 & 255, index >> 8 & 255, index & 255)
+    return {
+        "name": name,
+        "ipv4addrs": [{"ipv4addr": address, "host": name, "configure_for_dhcp": False}],
+        "view": "default",
+        "zone": "example.com",
+        "comment": "",
+        "ttl": 0,
+        "use_ttl": False,
+        "configure_for_dns": True,
+        "extattrs": {}
+        }
+
+
+def network_object(index:int) -> dict:
+    """
+    The generated network at index, a /24 in 10.0.0.0/8.
+    """
+    return {
+        "network": "10.{}.{}.0/24".format(index >> 8 & 255, index & 255),
+        "network_view": "default",
+        "comment": "",
+        "extattrs": {}
+        }
+
+
+def ipv4address_object(index:int) -> dict:
+    """
+    The generated ipv4address at index, used by the record:host of the same index.
+    """
+    host = host_object(index)
+    address = host["ipv4addrs"][0]["ipv4addr"]
+    return {
+        "ip_address": address,
+        "status": "USED",
+        "names": [host["name"]],
+        "network": address.rsplit(".", 1)[0]+".0/24",
+        "network_view": "default",
+        "usage": ["DNS"],
+        "types": ["HOST"],
+        "mac_address": ""
+        }
+
+
+class WapiError(Exception):
+    """"""
+    def __init__(self, status:int, text:str):
+        """"""
+        self.status = status
+        self.message = text
+        super().__init__(self.message)
+
+
+class MockServer(ThreadingHTTPServer):
+    """
+    A ThreadingHTTPServer which does not report clients closing their connection
+    before a response has been sent, as downloads that are abandoned do.
+    """
+    def handle_error(self, request, client_address):
+        """"""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockWapi:
+    """
+    A MockWapi serves a WAPI on a local port, on its own threads, for the objects of
+    FIELDS: hosts record:host (each with its ipv4address) and networks network
+    objects which are generated from their index when asked for, so that even
+    millions of objects take no memory until they are changed.  It answers
+
+      the schema (?_schema) and logins with basic authentication, setting ibapauth,
+      logout, GET of a type (with exact, ~ (regular expression) filters,
+      _return_fields and paging through _paging, _max_results and _page_id) or a
+      reference, POST (returning the _return_fields when given, and assigning
+      func:nextavailableip host addresses), PUT and DELETE, the "request" object
+      (rolled back when an operation fails) and fileop getgriddata, csv_export and downloadcomplete,
+      with the file downloads supporting Range, and uploadinit and csv_import,
+      which inserts the hostrecord rows of the uploaded file and returns a
+      csvimporttask that is PENDING until it is read.
+
+    Every request waits latency seconds first, counted in in_flight while it does, and
+    max_in_flight records the most requests waiting at once.  The backup file is
+    backup_size bytes.
+    The next requests are answered with the errors in failures, a list of (status,
+    Retry-After seconds or None) to add to, one each in order, whatever they ask.
+    Pages of more than max_page_size objects, when set, fail as too large.
+    With compress, JSON responses are gzip compressed for clients accepting gzip.
+    bytes_sent counts the JSON response bytes as sent.
+    """
+    def __init__(self, hosts=1000, networks=100, latency=0.0, backup_size=16*1024*1024,
+                 user="admin", password="infoblox", version="v2.12", port=0, compress=False):
+        """"""
+        self.counts = {"record:host": hosts, "network": networks, "ipv4address": hosts}
+        self.generators = {"record:host": host_object, "network": network_object, "ipv4address": ipv4address_object}
+        self.latency = latency
+        self.backup_size = backup_size
+        self.block = random.Random(backup_size).randbytes(BLOCK_SIZE)
+        self.credentials = (user, password)
+        self.version = version
+        self.port = port
+        self.changed = {wapi_type: dict() for wapi_type in FIELDS}
+        self.sessions = set()
+        self.files = dict()
+        self.uploads = dict()
+        self.tasks = list()
+        self.failures = list()
+        self.max_page_size = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.compress = compress
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        """
+        The WAPI URL to pass to a Connection.
+        """
+        return "http://127.0.0.1:{}/wapi/{}".format(self.server.server_port, self.version)
+
+    def start(self) -> str:
+        """
+        Start serving on a background thread and return the WAPI URL.
+        """
+        mock = self
+        class Handler(WapiHandler):
+            """"""
+            wapi = mock
+        self.server = MockServer(("127.0.0.1", self.port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), name="mock_wapi", daemon=True).start()
+        return self.url
+
+    def stop(self):
+        """"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        """"""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """"""
+        self.stop()
+
+    #
+    # Objects, addressed by their type and index.
+    #
+
+    def reference(self, wapi_type:str, index:int, wapi_object:dict) -> str:
+        """
+        The _ref of an object: its type, an opaque id and its name.
+        """
+        name = wapi_object.get("name", wapi_object.get("network", ""))
+        view = wapi_object.get("view", wapi_object.get("network_view", "default"))
+        object_id = base64.urlsafe_b64encode("{}${}".format(wapi_type, index).encode()).decode().rstrip("=")
+        return "{}/{}:{}/{}".format(wapi_type, object_id, name, view)
+
+    def locate(self, reference:str) -> tuple:
+        """
+        Return the type and index of the object a _ref refers to.
+        """
+        try:
+            object_id = reference.split("/")[1].split(":")[0]
+            wapi_type, index = base64.urlsafe_b64decode(object_id + "=" * (-len(object_id) % 4)).decode().split("$")
+            return wapi_type, int(index)
+        except (IndexError, ValueError):
+            raise WapiError(400, "Invalid reference: "+reference)
+
+    def object(self, wapi_type:str, index:int):
+        """
+        Return the object of the type at index, with its _ref, or None if there is none.
+        """
+        changed = self.changed[wapi_type]
+        if index in changed:
+            wapi_object = changed[index]
+        elif 0 <= index < self.counts[wapi_type]:
+            wapi_object = self.generators[wapi_type](index)
+        else:
+            return None
+        if wapi_object is None:
+            return None
+        result = {"_ref": self.reference(wapi_type, index, wapi_object)}
+        result.update(wapi_object)
+        return result
+
+    def end(self, wapi_type:str) -> int:
+        """
+        One past the highest index in use for the type.
+        """
+        return max([self.counts[wapi_type]] + [index + 1 for index in self.changed[wapi_type]])
+
+    def query(self, wapi_type:str, filters:list, start:int, max_results:int) -> tuple:
+        """
+        Return up to max_results objects matching the filters, from index start, and
+        the index to continue from (or None at the end).
+        """
+        matches = [self.matcher(name, value) for name, value in filters]
+        indexes = range(start, self.end(wapi_type))
+        name = dict(filters).get("name")
+        if wapi_type == "record:host" and name is not None:
+            match = re.fullmatch(r"host(\d{7})\.example\.com", name)
+            indexes = [int(match.group(1))] if match else []
+            indexes.extend(index for index in self.changed[wapi_type] if index not in indexes)
+        result = list()
+        for index in indexes:
+            if len(result) == max_results:
+                return result, index
+            wapi_object = self.object(wapi_type, index)
+            if wapi_object is not None and all(match(wapi_object) for match in matches):
+                result.append(wapi_object)
+        return result, None
+
+    def matcher(self, name:str, value:str):
+        """
+        Return a function testing an object against a search filter.
+        """
+        if name.endswith("~"):
+            pattern = re.compile(value)
+            return lambda wapi_object: bool(pattern.search(str(wapi_object.get(name[:-1], ""))))
+        if name.startswith("*"):
+            ea = name[1:].rstrip("<>")
+            def compare(wapi_object):
+                """
+                Compare an extensible attribute, at or after (>) or before (<) the value.
+                """
+                ea_value = wapi_object.get("extattrs", {}).get(ea, {}).get("value")
+                if ea_value is None:
+                    return False
+                wanted = type(ea_value)(value)
+                if name.endswith(">"):
+                    return ea_value >= wanted
+                if name.endswith("<"):
+                    return ea_value <= wanted
+                return ea_value == wanted
+            return compare
+        if name == "ipv4addr":
+            return lambda wapi_object: any(address["ipv4addr"] == value for address in wapi_object.get("ipv4addrs", []))
+        return lambda wapi_object: str(wapi_object.get(name, "")) == value
+
+    def schema(self, wapi_type:str) -> dict:
+        """"""
+        if wapi_type not in FIELDS:
+            raise WapiError(400, "Unknown object type ({})".format(wapi_type))
+        return {
+            "type": wapi_type,
+            "fields": [{"name": name, "supports": "rwus", "type": ["string"]} for name in FIELDS[wapi_type]]
+            }
+
+    #
+    # Operations.
+    #
+
+    def get(self, path:str, params:dict):
+        """"""
+        if "/" in path:
+            wapi_type, index = self.locate(path)
+            if wapi_type == "csvimporttask":
+                if not 0 <= index < len(self.tasks):
+                    raise WapiError(404, "Reference {} not found".format(path))
+                return self.select(dict(self.tasks[index], _ref=path), params)
+            wapi_object = self.object(wapi_type, index)
+            if wapi_object is None:
+                raise WapiError(404, "Reference {} not found".format(path))
+            return self.select(wapi_object, params)
+        if path not in FIELDS:
+            raise WapiError(400, "Unknown object type ({})".format(path))
+        filters = [(name, value) for name, value in params.items() if not name.startswith("_")]
+        max_results = int(params.get("_max_results", 1000))
+        if params.get("_paging") == "1":
+            if params.get("_return_as_object") != "1":
+                raise WapiError(400, "_return_as_object must be set with _paging.")
+            if self.max_page_size and abs(max_results) > self.max_page_size:
+                raise WapiError(400, "Result set too large (> {})".format(self.max_page_size))
+            page_id = params.get("_page_id")
+            start = self.page_start(path, page_id) if page_id else 0
+            result, next_index = self.query(path, filters, start, abs(max_results))
+            page = {"result": [self.select(wapi_object, params) for wapi_object in result]}
+            if next_index is not None:
+                page.update({"next_page_id": self.page_id(path, next_index)})
+            return page
+        result, next_index = self.query(path, filters, 0, abs(max_results))
+        if next_index is not None and max_results > 0:
+            raise WapiError(400, "Result set too large (> {})".format(max_results))
+        result = [self.select(wapi_object, params) for wapi_object in result]
+        return {"result": result} if params.get("_return_as_object") == "1" else result
+
+    def page_id(self, wapi_type:str, index:int) -> str:
+        """"""
+        return base64.urlsafe_b64encode("{}:{}".format(wapi_type, index).encode()).decode()
+
+    def page_start(self, wapi_type:str, page_id:str) -> int:
+        """"""
+        try:
+            page_type, index = base64.urlsafe_b64decode(page_id.encode()).decode().rsplit(":", 1)
+        except ValueError:
+            raise WapiError(400, "Invalid page id")
+        if page_type != wapi_type:
+            raise WapiError(400, "Page id is for another object type")
+        return int(index)
+
+    def select(self, wapi_object:dict, params:dict) -> dict:
+        """
+        Keep only the _return_fields, if given, of an object.
+        """
+        return_fields = params.get("_return_fields")
+        if return_fields is None:
+            return_fields = params.get("_return_fields+")
+            if return_fields is None:
+                return wapi_object
+        names = set(return_fields.split(",")).union(["_ref"])
+        return {name: value for name, value in wapi_object.items() if name in names}
+
+    def post(self, path:str, params:dict, data):
+        """"""
+        if path == "request":
+            return self.request(data)
+        if path == "fileop":
+            return self.fileop(params.get("_function", ""), data)
+        if path not in FIELDS:
+            raise WapiError(400, "Unknown object type ({})".format(path))
+        unknown = [name for name in data if name not in FIELDS[path]]
+        if unknown:
+            raise WapiError(400, "Unknown argument/field: {}".format(unknown[0]))
+        if path == "ipv4address":
+            raise WapiError(400, "Operation create not allowed for ipv4address")
+        key = "name" if path == "record:host" else "network"
+        if not data.get(key):
+            raise WapiError(400, "Field is not writable or required: {}".format(key))
+        wapi_object = {name: "" for name in FIELDS[path]}
+        wapi_object.update({"extattrs": {}, "view" if path == "record:host" else "network_view": "default"})
+        wapi_object.update(data)
+        with self.lock:
+            self.assign_addresses(wapi_object)
+            index = self.end(path)
+            self.changed[path][index] = wapi_object
+        if "_return_fields" in params or "_return_fields+" in params:
+            return self.select(self.object(path, index), params)
+        return self.reference(path, index, wapi_object)
+
+    def put(self, path:str, data:dict):
+        """"""
+        wapi_type, index = self.locate(path)
+        with self.lock:
+            wapi_object = self.object(wapi_type, index)
+            if wapi_object is None:
+                raise WapiError(404, "Reference {} not found".format(path))
+            wapi_object.pop("_ref")
+            wapi_object.update(data)
+            self.assign_addresses(wapi_object)
+            self.changed[wapi_type][index] = wapi_object
+        return self.reference(wapi_type, index, wapi_object)
+
+    def assign_addresses(self, wapi_object:dict):
+        """
+        Replace each func:nextavailableip:<network>,<network view> address of a host
+        with the first address of the network which no host uses; the lock must be held.
+        """
+        used = None
+        for address in wapi_object.get("ipv4addrs") or []:
+            value = address.get("ipv4addr", "")
+            if not value.startswith("func:"):
+                continue
+            match = re.fullmatch(r"func:nextavailableip:([^,]+)(?:,(.+))?", value)
+            if match is None:
+                raise WapiError(400, "Invalid function call: {}".format(value))
+            network, network_view = match.group(1), match.group(2) or "default"
+            if not any(self.query("network", [("network", network), ("network_view", network_view)], 0, 1)[0]):
+                raise WapiError(400, "Cannot find network {} in network view {}".format(network, network_view))
+            if used is None:
+                used = {address_d.get("ipv4addr") for host in self.changed["record:host"].values() if host
+                        for address_d in host.get("ipv4addrs") or []}
+            free = next((str(ip) for ip in ipaddress.ip_network(network).hosts()
+                         if str(ip) not in used and not self.generated_address(int(ip))), None)
+            if free is None:
+                raise WapiError(400, "No available IP address in network {}".format(network))
+            address["ipv4addr"] = free
+            used.add(free)
+
+    def generated_address(self, ip:int) -> bool:
+        """
+        Is the address (an integer) that of a generated host which has not been changed?
+        """
+        index = ip - (10 << 24)
+        return 0 <= index < self.counts["record:host"] and index not in self.changed["record:host"]
+
+    def delete(self, path:str):
+        """"""
+        wapi_type, index = self.locate(path)
+        with self.lock:
+            if self.object(wapi_type, index) is None:
+                raise WapiError(404, "Reference {} not found".format(path))
+            self.changed[wapi_type][index] = None
+        return path
+
+    def request(self, operations:list) -> list:
+        """
+        Carry out the operations of a "request" in order.  As on the Grid Master, the
+        operations done before a failed one are rolled back.
+        """
+        with self.lock:
+            before = {wapi_type: dict(changed) for wapi_type, changed in self.changed.items()}
+        try:
+            return self.request_operations(operations)
+        except WapiError:
+            with self.lock:
+                for wapi_type, changed in self.changed.items():
+                    for index in set(changed) - set(before[wapi_type]):
+                        del changed[index]
+                    changed.update(before[wapi_type])
+            raise
+
+    def request_operations(self, operations:list) -> list:
+        """"""
+        results = list()
+        for operation_d in operations:
+            method = operation_d.get("method", "")
+            path = operation_d.get("object", "")
+            params = {name: str(value) for name, value in operation_d.get("args", {}).items()}
+            if method == "GET":
+                result = self.get(path, params)
+            elif method == "POST":
+                result = self.post(path, params, operation_d.get("data", {}))
+            elif method == "PUT":
+                result = self.put(path, operation_d.get("data", {}))
+            elif method == "DELETE":
+                result = self.delete(path)
+            else:
+                raise WapiError(400, "Invalid method: {}".format(method))
+            if not operation_d.get("discard"):
+                results.append(result)
+        return results
+
+    def fileop(self, function:str, data:dict):
+        """"""
+        if function == "downloadcomplete":
+            with self.lock:
+                self.files.pop(data.get("token", ""), None)
+            return {}
+        if function == "getgriddata":
+            file_name = "database.bak"
+            content = None
+        elif function == "csv_export":
+            wapi_type = data.get("_object", "")
+            file_name = "{}.csv".format(wapi_type.replace(":", "_"))
+            content = self.csv_export(wapi_type)
+        elif function == "uploadinit":
+            token = secrets.token_hex(16)
+            with self.lock:
+                self.uploads[token] = None
+            base_url = self.url.split("/wapi/")[0]
+            return {"token": token, "url": "{}/http_direct_file_io/req_id-UPLOAD-{}/import_file".format(base_url, token)}
+        elif function == "csv_import":
+            return {"csv_import_task": self.csv_import(data)}
+        else:
+            raise WapiError(400, "Function {} is not supported".format(function))
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.files[token] = content
+        base_url = self.url.split("/wapi/")[0]
+        return {"token": token, "url": "{}/http_direct_file_io/req_id-DOWNLOAD-{}/{}".format(base_url, token, file_name)}
+
+    def csv_import(self, data:dict) -> dict:
+        """
+        Insert the hostrecord rows (fqdn and addresses) of an uploaded CSV file and
+        return the csvimporttask, PENDING until it is read.
+        """
+        with self.lock:
+            content = self.uploads.pop(data.get("token", ""), None)
+        if content is None:
+            raise WapiError(400, "Upload token not found")
+        if data.get("operation", "INSERT") != "INSERT":
+            raise WapiError(400, "Operation {} is not supported".format(data.get("operation")))
+        fields = dict()
+        task = {"status": "COMPLETED", "lines_processed": 0, "lines_failed": 0, "lines_warning": 0}
+        for row in csv.reader(io.StringIO(content.decode("utf-8-sig"))):
+            if not row or not row[0]:
+                continue
+            row_type = row[0].lower()
+            if row_type.startswith("header-"):
+                fields.update({row_type[7:]: [field.rstrip("*") for field in row[1:]]})
+                continue
+            values = dict(zip(fields.get(row_type, []), row[1:]))
+            task["lines_processed"] += 1
+            try:
+                if row_type != "hostrecord":
+                    raise WapiError(400, "Type {} is not supported".format(row_type))
+                addresses = [{"ipv4addr": address} for address in values.get("addresses", "").split()]
+                self.post("record:host", {}, {"name": values.get("fqdn", ""), "ipv4addrs": addresses})
+            except WapiError:
+                task["lines_failed"] += 1
+                if data.get("on_error") == "STOP":
+                    task["status"] = "STOPPED"
+                    break
+        task.update({"end_time": int(time.time())})
+        with self.lock:
+            index = len(self.tasks)
+            self.tasks.append(task)
+        result = {"_ref": self.reference("csvimporttask", index, {"name": "import{}".format(index)})}
+        result.update(task, status="PENDING", end_time=None)
+        return result
+
+    def csv_export(self, wapi_type:str) -> bytes:
+        """
+        The objects of the type in the Infoblox CSV format.
+        """
+        if wapi_type not in FIELDS:
+            raise WapiError(400, "Unknown object type ({})".format(wapi_type))
+        csv_type = "hostrecord" if wapi_type == "record:host" else wapi_type
+        fields = ["fqdn*", "addresses"] if wapi_type == "record:host" else ["address*", "netmask*", "network_view", "comment"]
+        lines = [",".join(["header-"+csv_type] + fields)]
+        for index in range(self.end(wapi_type)):
+            wapi_object = self.object(wapi_type, index)
+            if wapi_object is None:
+                continue
+            if wapi_type == "record:host":
+                addresses = " ".join(address["ipv4addr"] for address in wapi_object["ipv4addrs"])
+                lines.append(",".join([csv_type, wapi_object["name"], addresses]))
+            else:
+                address, prefix = wapi_object["network"].split("/")
+                netmask = ".".join(str((0xFFFFFFFF << (32 - int(prefix)) >> shift) & 255) for shift in (24, 16, 8, 0))
+                lines.append(",".join([csv_type, address, netmask, wapi_object["network_view"], wapi_object["comment"]]))
+        return ("\n".join(lines) + "\n").encode()
+
+    def file_chunks(self, content, start:int, end:int):
+        """
+        Generate the bytes start to end of a file, the backup file if content is None.
+        """
+        if content is not None:
+            yield content[start:end]
+            return
+        position = start
+        while position < end:
+            offset = position % BLOCK_SIZE
+            chunk = self.block[offset:offset + min(BLOCK_SIZE - offset, end - position)]
+            yield chunk
+            position += len(chunk)
+
+    def backup_sha256(self) -> str:
+        """
+        The SHA-256 of the backup file served, to check a download against.
+        """
+        sha256 = hashlib.sha256()
+        for chunk in self.file_chunks(None, 0, self.backup_size):
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+
+class WapiHandler(BaseHTTPRequestHandler):
+    """
+    Answer the HTTP requests of a MockWapi (the class attribute wapi).
+    """
+    protocol_version = "HTTP/1.1"
+    wapi = None
+
+    def log_message(self, format, *args):
+        """"""
+
+    def send_json(self, status:int, body, headers=()):
+        """"""
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if self.wapi.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+            data = gzip.compress(data, compresslevel=6)
+            self.send_header("Content-Encoding", "gzip")
+        with self.wapi.lock:
+            self.wapi.bytes_sent += len(data)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status:int, text:str):
+        """
+        Send an error in the form the Grid Master uses.
+        """
+        self.send_json(status, {"Error": "AdmConProtoError: "+text, "code": "Client.Ibap.Proto", "text": text})
+
+    def authenticate(self) -> list:
+        """
+        Return the headers to send (a new session cookie after a basic authentication
+        login) or raise WapiError if the request is not authenticated.
+        """
+        cookie = self.headers.get("Cookie", "")
+        match = re.search(r"ibapauth=([^;]+)", cookie)
+        if match and match.group(1) in self.wapi.sessions:
+            return []
+        authorization = self.headers.get("Authorization", "")
+        if authorization.startswith("Basic "):
+            user, _, password = base64.b64decode(authorization[6:]).decode().partition(":")
+            if (user, password) == self.wapi.credentials:
+                session_id = secrets.token_hex(16)
+                with self.wapi.lock:
+                    self.wapi.sessions.add(session_id)
+                return [("Set-Cookie", "ibapauth={}; Path=/; HttpOnly".format(session_id))]
+        raise WapiError(401, "Authorization Required")
+
+    def handle_method(self, method:str):
+        """"""
+        wapi = self.wapi
+        with wapi.lock:
+            wapi.requests += 1
+            wapi.in_flight += 1
+            wapi.max_in_flight = max(wapi.max_in_flight, wapi.in_flight)
+        if wapi.latency:
+            time.sleep(wapi.latency)
+        with wapi.lock:
+            wapi.in_flight -= 1
+            failure = wapi.failures.pop(0) if wapi.failures else None
+        if failure is not None:
+            length = int(self.headers.get("Content-Length", 0) or 0)
+            if length:
+                self.rfile.read(length)
+            status, retry_after = failure
+            text = "Service unavailable" if status != 429 else "Too many requests"
+            headers = [("Retry-After", str(retry_after))] if retry_after is not None else []
+            return self.send_json(status, {"Error": "AdmConProtoError: "+text, "code": "Server.Busy", "text": text}, headers)
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        body = self.rfile.read(length) if length else b""
+        parts = urlsplit(self.path)
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+        try:
+            headers = self.authenticate()
+            if parts.path.startswith("/http_direct_file_io/"):
+                if method == "POST":
+                    return self.receive_file(parts.path, body, headers)
+                return self.send_file(parts.path, headers)
+            prefix = "/wapi/{}/".format(wapi.version)
+            if not parts.path.startswith(prefix):
+                raise WapiError(404, "Not found")
+            path = parts.path[len(prefix):]
+            data = json.loads(body) if body else {}
+            if path == "" and "_schema" in params:
+                result = {"requested_version": wapi.version[1:], "supported_objects": sorted(FIELDS),
+                          "supported_versions": [wapi.version[1:]]}
+            elif "_schema" in params:
+                result = wapi.schema(path)
+            elif path == "logout":
+                match = re.search(r"ibapauth=([^;]+)", self.headers.get("Cookie", ""))
+                with wapi.lock:
+                    wapi.sessions.discard(match.group(1) if match else "")
+                result = {}
+            elif method == "GET":
+                result = wapi.get(path, params)
+            elif method == "POST":
+                result = wapi.post(path, params, data)
+            elif method == "PUT":
+                result = wapi.put(path, data)
+            else:
+                result = wapi.delete(path)
+        except WapiError as e:
+            return self.send_error_json(e.status, e.message)
+        except ValueError as e:
+            return self.send_error_json(400, str(e))
+        self.send_json(201 if method == "POST" and (isinstance(result, str) or path in FIELDS) else 200, result, headers)
+
+    def receive_file(self, path:str, body:bytes, headers:list):
+        """
+        Keep the filedata part of an upload (multipart/form-data) for its token.
+        """
+        token = path.split("/")[2].rsplit("-", 1)[-1]
+        match = re.search(r"boundary=([^;]+)", self.headers.get("Content-Type", ""))
+        if match is None:
+            raise WapiError(400, "Expected a multipart/form-data upload")
+        content = None
+        for part in body.split(b"--"+match.group(1).encode()):
+            head, _, data = part.partition(b"\r\n\r\n")
+            if b'name="filedata"' in head:
+                content = data[:-2]
+        with self.wapi.lock:
+            if token not in self.wapi.uploads or content is None:
+                raise WapiError(400, "Upload token or file data not found")
+            self.wapi.uploads[token] = content
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def send_file(self, path:str, headers:list):
+        """
+        Send a file of a fileop, from the Range start when asked.
+        """
+        token = path.split("/")[2].rsplit("-", 1)[-1]
+        with self.wapi.lock:
+            if token not in self.wapi.files:
+                raise WapiError(404, "File not found")
+            content = self.wapi.files[token]
+        size = self.wapi.backup_size if content is None else len(content)
+        start = 0
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.send_header("Content-Range", "bytes */{}".format(size))
+                self.end_headers()
+                return
+        self.send_response(206 if match else 200)
+        self.send_header("Content-Type", "application/force-download")
+        self.send_header("Content-Length", str(size - start))
+        if match:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, size - 1, size))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        for chunk in self.wapi.file_chunks(content, start, size):
+            self.wfile.write(chunk)
+
+    def do_GET(self):
+        """"""
+        self.handle_method("GET")
+
+    def do_POST(self):
+        """"""
+        self.handle_method("POST")
+
+    def do_PUT(self):
+        """"""
+        self.handle_method("PUT")
+
+    def do_DELETE(self):
+        """"""
+        self.handle_method("DELETE")
+
+
+if __name__ == "__main__":
+    """"""
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve a mock WAPI on a local port.")
+    parser.add_argument("--hosts", type=int, default=1000, help="number of record:host objects")
+    parser.add_argument("--networks", type=int, default=100, help="number of network objects")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--compress", action="store_true", help="gzip JSON responses for clients accepting gzip")
+    args = parser.parse_args()
+
+    mock = MockWapi(hosts=args.hosts, networks=args.networks, latency=args.latency, port=args.port, compress=args.compress)
+    print("Serving", mock.start(), "as admin/infoblox")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
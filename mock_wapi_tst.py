@@ -0,0 +1,953 @@
+"""
+mock_wapi_tst - Unittests of a Connection against the mock_wapi module.
+
+These tests do not need a grid; a MockWapi is served on a local port.
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import requests
+from ib_rest import Connection, NotLoggedInException, WapiException
+from ib_rest.async_connection import AsyncConnection
+from ib_rest.__main__ import main
+from ib_rest.batch import operation
+from ib_rest.bulk import csv_export, csv_import, export_objects, upload, write_csv
+from ib_rest.chunk_store import ChunkStore
+from ib_rest.columnar import Columnar
+from ib_rest.decoder import PageDecoder
+from ib_rest.governor import RateLimiter, RetryPolicy
+from ib_rest.grid_backup import backup_all, force_download, fetch_backup_token, send_download_complete, store_download
+from ib_rest.mirror import Mirror
+from ib_rest.metrics import Instrumentation
+from ib_rest.mock_wapi import MockWapi
+from ib_rest.page_sizer import PageSizer
+from ib_rest.reconciler import desired_host, host_diff, reconcile
+from ib_rest.record_host import create_hosts_in_network, find_hosts
+from ib_rest.records import HostRecord, record_type
+from ib_rest.transport import Http2Transport, RequestsTransport
+from unittest import TestCase, TestSuite, makeSuite, TextTestRunner
+from unittest.mock import patch
+
+#
+# Test fixtures.
+#
+
+def logged_in(mock:MockWapi) -> Connection:
+    """
+    A Connection logged in to the mock WAPI.
+    """
+    ib_connection = Connection(mock.url, "")
+    ib_connection.login(*mock.credentials)
+    return ib_connection
+
+
+class FakeClock:
+    """
+    Stands in for the time module: sleeping only moves the clock on, and is recorded.
+    """
+    def __init__(self):
+        """"""
+        self.now = 1000.0
+        self.sleeps = list()
+
+    def monotonic(self) -> float:
+        """"""
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds:float):
+        """"""
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class MockTestCase(TestCase):
+    """
+    Each test is given its own MockWapi, as self.mock, so that the objects a test
+    changes are not seen by any other.
+    """
+    def setUp(self):
+        """"""
+        self.mock = MockWapi(hosts=2500, networks=10, backup_size=3*1024*1024+5)
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+
+
+class TestPaging(MockTestCase):
+    """"""
+    def test_get_paged(self):
+        """
+        Every host is returned once, in order, across pages.
+        """
+        hosts = logged_in(self.mock).get_paged("record:host", page_size=1000)
+        self.assertEqual(len(hosts), 2500)
+        self.assertEqual(hosts[1234]["name"], "host0001234.example.com")
+    def test_stream_filter(self):
+        """
+        A regular expression filter is applied across pages.
+        """
+        names = [host["name"] for host in logged_in(self.mock).stream("record:host", {"name~": "^host00001"}, page_size=30, prefetch=2)]
+        self.assertEqual(len(names), 100)
+    def test_prefetch_close(self):
+        """
+        Closing a prefetching stream early stops its fetcher thread, which fetches no
+        more pages.
+        """
+        before = set(threading.enumerate())
+        hosts = logged_in(self.mock).stream("record:host", page_size=10, prefetch=2)
+        self.assertEqual(next(hosts)["name"], "host0000000.example.com")
+        fetchers = [thread for thread in set(threading.enumerate()) - before if thread.name == "ib_rest-prefetch"]
+        self.assertEqual(len(fetchers), 1)
+        hosts.close()
+        fetchers[0].join(5)
+        self.assertFalse(fetchers[0].is_alive())
+        requests_after = self.mock.requests
+        time.sleep(0.2)
+        self.assertEqual(self.mock.requests, requests_after)
+        self.assertLess(requests_after, 10)
+    def test_prefetch_error(self):
+        """
+        A page failing on the fetcher thread raises WapiException to the consumer,
+        after the pages fetched before it.
+        """
+        hosts = logged_in(self.mock).stream("record:host", page_size=10, prefetch=2)
+        names = [next(hosts)["name"]]
+        self.mock.failures.append((503, None))
+        with self.assertRaises(WapiException) as context:
+            names.extend(host["name"] for host in hosts)
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(names, ["host{:07d}.example.com".format(index) for index in range(len(names))])
+        self.assertEqual(len(names) % 10, 0)
+    def test_too_large(self):
+        """
+        A query for more than _max_results objects without paging fails.
+        """
+        response = logged_in(self.mock).get("record:host")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Result set too large", response.text)
+    def test_instrumentation(self):
+        """
+        A paged query is recorded once, with the number of its pages.
+        """
+        records = list()
+        ib_connection = Connection(self.mock.url, "", instrumentation=Instrumentation(callbacks=[records.append]))
+        ib_connection.login(*self.mock.credentials)
+        records.clear()
+        ib_connection.get_paged("record:host", page_size=1000)
+        self.assertEqual([(record["call"], record["wapi_type"], record["pages"]) for record in records], [("get_paged", "record:host", 3)])
+    def test_page_sizer(self):
+        """
+        The page size grows while pages are quick, shrinks while they are slow and
+        stays below the bytes per page.
+        """
+        sizer = PageSizer(initial_size=100, min_size=20, max_size=1000, target_seconds=1.0)
+        self.assertEqual([sizer.update(sizer.size, 0.1, 0) for index in range(4)], [200, 400, 800, 1000])
+        self.assertEqual(sizer.update(1000, 4.0, 0), 500)
+        self.assertEqual(sizer.update(500, 1.25, 0), 400)
+        self.assertEqual(sizer.update(10, 0.1, 0), 400)
+        sizer = PageSizer(initial_size=100, max_page_bytes=50000)
+        self.assertEqual(sizer.update(100, 0.1, 100000), 50)
+        self.assertEqual(sizer.stats()["objects"], 100)
+    def test_page_sizer_too_large(self):
+        """
+        A page rejected as too large is requested again, smaller, and the size never
+        grows back past what the Grid Master accepted.
+        """
+        ib_connection = logged_in(self.mock)
+        self.mock.max_page_size = 150
+        try:
+            hosts = ib_connection.get_paged("record:host", page_size=PageSizer(initial_size=400, max_size=1000))
+        finally:
+            self.mock.max_page_size = 0
+        self.assertEqual([host["name"] for host in hosts], ["host{:07d}.example.com".format(index) for index in range(2500)])
+        stats = ib_connection.page_stats["record:host"]
+        self.assertEqual((stats["backoffs"], stats["max_size"]), (2, 100))
+        self.assertEqual(set(stats["sizes"]), {100})
+
+
+class TestScan(MockTestCase):
+    """"""
+    shards = [{"name~": r"^host000{}".format(digit)} for digit in range(3)]
+    def test_ordered(self):
+        """
+        Every host is generated once, shard by shard in order.
+        """
+        hosts = logged_in(self.mock).scan("record:host", self.shards, params={"_return_fields": "name"}, workers=3, page_size=100)
+        self.assertEqual([host["name"] for host in hosts], ["host{:07d}.example.com".format(index) for index in range(2500)])
+    def test_unordered(self):
+        """
+        Without order every host is still generated once.
+        """
+        hosts = logged_in(self.mock).scan("record:host", self.shards, workers=3, page_size=100, ordered=False)
+        self.assertEqual(sorted(host["name"] for host in hosts), ["host{:07d}.example.com".format(index) for index in range(2500)])
+    def test_buffer_bounded(self):
+        """
+        While the first shard is slow the later shards stop once buffer_pages of their
+        pages are held.
+        """
+        query = self.mock.query
+        queried = list()
+        def slow_query(wapi_type, filters, start, max_results):
+            """"""
+            queried.append(dict(filters).get("name~"))
+            if queried[-1] == self.shards[0]["name~"]:
+                time.sleep(0.02)
+            return query(wapi_type, filters, start, max_results)
+        with patch.object(self.mock, "query", slow_query):
+            hosts = list(logged_in(self.mock).scan("record:host", self.shards, workers=3, page_size=50, buffer_pages=2))
+        self.assertEqual(len(hosts), 2500)
+        last = len(queried) - queried[::-1].index(self.shards[0]["name~"])
+        self.assertLessEqual(sum(1 for shard in queried[:last] if shard != self.shards[0]["name~"]), 2+2)
+
+class TestAsync(MockTestCase):
+    """"""
+    def test_requests(self):
+        """
+        Gathered requests succeed with at most max_concurrency of them in flight, and
+        a paged query returns every host.
+        """
+        async def run():
+            """"""
+            async with AsyncConnection(self.mock.url, "", max_concurrency=3) as ib_connection:
+                await ib_connection.login(*self.mock.credentials)
+                self.assertTrue(ib_connection.isloggedin)
+                hosts = await ib_connection.get_paged("record:host", page_size=1000)
+                self.mock.latency = 0.05
+                self.mock.max_in_flight = 0
+                try:
+                    responses = await asyncio.gather(*[
+                        ib_connection.get("record:host", {"name": host["name"]}) for host in hosts[:12]])
+                finally:
+                    self.mock.latency = 0.0
+                with self.assertRaises(WapiException):
+                    await ib_connection.get_paged("range")
+            self.assertFalse(ib_connection.isloggedin)
+            return hosts, responses
+        hosts, responses = asyncio.run(run())
+        self.assertEqual(len(hosts), 2500)
+        self.assertEqual([response.json()[0]["name"] for response in responses], [host["name"] for host in hosts[:12]])
+        self.assertEqual(self.mock.max_in_flight, 3)
+    def test_not_logged_in(self):
+        """
+        Requests before the login raise NotLoggedInException.
+        """
+        with self.assertRaises(NotLoggedInException):
+            asyncio.run(AsyncConnection(self.mock.url, "").get("network"))
+
+
+class TestRecords(MockTestCase):
+    """"""
+    def test_records(self):
+        """
+        Paged objects can be decoded as records with the fields as attributes.
+        """
+        hosts = logged_in(self.mock).get_paged("record:host", page_size=1000, records=True)
+        self.assertEqual(len(hosts), 2500)
+        self.assertEqual(hosts[42].name, "host0000042.example.com")
+        self.assertEqual(hosts[42].ipv4addrs[0]["ipv4addr"], "10.0.0.42")
+        self.assertTrue(hosts[42].ref.startswith("record:host/"))
+    def test_named_fields(self):
+        """
+        Records made for the named fields hold only those fields.
+        """
+        networks = list(logged_in(self.mock).stream("network", page_size=3, fields="network", records=True))
+        self.assertEqual([network.network for network in networks][:2], ["10.0.0.0/24", "10.0.1.0/24"])
+        self.assertFalse(hasattr(networks[0], "comment"))
+        self.assertIs(type(networks[0]), record_type("network", "network"))
+        self.assertIs(record_type("network", "network, comment"), record_type("network", ["network", "comment"]))
+    def test_standard_library(self):
+        """
+        The standard library json gives the same records as the installed decoder.
+        """
+        ib_connection = Connection(self.mock.url, "", json_loads=json.loads)
+        ib_connection.login(*self.mock.credentials)
+        hosts = list(ib_connection.stream("record:host", {"name~": "^host000001"}, page_size=4, records=HostRecord))
+        self.assertEqual(len(hosts), 10)
+        self.assertEqual(hosts[3].view, "default")
+        installed = list(logged_in(self.mock).stream("record:host", {"name~": "^host000001"}, page_size=4, records=HostRecord))
+        self.assertEqual(installed, hosts)
+    def test_with_and_without_msgspec(self):
+        """
+        Pages decode to the same HostRecords whether or not msgspec is installed.
+        """
+        page = logged_in(self.mock).get("record:host", {"_paging": "1", "_return_as_object": "1", "_max_results": "5"}).content
+        with patch("ib_rest.decoder.msgspec", None):
+            without_msgspec = PageDecoder(HostRecord)
+            self.assertIsNone(without_msgspec.struct_decoder)
+            records = without_msgspec(page)["result"]
+        with_msgspec = PageDecoder(HostRecord)
+        for record in with_msgspec(page)["result"] + records:
+            self.assertIsInstance(record, HostRecord)
+        self.assertEqual(with_msgspec(page)["result"], records)
+        self.assertEqual(records[0].to_dict()["name"], "host0000000.example.com")
+
+
+class TestColumnar(MockTestCase):
+    """"""
+    def test_columns(self):
+        """
+        The named fields are collected in columns, IP addresses packed as integers.
+        """
+        columnar = logged_in(self.mock).get_paged("ipv4address", page_size=1000, fields="ip_address,status,names", columnar=True)
+        self.assertEqual(columnar.total, 2500)
+        self.assertEqual(columnar.columns["ip_address"].kind, "ip")
+        self.assertEqual(columnar.columns["ip_address"].values[260], (10 << 24) + 260)
+        self.assertEqual(columnar.column("ip_address")[260], "10.0.1.4")
+        self.assertEqual(next(columnar.rows())["names"], ["host0000000.example.com"])
+    def test_missing_values(self):
+        """
+        Missing values of packed columns are returned as None.
+        """
+        columnar = Columnar("ip_address,ttl", types={"ttl": "int"}, ref=False)
+        columnar.append_page([{"ip_address": "192.168.0.1", "ttl": 60}, {"ip_address": None}])
+        self.assertEqual(list(columnar.rows()), [{"ip_address": "192.168.0.1", "ttl": 60}, {"ip_address": None, "ttl": None}])
+    def test_mixed_values(self):
+        """
+        Kinds are taken from the whole first page, and a later value which does not
+        fit, an empty or IPv6 address included, turns the column into an object column.
+        """
+        columnar = Columnar("ipv4addr,ttl,aliases,comment", ref=False)
+        first_page = [{"ipv4addr": "10.0.0.1", "ttl": None, "aliases": None, "comment": "first"},
+                      {"ipv4addr": "10.0.0.2", "ttl": 60, "aliases": ["a.example.com"], "comment": 7}]
+        second_page = [{"ipv4addr": "", "ttl": 1.5, "aliases": None, "comment": None},
+                       {"ipv4addr": "2001:db8::1", "ttl": "60", "aliases": [], "comment": "last"}]
+        columnar.append_page(first_page)
+        self.assertEqual({name: column.kind for name, column in columnar.columns.items()},
+                         {"ipv4addr": "ip", "ttl": "int", "aliases": "object", "comment": "object"})
+        columnar.append_page(second_page)
+        self.assertEqual(columnar.columns["ipv4addr"].kind, "object")
+        self.assertEqual(list(columnar.rows()), first_page+second_page)
+        self.assertEqual(columnar.to_arrow().column("aliases").to_pylist(), [None, '["a.example.com"]', None, "[]"])
+        self.assertEqual(columnar.to_arrow().column("comment").to_pylist(), ["first", "7", None, "last"])
+    def test_field_spaces(self):
+        """
+        Spaces around the named fields are ignored.
+        """
+        columnar = Columnar("ip_address, status ,names", ref=False)
+        self.assertEqual(columnar.fields, ["ip_address", "status", "names"])
+
+
+class TestChanges(MockTestCase):
+    """"""
+    def test_batch(self):
+        """
+        Hosts created through the request object can be read back, changed and deleted.
+        """
+        ib_connection = logged_in(self.mock)
+        responses = ib_connection.multi([
+            operation("POST", "record:host", {"name": "new{}.example.com".format(index)}) for index in range(5)
+            ], chunk_size=2)
+        self.assertTrue(all(batch_response.ok for batch_response in responses))
+        reference = responses[0].result
+        self.assertEqual(ib_connection.get_by_reference(reference).json()["name"], "new0.example.com")
+        self.assertEqual(ib_connection.put(reference, {"comment": "changed"}).status_code, 200)
+        self.assertEqual(ib_connection.get("record:host", {"name": "new0.example.com"}).json()[0]["comment"], "changed")
+        self.assertEqual(ib_connection.delete(reference).status_code, 200)
+        self.assertEqual(ib_connection.get_by_reference(reference).status_code, 404)
+    def test_create_defaults(self):
+        """
+        A created object has every field, empty unless given, and no extensible attributes.
+        """
+        ib_connection = logged_in(self.mock)
+        reference = ib_connection.post("network", {"network": "10.8.0.0/24"}).json()
+        network = ib_connection.get_by_reference(reference).json()
+        self.assertEqual(network, {"_ref": reference, "network": "10.8.0.0/24", "network_view": "default", "comment": "", "extattrs": {}})
+    def test_create_hosts_in_network(self):
+        """
+        Hosts created in a network are given its next available addresses in turn; a
+        network which does not exist assigns none.
+        """
+        ib_connection = logged_in(self.mock)
+        names = ["alloc{}.example.com".format(index) for index in range(3)]
+        assigned = create_hosts_in_network(ib_connection, "10.0.9.0/24", names, chunk_size=2)
+        self.assertEqual(assigned, {name: "10.0.9.{}".format(196+index) for index, name in enumerate(names)})
+        self.assertEqual(create_hosts_in_network(ib_connection, "10.1.0.0/24", ["alloc9.example.com"]), {"alloc9.example.com": ""})
+        for name in names:
+            host = ib_connection.get("record:host", {"name": name}).json()[0]
+            self.assertEqual(host["ipv4addrs"][0]["ipv4addr"], assigned[name])
+            ib_connection.delete(host["_ref"])
+    def test_create_hosts_bad_name(self):
+        """
+        A host which cannot be created leaves the others in its chunk to be created once
+        each, with the next available addresses.
+        """
+        ib_connection = logged_in(self.mock)
+        names = ["alloc0.example.com", "", "alloc2.example.com"]
+        assigned = create_hosts_in_network(ib_connection, "10.0.9.0/24", names, chunk_size=3)
+        self.assertEqual(assigned, {"alloc0.example.com": "10.0.9.196", "": "", "alloc2.example.com": "10.0.9.197"})
+        for name in ["alloc0.example.com", "alloc2.example.com"]:
+            self.assertEqual(len(ib_connection.get("record:host", {"name": name}).json()), 1)
+    def test_unknown_field(self):
+        """
+        Creating an object with an unknown field fails.
+        """
+        response = logged_in(self.mock).post("network", {"network": "192.168.0.0/24", "colour": "blue"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestFindHosts(MockTestCase):
+    """"""
+    def test_strategies(self):
+        """
+        Every strategy finds the same hosts, the grouped ones in fewer requests.
+        """
+        ib_connection = logged_in(self.mock)
+        names = ["host{:07d}.example.com".format(index) for index in range(0, 3000, 7)]
+        names.extend(["HOST0000001.example.com.", "nothere.example.org"])
+        requests = dict()
+        for strategy in ("auto", "zone", "exact"):
+            requests_before = self.mock.requests
+            hosts = find_hosts(ib_connection, names, strategy=strategy)
+            requests.update({strategy: self.mock.requests - requests_before})
+            self.assertEqual(hosts["HOST0000001.example.com."]["name"], "host0000001.example.com")
+            self.assertIsNone(hosts["nothere.example.org"])
+            self.assertIsNone(hosts["host0002996.example.com"])
+            self.assertEqual(sum(1 for host in hosts.values() if host), len(range(0, self.mock.counts["record:host"], 7))+1)
+        self.assertLess(requests["auto"], requests["exact"])
+        self.assertLess(requests["zone"], requests["exact"])
+    def test_subdomain(self):
+        """
+        Hosts of a subdomain which is not a zone are found by every strategy.
+        """
+        ib_connection = logged_in(self.mock)
+        names = ["x{}.sub.example.com".format(index) for index in range(5)]
+        for name in names:
+            ib_connection.post("record:host", {"name": name, "zone": "example.com"})
+        for strategy in ("auto", "zone", "exact"):
+            hosts = find_hosts(ib_connection, names, strategy=strategy)
+            self.assertEqual([host["name"] for host in hosts.values() if host], names)
+
+
+class TestMirror(MockTestCase):
+    """"""
+    def test_sync_refs(self):
+        """
+        A refs sync picks up created and deleted hosts, which are then found locally.
+        """
+        ib_connection = logged_in(self.mock)
+        with tempfile.TemporaryDirectory() as folder:
+            with Mirror(os.path.join(folder, "mirror.db")) as mirror:
+                mirror.populate(ib_connection, "record:host")
+                mirror.sync(ib_connection, "network")
+                count = mirror.count("record:host")
+                self.assertEqual(mirror.find_ip("10.0.2.3")[0]["name"], "host0000515.example.com")
+                ib_connection.delete(mirror.find("record:host", "host0000007.example.com")[0]["_ref"])
+                ib_connection.post("record:host", {"name": "mirrored.example.com", "ipv4addrs": [{"ipv4addr": "10.0.2.250"}]})
+                result = mirror.sync(ib_connection, "record:host", "refs")
+                self.assertEqual((result["updated"], result["removed"]), (1, 1))
+                self.assertEqual(mirror.count("record:host"), count)
+                self.assertEqual(count, len(ib_connection.get_paged("record:host", {"_return_fields": "name"}, page_size=1000)))
+                self.assertEqual(mirror.find("record:host", "host0000007.example.com"), [])
+                self.assertEqual(mirror.find_ip("10.0.2.250")[0]["name"], "mirrored.example.com")
+                self.assertEqual([network["network"] for network in mirror.containing("10.0.2.250")], ["10.0.2.0/24"])
+    def test_sync_ea(self):
+        """
+        An ea sync fetches the hosts stamped since the last sync.
+        """
+        ib_connection = logged_in(self.mock)
+        reference = ib_connection.get("record:host", {"name": "host0000009.example.com"}).json()[0]["_ref"]
+        ib_connection.put(reference, {"extattrs": {"Changed": {"value": 100}}})
+        with tempfile.TemporaryDirectory() as folder:
+            with Mirror(os.path.join(folder, "mirror.db")) as mirror:
+                mirror.populate(ib_connection, "record:host", ea="Changed")
+                ib_connection.put(reference, {"comment": "stamped", "extattrs": {"Changed": {"value": 200}}})
+                result = mirror.sync(ib_connection, "record:host", "ea", ea="Changed")
+                self.assertEqual(result["updated"], 1)
+                self.assertEqual(mirror.get(reference)["comment"], "stamped")
+                self.assertEqual(mirror.state("record:host")["ea_value"], 200)
+
+
+class TestReconciler(MockTestCase):
+    """"""
+    def test_reconcile(self):
+        """
+        The plan creates, updates (one PUT per host) and deletes within the scope,
+        and a second pass finds nothing to do.
+        """
+        ib_connection = Connection(self.mock.url, "", thread_safe=True)
+        ib_connection.login(*self.mock.credentials)
+        for index in range(3):
+            ib_connection.post("record:host", {"name": "recon{}.example.com".format(index), "ipv4addrs": [{"ipv4addr": "172.16.0.{}".format(index)}]})
+        desired = [
+            desired_host({"name": "recon0.example.com", "addresses": ["172.16.0.0"]}),
+            desired_host({"name": "Recon1.example.com.", "addresses": "172.16.0.1;172.16.0.11", "ttl": 60, "comment": "cmdb"}),
+            desired_host({"name": "recon3.example.com", "addresses": ["172.16.0.3"], "ttl": 300})
+            ]
+        scope = {"name~": "^recon"}
+        result = reconcile(ib_connection, desired, scope, delete=True, dry_run=True)
+        self.assertEqual((result["create"], result["update"], result["delete"]), (1, 1, 1))
+        self.assertIn("    ipv4addrs: ['172.16.0.1'] -> ['172.16.0.1', '172.16.0.11']", str(result["plan"]))
+        self.assertEqual(sorted(result["plan"].actions[0]["data"]), ["comment", "ipv4addrs", "ttl", "use_ttl"])
+        requests_before = self.mock.requests
+        result = reconcile(ib_connection, desired, scope, delete=True)
+        self.assertTrue(result["result"])
+        self.assertEqual(self.mock.requests - requests_before, 2)
+        result = reconcile(ib_connection, desired, scope, delete=True, dry_run=True)
+        self.assertEqual(len(result["plan"]), 0)
+    def test_next_available_ip(self):
+        """
+        A host desired with a func:nextavailableip address is created with the next
+        free address and is not updated once created.
+        """
+        desired = desired_host({"name": "recon9.example.com", "addresses": ["func:nextavailableip:10.0.9.0/24,default"], "ttl": 0})
+        current = {"name": "recon9.example.com", "ipv4addrs": [{"ipv4addr": "10.0.9.7"}], "ttl": 0, "use_ttl": True}
+        self.assertEqual(host_diff(desired, current), {})
+        ib_connection = Connection(self.mock.url, "", thread_safe=True)
+        ib_connection.login(*self.mock.credentials)
+        scope = {"name~": "^recon"}
+        self.assertTrue(reconcile(ib_connection, [desired], scope)["result"])
+        host = ib_connection.get("record:host", {"name": "recon9.example.com"}).json()[0]
+        self.assertEqual(host["ipv4addrs"][0]["ipv4addr"], "10.0.9.196")
+        self.assertEqual(len(reconcile(ib_connection, [desired], scope, dry_run=True)["plan"]), 0)
+
+
+class TestDownload(MockTestCase):
+    """"""
+    def test_backup(self):
+        """
+        The backup is downloaded whole and its SHA-256 matches.
+        """
+        ib_connection = logged_in(self.mock)
+        token_d = fetch_backup_token(ib_connection)
+        self.assertTrue(token_d["result"])
+        with tempfile.TemporaryDirectory() as folder:
+            result = force_download(ib_connection, token_d["data"]["url"], folder+"/database.bak", chunk_size=64*1024)
+        self.assertTrue(send_download_complete(ib_connection, token_d["data"]["token"])["result"])
+        self.assertEqual(result["bytes"], self.mock.backup_size)
+        self.assertEqual(result["sha256"], self.mock.backup_sha256())
+    def test_resume(self):
+        """
+        A partial download is resumed with a Range request.
+        """
+        ib_connection = logged_in(self.mock)
+        token_d = fetch_backup_token(ib_connection)
+        with tempfile.TemporaryDirectory() as folder:
+            part = b"".join(self.mock.file_chunks(None, 0, 1000))
+            with open(folder+"/database.bak.part", "wb") as part_file:
+                part_file.write(part)
+            result = force_download(ib_connection, token_d["data"]["url"], folder+"/database.bak")
+        send_download_complete(ib_connection, token_d["data"]["token"])
+        self.assertEqual(result["sha256"], self.mock.backup_sha256())
+    def test_restart(self):
+        """
+        A partial file longer than the backup (416), or a 206 response not starting
+        at its end, restarts the download from the beginning.
+        """
+        ib_connection = logged_in(self.mock)
+        request = ib_connection._request
+        def whole_range(method, url, headers=None, **kwargs):
+            """"""
+            if headers and "Range" in headers:
+                headers = dict(headers, Range="bytes=0-")
+            return request(method, url, headers=headers, **kwargs)
+        for part_size, send in ((self.mock.backup_size+10, request), (1000, whole_range)):
+            token_d = fetch_backup_token(ib_connection)
+            with tempfile.TemporaryDirectory() as folder:
+                with open(folder+"/database.bak.part", "wb") as part_file:
+                    part_file.write(b"x"*part_size)
+                with patch.object(ib_connection, "_request", send):
+                    result = force_download(ib_connection, token_d["data"]["url"], folder+"/database.bak")
+            send_download_complete(ib_connection, token_d["data"]["token"])
+            self.assertTrue(result["result"])
+            self.assertEqual(result["bytes"], self.mock.backup_size)
+            self.assertEqual(result["sha256"], self.mock.backup_sha256())
+    def test_store_download(self):
+        """
+        A backup streamed into a chunk store is restored whole, and a second copy
+        adds no new chunks.
+        """
+        ib_connection = logged_in(self.mock)
+        with tempfile.TemporaryDirectory() as folder:
+            chunk_store = ChunkStore(folder)
+            results = list()
+            for name in ("first", "second"):
+                token_d = fetch_backup_token(ib_connection)
+                results.append(store_download(ib_connection, token_d["data"]["url"], chunk_store, name, chunk_size=64*1024))
+                send_download_complete(ib_connection, token_d["data"]["token"])
+            restored = chunk_store.restore("second", folder+"/database.bak")
+        self.assertTrue(results[0]["result"])
+        self.assertEqual(results[0]["sha256"], self.mock.backup_sha256())
+        self.assertEqual(results[1]["new_bytes"], 0)
+        self.assertEqual(restored["sha256"], self.mock.backup_sha256())
+    def test_store_restart(self):
+        """
+        A store_download resumed after the connection drops restarts from the beginning
+        when the 206 response does not start at the bytes already stored.
+        """
+        ib_connection = logged_in(self.mock)
+        request = ib_connection._request
+        drops = [True]
+        def dropping(method, url, headers=None, **kwargs):
+            """"""
+            if headers and "Range" in headers:
+                return request(method, url, headers=dict(headers, Range="bytes=0-"), **kwargs)
+            response = request(method, url, headers=headers, **kwargs)
+            chunks = response.iter_content
+            def iter_content(chunk_size=1):
+                """"""
+                for index, chunk in enumerate(chunks(chunk_size=chunk_size)):
+                    if index == 2 and drops:
+                        drops.pop()
+                        raise requests.exceptions.ConnectionError("Connection dropped")
+                    yield chunk
+            response.iter_content = iter_content
+            return response
+        token_d = fetch_backup_token(ib_connection)
+        with tempfile.TemporaryDirectory() as folder, patch.object(ib_connection, "_request", dropping):
+            result = store_download(ib_connection, token_d["data"]["url"], ChunkStore(folder), "backup", chunk_size=64*1024)
+        send_download_complete(ib_connection, token_d["data"]["token"])
+        self.assertTrue(result["result"])
+        self.assertEqual(result["attempts"], 2)
+        self.assertEqual(result["bytes"], self.mock.backup_size)
+        self.assertEqual(result["sha256"], self.mock.backup_sha256())
+    def test_backup_all(self):
+        """
+        The backups of two grids are downloaded concurrently, the retries being passed
+        to the download once per grid, and a grid whose login fails fails the run.
+        """
+        with MockWapi(hosts=10, backup_size=2*1024*1024+3) as other, tempfile.TemporaryDirectory() as folder:
+            grids = [{"name": name, "url": wapi.url, "user": wapi.credentials[0], "password": wapi.credentials[1],
+                      "backup_folder_path": os.path.join(folder, name)} for name, wapi in (("one", self.mock), ("two", other))]
+            with patch("ib_rest.grid_backup.force_download", wraps=force_download) as download_p:
+                report = backup_all(grids, workers=2, retries=5)
+            self.assertEqual([call.kwargs["retries"] for call in download_p.call_args_list], [5, 5])
+            self.assertTrue(report["result"])
+            self.assertEqual([grid["sha256"] for grid in report["grids"]], [self.mock.backup_sha256(), other.backup_sha256()])
+            self.assertEqual([grid["attempts"] for grid in report["grids"]], [1, 1])
+            self.assertEqual(report["bytes"], self.mock.backup_size + other.backup_size)
+            grids[1].update({"password": "wrong"})
+            report = backup_all(grids, workers=2)
+        self.assertFalse(report["result"])
+        self.assertEqual([grid["result"] for grid in report["grids"]], [True, False])
+
+
+class TestBulk(MockTestCase):
+    """"""
+    def test_export(self):
+        """
+        Exported networks are read back from the CSV file; an unknown type fails.
+        """
+        ib_connection = logged_in(self.mock)
+        with tempfile.TemporaryDirectory() as folder:
+            export_d = export_objects(ib_connection, "network", folder+"/networks.csv")
+            self.assertTrue(export_d["result"])
+            networks = list(export_d["objects"])
+            self.assertEqual(networks[0]["address"], "10.0.0.0")
+            self.assertFalse(export_objects(ib_connection, "range", folder+"/ranges.csv")["result"])
+    def test_import(self):
+        """
+        Hosts in an uploaded CSV file are created and the import task polled until it
+        has completed.
+        """
+        ib_connection = logged_in(self.mock)
+        rows = [{"fqdn": "bulk{}.example.com".format(index), "addresses": "10.9.0.{}".format(index)} for index in range(3)]
+        rows.append({"fqdn": "", "addresses": "10.9.0.9"})
+        with tempfile.TemporaryDirectory() as folder:
+            write_csv(folder+"/hosts.csv", "hostrecord", ["fqdn*", "addresses"], rows)
+            result = csv_import(ib_connection, folder+"/hosts.csv", poll_seconds=0.01)
+        self.assertFalse(result["result"])
+        self.assertEqual((result["task"]["status"], result["task"]["lines_processed"], result["task"]["lines_failed"]), ("COMPLETED", 4, 1))
+        host = ib_connection.get("record:host", {"name": "bulk2.example.com"}).json()[0]
+        self.assertEqual(host["ipv4addrs"], [{"ipv4addr": "10.9.0.2"}])
+    def test_no_token(self):
+        """
+        An export answered without a download token fails with a message.
+        """
+        with tempfile.TemporaryDirectory() as folder, patch.object(self.mock, "fileop", return_value={}):
+            result = csv_export(logged_in(self.mock), "network", folder+"/networks.csv")
+        self.assertFalse(result["result"])
+        self.assertIn("token", result["message"])
+    def test_upload_reauthenticate(self):
+        """
+        An upload refused because the session has ended is sent again whole after
+        logging in again.
+        """
+        ib_connection = logged_in(self.mock)
+        post = ib_connection.post
+        def post_then_expire(*args, **kwargs):
+            """"""
+            response = post(*args, **kwargs)
+            self.mock.sessions.clear()
+            return response
+        with tempfile.TemporaryDirectory() as folder:
+            rows = [{"fqdn": "bulk{}.example.com".format(index), "addresses": "10.9.0.{}".format(index)} for index in range(500)]
+            write_csv(folder+"/hosts.csv", "hostrecord", ["fqdn*", "addresses"], rows)
+            with patch.object(ib_connection, "post", post_then_expire):
+                result = upload(ib_connection, folder+"/hosts.csv")
+            with open(folder+"/hosts.csv", "rb") as csv_file:
+                content = csv_file.read()
+        self.assertTrue(result["result"])
+        self.assertEqual(self.mock.uploads[result["token"]], content)
+    def test_no_task(self):
+        """
+        An import answered without a csv_import_task fails with a message.
+        """
+        ib_connection = logged_in(self.mock)
+        with tempfile.TemporaryDirectory() as folder:
+            write_csv(folder+"/hosts.csv", "hostrecord", ["fqdn*", "addresses"], [])
+            with patch.object(self.mock, "csv_import", return_value=None):
+                result = csv_import(ib_connection, folder+"/hosts.csv", poll_seconds=0.01)
+        self.assertFalse(result["result"])
+        self.assertIn("csv_import_task", result["message"])
+
+
+class TestGovernor(MockTestCase):
+    """"""
+    def governed(self, clock:FakeClock, **kwargs) -> Connection:
+        """
+        A Connection logged in to the mock WAPI with the governor options, sleeping on clock.
+        """
+        ib_connection = Connection(self.mock.url, "", **kwargs)
+        ib_connection.login(*self.mock.credentials)
+        clock.sleeps.clear()
+        return ib_connection
+    def test_retry(self):
+        """
+        A GET answered 503 then 429 is retried after a backoff, then the Retry-After.
+        """
+        clock = FakeClock()
+        with patch("ib_rest.time", clock), patch("ib_rest.governor.time", clock):
+            ib_connection = self.governed(clock, retry=RetryPolicy(retries=3, backoff=1.0))
+            self.mock.failures.extend([(503, None), (429, 7)])
+            requests = self.mock.requests
+            response = ib_connection.get("network", {"network": "10.0.1.0/24"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.mock.requests - requests, 3)
+        self.assertEqual(len(clock.sleeps), 2)
+        self.assertTrue(0 <= clock.sleeps[0] <= 1.0)
+        self.assertEqual(clock.sleeps[1], 7.0)
+    def test_retries_exhausted(self):
+        """
+        After retries the last error is returned, and a POST is not retried.
+        """
+        clock = FakeClock()
+        with patch("ib_rest.time", clock), patch("ib_rest.governor.time", clock):
+            ib_connection = self.governed(clock, retry=RetryPolicy(retries=2, backoff=1.0, max_backoff=1.5))
+            self.mock.failures.extend([(503, None)]*3)
+            self.assertEqual(ib_connection.get("network").status_code, 503)
+            self.assertEqual(len(clock.sleeps), 2)
+            self.assertTrue(all(0 <= seconds <= 1.5 for seconds in clock.sleeps))
+            self.mock.failures.append((503, 1))
+            self.assertEqual(ib_connection.post("network", {"network": "10.7.0.0/24"}).status_code, 503)
+            self.assertEqual(len(clock.sleeps), 2)
+    def test_rate_limiter(self):
+        """
+        Requests beyond the burst wait for the rate.
+        """
+        clock = FakeClock()
+        with patch("ib_rest.governor.time", clock):
+            rate_limiter = RateLimiter(rate=10, burst=2)
+            ib_connection = self.governed(clock, rate_limiter=rate_limiter)
+            clock.now += 1.0
+            for index in range(6):
+                self.assertEqual(ib_connection.get("network").status_code, 200)
+        self.assertEqual(len(clock.sleeps), 4)
+        self.assertTrue(all(abs(seconds - 0.1) < 1e-9 for seconds in clock.sleeps))
+
+
+class TestSession(MockTestCase):
+    """"""
+    def test_reauthenticate(self):
+        """
+        A Connection whose session has ended logs in again.
+        """
+        ib_connection = logged_in(self.mock)
+        self.mock.sessions.clear()
+        self.assertEqual(ib_connection.get_paged("network", page_size=5)[0]["network"], "10.0.0.0/24")
+    def test_refused(self):
+        """
+        Paging without a session raises WapiException.
+        """
+        ib_connection = logged_in(self.mock)
+        ib_connection._credentials = None
+        self.mock.sessions.clear()
+        with self.assertRaises(WapiException):
+            ib_connection.get_paged("network")
+    def test_threads(self):
+        """
+        A thread safe Connection pages from several threads at once, each thread
+        getting its own hosts and page count, and keeps the last response of each
+        thread, though they all made requests since.
+        """
+        records = list()
+        ib_connection = Connection(self.mock.url, "", thread_safe=True, instrumentation=Instrumentation(callbacks=[records.append]))
+        ib_connection.login(*self.mock.credentials)
+        records.clear()
+        barrier = threading.Barrier(3)
+        results = dict()
+        def page(index):
+            """"""
+            barrier.wait()
+            hosts = ib_connection.get_paged("record:host", {"name~": "^host000{}".format(index)}, page_size=100*(index+1))
+            ib_connection.get("record:host", {"name": hosts[42]["name"]})
+            barrier.wait()
+            results[index] = (hosts, ib_connection.response.json())
+        self.mock.latency = 0.01
+        try:
+            threads = [threading.Thread(target=page, args=(index,)) for index in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.mock.latency = 0.0
+        self.assertEqual([len(results[index][0]) for index in range(3)], [1000, 1000, 500])
+        for index in range(3):
+            hosts, found = results[index]
+            self.assertTrue(all(host["name"].startswith("host000{}".format(index)) for host in hosts))
+            self.assertEqual(found, [hosts[42]])
+        pages = [len(results[index][0]) // (100*(index+1)) + 1 for index in range(3)]
+        self.assertEqual(sorted(record["pages"] for record in records if record["call"] == "get_paged"), sorted(pages))
+
+
+class TestTransport(MockTestCase):
+    """"""
+    def test_compressed(self):
+        """
+        Compressed pages decode to the same hosts in a fraction of the bytes.
+        """
+        identity = Connection(self.mock.url, "", transport=RequestsTransport(compress=False))
+        identity.login(*self.mock.credentials)
+        self.mock.compress = True
+        try:
+            sent = self.mock.bytes_sent
+            hosts = identity.get_paged("record:host", page_size=1000)
+            identity_bytes = self.mock.bytes_sent - sent
+            sent = self.mock.bytes_sent
+            compressed_hosts = logged_in(self.mock).get_paged("record:host", page_size=1000)
+            compressed_bytes = self.mock.bytes_sent - sent
+        finally:
+            self.mock.compress = False
+        self.assertEqual(compressed_hosts, hosts)
+        self.assertLess(compressed_bytes*4, identity_bytes)
+    def test_http2_transport(self):
+        """
+        A thread safe Connection pages, writes and downloads through httpx.
+        """
+        ib_connection = Connection(self.mock.url, "", transport=Http2Transport(), thread_safe=True)
+        ib_connection.login(*self.mock.credentials)
+        pages = ib_connection.get_paged("record:host", {"name~": "^host000001"}, page_size=3)
+        self.assertEqual(len(pages), 10)
+        self.assertEqual(ib_connection.put(pages[0]["_ref"], {"comment": "http2"}).status_code, 200)
+        token_d = fetch_backup_token(ib_connection)
+        with tempfile.TemporaryDirectory() as folder:
+            result = force_download(ib_connection, token_d["data"]["url"], folder+"/database.bak")
+        send_download_complete(ib_connection, token_d["data"]["token"])
+        self.assertEqual(result["sha256"], self.mock.backup_sha256())
+        ib_connection.logout()
+        self.assertEqual(ib_connection.response.status_code, 200)
+
+
+class TestCommandLine(MockTestCase):
+    """"""
+    def run_main(self, argv:list, environment:dict) -> tuple:
+        """
+        Run the command line with the environment and return its exit status, output
+        and error output.
+        """
+        output = io.StringIO()
+        errors = io.StringIO()
+        with patch.dict(os.environ, environment), contextlib.redirect_stdout(output), contextlib.redirect_stderr(errors):
+            status = main(argv)
+        return status, output.getvalue(), errors.getvalue()
+    def test_hosts(self):
+        """
+        hosts prints the hosts found and the names missing, reusing the session of the
+        first run in the second.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            environment = {"IB_REST_URL": self.mock.url, "IB_REST_USER": self.mock.credentials[0],
+                           "IB_REST_PASSWORD": self.mock.credentials[1], "IB_REST_CACHE": folder}
+            status, output, errors = self.run_main(["hosts", "host0000042.example.com", "--fields", "comment"], environment)
+            self.assertEqual(status, 0)
+            self.assertEqual(json.loads(output)["hosts"]["host0000042.example.com"]["comment"], "")
+            requests_before = self.mock.requests
+            status, output, errors = self.run_main(["hosts", "missing.example.com"], environment)
+            self.assertEqual(status, 1)
+            self.assertEqual(json.loads(output)["missing"], ["missing.example.com"])
+            self.assertEqual(self.mock.requests - requests_before, 1)
+    def test_backup(self):
+        """
+        backup prints only its result, as JSON, and saves the whole backup.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            environment = {"IB_REST_URL": self.mock.url, "IB_REST_USER": self.mock.credentials[0],
+                           "IB_REST_PASSWORD": self.mock.credentials[1], "IB_REST_CACHE": folder}
+            status, output, errors = self.run_main(["backup", folder+"/backups"], environment)
+            result = json.loads(output)
+        self.assertEqual(status, 0)
+        self.assertEqual(result["bytes"], self.mock.backup_size)
+        self.assertEqual(result["sha256"], self.mock.backup_sha256())
+    def test_config_file(self):
+        """
+        A config file with a password is refused unless only its owner can read it.
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            config_path = folder+"/config.ini"
+            with open(config_path, "w") as config_file:
+                config_file.write("[lab]\nurl = {}\nuser = {}\npassword = {}\n".format(self.mock.url, *self.mock.credentials))
+            os.chmod(config_path, 0o644)
+            environment = {"IB_REST_CONFIG": config_path, "IB_REST_CACHE": folder}
+            self.assertEqual(self.run_main(["--grid", "lab", "export", "network", folder+"/networks.csv"], environment)[0], 2)
+            os.chmod(config_path, 0o600)
+            self.assertEqual(self.run_main(["--grid", "lab", "export", "network", folder+"/networks.csv"], environment)[0], 0)
+            with open(folder+"/networks.csv") as csv_file:
+                self.assertEqual(len(csv_file.readlines()), 11)
+    def test_errors(self):
+        """
+        A timeout which is not a number, or a grid which cannot be reached, is reported
+        as a message with exit status 2.
+        """
+        with MockWapi(hosts=1) as other:
+            unreachable_url = other.url
+        with tempfile.TemporaryDirectory() as folder:
+            environment = {"IB_REST_URL": self.mock.url, "IB_REST_USER": self.mock.credentials[0],
+                           "IB_REST_PASSWORD": self.mock.credentials[1], "IB_REST_CACHE": folder, "IB_REST_TIMEOUT": "ten"}
+            status, output, errors = self.run_main(["hosts", "host0000042.example.com"], environment)
+            self.assertEqual((status, output), (2, ""))
+            self.assertIn("'ten' is not a number", errors)
+            environment.update({"IB_REST_URL": unreachable_url, "IB_REST_TIMEOUT": "5"})
+            status, output, errors = self.run_main(["hosts", "host0000042.example.com"], environment)
+            self.assertEqual((status, output), (2, ""))
+            self.assertIn("Cannot connect to "+unreachable_url, errors)
+
+#
+# Run the test cases as a suite.
+#
+
+def suite():
+    """
+    Gather all the tests from this module in a test suite.
+    """
+    test_suite = TestSuite()
+    test_suite.addTest(makeSuite(TestPaging))
+    test_suite.addTest(makeSuite(TestScan))
+    test_suite.addTest(makeSuite(TestAsync))
+    test_suite.addTest(makeSuite(TestRecords))
+    test_suite.addTest(makeSuite(TestColumnar))
+    test_suite.addTest(makeSuite(TestChanges))
+    test_suite.addTest(makeSuite(TestFindHosts))
+    test_suite.addTest(makeSuite(TestMirror))
+    test_suite.addTest(makeSuite(TestReconciler))
+    test_suite.addTest(makeSuite(TestDownload))
+    test_suite.addTest(makeSuite(TestBulk))
+    test_suite.addTest(makeSuite(TestGovernor))
+    test_suite.addTest(makeSuite(TestSession))
+    test_suite.addTest(makeSuite(TestTransport))
+    test_suite.addTest(makeSuite(TestCommandLine))
+    return test_suite
+
+mySuite=suite()
+
+runner=TextTestRunner()
+
+
+if __name__ == "__main__":
+    """"""
+    runner.run(mySuite)
@@ -0,0 +1,132 @@
+"""
+object_cache - least recently used cache of WAPI objects read by reference.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ObjectCache:
+    """
+    Cache the responses of Connection.get_by_reference by the object reference (_ref)
+    and the request parameters, such as _return_fields.
+
+    Entries expire ttl seconds after they are stored and, once maxsize entries are
+    held, the least recently used entry is evicted.  A Connection with an ObjectCache
+    invalidates every entry of a reference when it is updated (put) or deleted, both
+    before the request is sent and after its response arrives, so reads stay
+    consistent with writes made through that Connection.  Each invalidation starts a
+    new generation, and a read started before the last invalidation of its reference
+    is not cached, so a read racing a write on another thread cannot cache the old
+    object.  The last invalidation of at most maxsize references is kept; a read
+    started before an invalidation which has since been forgotten is not cached either.
+    """
+    def __init__(self, maxsize=1024, ttl=300):
+        """"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.references = dict()
+        self.invalidations = OrderedDict()
+        self.invalidation_count = 0
+        self.forgotten = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(reference:str, params:dict) -> tuple:
+        """
+        The cache key for the reference read with these parameters.
+        """
+        return (reference, tuple(sorted((str(name), str(value)) for name, value in params.items())))
+
+    def get(self, reference:str, params={}):
+        """
+        Return the cached response or None if missing or expired.
+        """
+        key = self.key(reference, params)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.monotonic() > entry[0]:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self, reference:str) -> int:
+        """
+        The current generation, the number of invalidations so far, to pass to set.
+        """
+        with self.lock:
+            return self.invalidation_count
+
+    def set(self, reference:str, params:dict, response, generation=None):
+        """
+        Cache the response for the reference read with these parameters, unless the
+        reference has been invalidated since generation, taken before the read.
+        """
+        key = self.key(reference, params)
+        with self.lock:
+            if generation is not None and self.invalidations.get(reference, self.forgotten) > generation:
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, response)
+            self.references.setdefault(reference, set()).add(key)
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key:tuple):
+        """
+        Remove one entry; the lock must be held.
+        """
+        del self.entries[key]
+        keys = self.references.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.references[key[0]]
+
+    def invalidate(self, reference:str):
+        """
+        Remove every cached read of the reference.
+        """
+        with self.lock:
+            self.invalidation_count += 1
+            self.invalidations[reference] = self.invalidation_count
+            self.invalidations.move_to_end(reference)
+            while len(self.invalidations) > self.maxsize:
+                self.forgotten = self.invalidations.popitem(last=False)[1]
+            for key in list(self.references.get(reference, ())):
+                self._remove(key)
+
+    def clear(self):
+        """
+        Remove every entry; the counters are kept.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.references.clear()
+
+    def stats(self) -> dict:
+        """
+        Return the hit, miss, eviction and expiration counters and the current size.
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self.entries)
+                }
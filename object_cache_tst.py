@@ -0,0 +1,129 @@
+"""
+object_cache_tst - Unittests for the object_cache module.
+
+These tests do not need a WAPI; the cached responses are stand in objects.
+"""
+import time
+from ib_rest.object_cache import ObjectCache
+from unittest import TestCase, TestSuite, makeSuite, TextTestRunner
+
+#
+# Test fixtures.
+#
+
+host_reference = "record:host/ZG5zLmhvc3QkLjEwLmNvbS5jb21wYW55LmRkaS1ob3N0MzA:ddi-host30.company.com/default"
+network_reference = "network/ZG5zLm5ldHdvcmskMS4wLjQuMC8yNC8w:1.0.4.0/24/default"
+ttl_fields = {"_return_fields": "ttl,comment"}
+data_fields = {"_return_fields": "ipv4addrs"}
+
+
+class TestHitMiss(TestCase):
+    """"""
+    def test_miss_then_hit(self):
+        """
+        A read which has not been cached is a miss, once cached it is a hit.
+        """
+        object_cache = ObjectCache()
+        self.assertIsNone(object_cache.get(host_reference, ttl_fields))
+        object_cache.set(host_reference, ttl_fields, "host30 ttl")
+        self.assertEqual(object_cache.get(host_reference, ttl_fields), "host30 ttl")
+        self.assertEqual(object_cache.stats()["hits"], 1)
+        self.assertEqual(object_cache.stats()["misses"], 1)
+    def test_return_fields_in_key(self):
+        """
+        The same reference read with different return fields is cached separately.
+        """
+        object_cache = ObjectCache()
+        object_cache.set(host_reference, ttl_fields, "host30 ttl")
+        self.assertIsNone(object_cache.get(host_reference, data_fields))
+
+
+class TestEviction(TestCase):
+    """"""
+    def test_least_recently_used(self):
+        """
+        Once full the least recently used entry is evicted.
+        """
+        object_cache = ObjectCache(maxsize=2)
+        object_cache.set(host_reference, ttl_fields, "host30 ttl")
+        object_cache.set(host_reference, data_fields, "host30 data")
+        object_cache.get(host_reference, ttl_fields)
+        object_cache.set(network_reference, {}, "network")
+        self.assertIsNone(object_cache.get(host_reference, data_fields))
+        self.assertEqual(object_cache.get(host_reference, ttl_fields), "host30 ttl")
+        self.assertEqual(object_cache.stats()["evictions"], 1)
+    def test_expired(self):
+        """
+        An entry older than the ttl is not returned.
+        """
+        object_cache = ObjectCache(ttl=0.01)
+        object_cache.set(host_reference, ttl_fields, "host30 ttl")
+        time.sleep(0.02)
+        self.assertIsNone(object_cache.get(host_reference, ttl_fields))
+        self.assertEqual(object_cache.stats()["expirations"], 1)
+
+
+class TestInvalidate(TestCase):
+    """"""
+    def test_invalidate_reference(self):
+        """
+        Invalidating a reference removes every cached read of it and nothing else.
+        """
+        object_cache = ObjectCache()
+        object_cache.set(host_reference, ttl_fields, "host30 ttl")
+        object_cache.set(host_reference, data_fields, "host30 data")
+        object_cache.set(network_reference, {}, "network")
+        object_cache.invalidate(host_reference)
+        self.assertIsNone(object_cache.get(host_reference, ttl_fields))
+        self.assertIsNone(object_cache.get(host_reference, data_fields))
+        self.assertEqual(object_cache.get(network_reference, {}), "network")
+        self.assertEqual(object_cache.stats()["size"], 1)
+    def test_stale_read(self):
+        """
+        A read started before the reference was invalidated is not cached.
+        """
+        object_cache = ObjectCache()
+        generation = object_cache.generation(host_reference)
+        object_cache.invalidate(host_reference)
+        object_cache.set(host_reference, ttl_fields, "host30 before put", generation)
+        self.assertIsNone(object_cache.get(host_reference, ttl_fields))
+        object_cache.set(host_reference, ttl_fields, "host30 after put", object_cache.generation(host_reference))
+        self.assertEqual(object_cache.get(host_reference, ttl_fields), "host30 after put")
+    def test_invalidations_bounded(self):
+        """
+        Only the last invalidations of maxsize references are kept, and a read started
+        before a forgotten invalidation is still not cached.
+        """
+        object_cache = ObjectCache(maxsize=10)
+        generation = object_cache.generation(host_reference)
+        object_cache.invalidate(host_reference)
+        for index in range(100):
+            object_cache.invalidate("network/{}".format(index))
+        self.assertEqual(len(object_cache.invalidations), 10)
+        object_cache.set(host_reference, ttl_fields, "host30 before put", generation)
+        self.assertIsNone(object_cache.get(host_reference, ttl_fields))
+        object_cache.set(host_reference, ttl_fields, "host30 after put", object_cache.generation(host_reference))
+        self.assertEqual(object_cache.get(host_reference, ttl_fields), "host30 after put")
+
+#
+# Run the test cases as a suite.
+#
+
+def suite():
+    """
+    Gather all the tests from this module in a test suite.
+    """
+    test_suite = TestSuite()
+    test_suite.addTest(makeSuite(TestHitMiss))
+    test_suite.addTest(makeSuite(TestEviction))
+    test_suite.addTest(makeSuite(TestInvalidate))
+    return test_suite
+
+mySuite=suite()
+
+runner=TextTestRunner()
+
+
+if __name__ == "__main__":
+    """"""
+    runner.run(mySuite)
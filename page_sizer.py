@@ -0,0 +1,96 @@
+"""
+page_sizer - adapt the _max_results of a paged WAPI query to a target time per page.
+"""
+
+
+class PageSizer:
+    """
+    Choose the page size (_max_results) for each page of a paged query.
+
+    After each page the size is scaled by the ratio of target_seconds to the time the
+    page took, at most doubling or halving per page and kept within min_size and
+    max_size.  When max_page_bytes is set the size is also kept below the number of
+    objects expected to fill that many bytes.  When the Grid Master rejects a page as
+    too large the page is requested again with the largest size which has succeeded
+    (or half the size if none has) and that size becomes the new ceiling.
+
+    Pass an instance (or "auto" for the defaults) as the page_size of
+    Connection.get_paged or Connection.stream; the chosen sizes are recorded in
+    Connection.page_stats under the WAPI type.
+    """
+    too_large_texts = ("result set too large", "too many results")
+
+    def __init__(self, initial_size=100, min_size=20, max_size=1000, target_seconds=1.0, max_page_bytes=0):
+        """"""
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.max_page_bytes = max_page_bytes
+        self.size = min(max(initial_size, min_size), max_size)
+        self.pages = 0
+        self.objects = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.backoffs = 0
+        self.largest_good = 0
+        self.sizes = dict()
+
+    def update(self, count:int, seconds:float, size_bytes:int) -> int:
+        """
+        Record a page of count objects which took seconds and size_bytes to fetch.
+        Return the size to request for the next page.
+        """
+        self.pages += 1
+        self.objects += count
+        self.seconds += seconds
+        self.bytes += size_bytes
+        self.sizes[self.size] = self.sizes.get(self.size, 0) + 1
+        self.largest_good = max(self.largest_good, self.size)
+        if count < self.size or count == 0:
+            return self.size
+        factor = self.target_seconds / seconds if seconds > 0 else 2.0
+        new_size = int(self.size * min(max(factor, 0.5), 2.0))
+        if self.max_page_bytes and size_bytes:
+            new_size = min(new_size, int(self.max_page_bytes * count / size_bytes))
+        self.size = min(max(new_size, self.min_size), self.max_size)
+        return self.size
+
+    def istoolarge(self, response) -> bool:
+        """
+        Did the Grid Master reject the page because too many results were requested?
+        """
+        if response.status_code != 400:
+            return False
+        text = response.text.lower()
+        return any(too_large_text in text for too_large_text in self.too_large_texts)
+
+    def shrink(self):
+        """
+        Lower the page size, and the ceiling, after a too large error.  Return the new
+        size or None if already at the minimum.
+        """
+        if self.size <= self.min_size:
+            return None
+        self.backoffs += 1
+        if 0 < self.largest_good < self.size:
+            self.size = self.largest_good
+        else:
+            self.size = max(self.min_size, self.size // 2)
+        self.max_size = self.size
+        return self.size
+
+    def stats(self) -> dict:
+        """
+        Return the page sizes chosen, as {size: pages}, with the totals measured.
+        """
+        return {
+            "size": self.size,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "pages": self.pages,
+            "objects": self.objects,
+            "seconds": self.seconds,
+            "bytes": self.bytes,
+            "backoffs": self.backoffs,
+            "sizes": dict(self.sizes)
+            }
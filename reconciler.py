@@ -0,0 +1,256 @@
+"""
+reconciler - bring the record:host objects of the grid to a desired state in one pass.
+"""
+import csv
+from concurrent.futures import ThreadPoolExecutor
+from ib_rest.batch import operation
+from ib_rest.record_host import format_host, format_host_data
+
+#
+# The record:host fields read to compare with the desired state.
+#
+
+RETURN_FIELDS = "name,view,ipv4addrs,ttl,use_ttl,comment,extattrs"
+
+
+def normalize_name(name: str) -> str:
+    """"""
+    return name.strip().rstrip(".").lower()
+
+
+def desired_host(host: dict) -> dict:
+    """
+    Check and normalize one desired host: name and addresses (or data, as for
+    create_host) are required; view defaults to default; ttl, comment and extattrs
+    are only managed when given.  Addresses may include func:nextavailableip values,
+    which only apply when the host is created: the addresses of an existing host
+    with one are left as they are.
+    """
+    if not host.get("name"):
+        raise ValueError("A desired host has no name: {}".format(host))
+    addresses = host.get("addresses", host.get("data"))
+    if isinstance(addresses, str):
+        addresses = addresses.replace(";", " ").replace(",", " ").split()
+    if not addresses:
+        raise ValueError("The desired host {} has no addresses.".format(host["name"]))
+    host_d = {"name": normalize_name(host["name"]), "view": host.get("view") or "default", "addresses": list(addresses)}
+    if host.get("ttl") not in (None, ""):
+        host_d.update({"ttl": int(host["ttl"])})
+    if host.get("comment") is not None:
+        host_d.update({"comment": host["comment"]})
+    if host.get("extattrs"):
+        host_d.update({"extattrs": dict(host["extattrs"])})
+    return host_d
+
+
+def load_yaml(file_path: str) -> list:
+    """
+    Read the desired hosts from a YAML file holding a list of hosts, or a mapping
+    with the list under hosts.  Requires PyYAML.
+    """
+    import yaml
+    with open(file_path) as yaml_file:
+        loaded = yaml.safe_load(yaml_file)
+    hosts = loaded.get("hosts", []) if isinstance(loaded, dict) else loaded
+    return [desired_host(host) for host in hosts or []]
+
+
+def load_csv(file_path: str) -> list:
+    """
+    Read the desired hosts from a CSV file with a header row naming the columns name,
+    addresses (separated by spaces or semicolons) and optionally view, ttl, comment
+    and ea:<name> columns for extensible attributes.  Empty cells are not managed.
+    """
+    hosts = list()
+    with open(file_path, newline="", encoding="utf-8-sig") as csv_file:
+        for row in csv.DictReader(csv_file):
+            host = {name: value for name, value in row.items() if not name.startswith("ea:")}
+            if not host.get("comment"):
+                host.pop("comment", None)
+            extattrs = {name[3:]: value for name, value in row.items() if name.startswith("ea:") and value}
+            if extattrs:
+                host.update({"extattrs": extattrs})
+            hosts.append(desired_host(host))
+    return hosts
+
+
+def host_diff(desired: dict, current: dict) -> dict:
+    """
+    Return the fields to PUT to make the current record:host match the desired host,
+    as one dict, empty when they already match.  The addresses are not compared when
+    any is a func: value, which never equals the address it was given.
+    """
+    changes = dict()
+    current_addresses = sorted(address.get("ipv4addr", "") for address in current.get("ipv4addrs", []))
+    assigned = any(address.startswith("func:") for address in desired["addresses"])
+    if not assigned and sorted(desired["addresses"]) != current_addresses:
+        changes.update({"ipv4addrs": format_host_data(desired["addresses"])})
+    if "ttl" in desired and (desired["ttl"] != current.get("ttl") or not current.get("use_ttl")):
+        changes.update({"ttl": desired["ttl"], "use_ttl": True})
+    if "comment" in desired and desired["comment"] != current.get("comment", ""):
+        changes.update({"comment": desired["comment"]})
+    if "extattrs" in desired:
+        current_extattrs = current.get("extattrs") or {}
+        if any(str(current_extattrs.get(name, {}).get("value")) != str(value) for name, value in desired["extattrs"].items()):
+            extattrs = {name: {"value": extattr.get("value")} for name, extattr in current_extattrs.items()}
+            extattrs.update({name: {"value": value} for name, value in desired["extattrs"].items()})
+            changes.update({"extattrs": extattrs})
+    return changes
+
+
+class Plan:
+    """
+    The actions which bring the grid to the desired state: creates, updates (one PUT
+    of every changed field per host) and, when asked for, deletes of the hosts in
+    scope which are not desired.  Each action is a dict of action, name, view, ref
+    (for updates and deletes), data (the body sent) and, for updates, the current
+    values of the changed fields as before.
+    """
+    def __init__(self):
+        """"""
+        self.actions = list()
+
+    def add(self, action: str, host: dict, ref="", data=None, before=None):
+        """"""
+        self.actions.append({
+            "action": action,
+            "name": host["name"],
+            "view": host.get("view", "default"),
+            "ref": ref,
+            "data": data or {},
+            "before": before or {}
+            })
+
+    def counts(self) -> dict:
+        """"""
+        counts = {"create": 0, "update": 0, "delete": 0}
+        for action in self.actions:
+            counts[action["action"]] += 1
+        return counts
+
+    def __len__(self):
+        """"""
+        return len(self.actions)
+
+    def shown(self, field: str, value):
+        """
+        A field value as shown in the plan, host addresses as a list of addresses.
+        """
+        if field == "ipv4addrs" and value:
+            return [address.get("ipv4addr") for address in value]
+        return value
+
+    def __str__(self):
+        """
+        The plan as text, one line per host and changed field.
+        """
+        lines = list()
+        for action in self.actions:
+            if action["action"] == "create":
+                addresses = [address["ipv4addr"] for address in action["data"]["ipv4addrs"]]
+                lines.append("+ {} ({}) {}".format(action["name"], action["view"], " ".join(addresses)))
+            elif action["action"] == "delete":
+                lines.append("- {} ({})".format(action["name"], action["view"]))
+            else:
+                lines.append("~ {} ({})".format(action["name"], action["view"]))
+                for field, value in action["data"].items():
+                    lines.append("    {}: {!r} -> {!r}".format(field, self.shown(field, action["before"].get(field)), self.shown(field, value)))
+        counts = self.counts()
+        lines.append("{} to create, {} to update, {} to delete.".format(counts["create"], counts["update"], counts["delete"]))
+        return "\n".join(lines)
+
+
+def fetch_current(ib_connection, params={}, page_size=1000) -> dict:
+    """
+    Read the record:host objects in scope (params, such as {"zone": "example.com"})
+    in bulk and return them by (name, view).
+    """
+    query_params = {"_return_fields": RETURN_FIELDS}
+    query_params.update(params)
+    return {
+        (normalize_name(host["name"]), host.get("view", "default")): host
+        for host in ib_connection.stream("record:host", query_params, page_size=page_size, prefetch=2)
+        }
+
+
+def plan(ib_connection, desired: list, scope={}, delete=False, page_size=1000) -> Plan:
+    """
+    Compare the desired hosts with the current record:host objects in scope and
+    return the Plan of creates and updates and, with delete, deletes of the hosts in
+    scope which are not desired.  Nothing is changed.
+    """
+    current = fetch_current(ib_connection, scope, page_size)
+    host_plan = Plan()
+    seen = set()
+    for host in desired:
+        key = (host["name"], host["view"])
+        if key in seen:
+            raise ValueError("The host {} ({}) is desired twice.".format(*key))
+        seen.add(key)
+        current_host = current.get(key)
+        if current_host is None:
+            data = format_host(host["name"], host["addresses"], comment=host.get("comment", ""))
+            data.update({"view": host["view"]})
+            if "ttl" in host:
+                data.update({"ttl": host["ttl"], "use_ttl": True})
+            if "extattrs" in host:
+                data.update({"extattrs": {name: {"value": value} for name, value in host["extattrs"].items()}})
+            host_plan.add("create", host, data=data)
+            continue
+        changes = host_diff(host, current_host)
+        if changes:
+            before = {field: current_host.get(field) for field in changes}
+            host_plan.add("update", host, current_host["_ref"], changes, before)
+    if delete:
+        for key, current_host in current.items():
+            if key not in seen:
+                host_plan.add("delete", {"name": key[0], "view": key[1]}, current_host["_ref"])
+    return host_plan
+
+
+def apply(ib_connection, host_plan: Plan, chunk_size=100, workers=4) -> dict:
+    """
+    Carry out the plan through the WAPI "request" object, chunk_size actions per
+    HTTP request, with up to workers requests in flight when the Connection is
+    thread safe (Connection(thread_safe=True)).  A failed chunk is resent one action
+    at a time so that only the failing actions are lost.
+    Return the numbers done and the failures with their messages.
+    """
+    operations = list()
+    for action in host_plan.actions:
+        if action["action"] == "create":
+            operations.append(operation("POST", "record:host", action["data"]))
+        elif action["action"] == "update":
+            operations.append(operation("PUT", action["ref"], action["data"]))
+        else:
+            operations.append(operation("DELETE", action["ref"]))
+    chunks = [operations[position:position+chunk_size] for position in range(0, len(operations), chunk_size)]
+    if not getattr(ib_connection, "thread_safe", False):
+        workers = 1
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        chunk_responses = list(pool.map(lambda chunk: ib_connection.multi(chunk, chunk_size, "split"), chunks))
+    result = {"result": True, "create": 0, "update": 0, "delete": 0, "failed": []}
+    responses = [response for chunk_response in chunk_responses for response in chunk_response]
+    for action, response in zip(host_plan.actions, responses):
+        if response.ok:
+            result[action["action"]] += 1
+        else:
+            result["result"] = False
+            result["failed"].append({"action": action["action"], "name": action["name"], "view": action["view"],
+                                     "message": response.text})
+    return result
+
+
+def reconcile(ib_connection, desired: list, scope={}, delete=False, dry_run=False, chunk_size=100, workers=4) -> dict:
+    """
+    Plan and, unless dry_run, apply the changes bringing the record:host objects in
+    scope to the desired hosts.  Return the result with the plan.
+    """
+    host_plan = plan(ib_connection, desired, scope, delete)
+    if dry_run or not len(host_plan):
+        result = {"result": True, "dry_run": dry_run}
+        result.update(host_plan.counts())
+    else:
+        result = apply(ib_connection, host_plan, chunk_size, workers)
+    result.update({"plan": host_plan})
+    return result
@@ -1,16 +1,27 @@
 """
 record_host - DNS resource record operations for the WAPI object type record:host.
+
+The functions take a Connection, or a Batch from Connection.batch() to queue the
+operation in a multiple object request instead of sending it immediately.
 """
+from __future__ import annotations
 from ib_rest import Connection
-from ipaddress import ip_address
-from requests.models import Response
+from ipaddress import ip_address, ip_network
+import re
+import typing
+if typing.TYPE_CHECKING:
+    from requests.models import Response
 
 
-def isipavailable(ib_connection: Connection, ip_s: str, network_view="default") -> bool:
+def isipavailable(ib_connection: Connection, ip_s: str, network_view="default", index=None) -> bool:
     """
     Return True if a record:host is not, currently, configured with this IP address.
     Note only tests for record:host type; a configured record:a type will not be detected.
+    If a loaded ip_index.IpIndex of the network view is passed as index the answer
+    comes from the index, and the types it holds, without a WAPI request.
     """
+    if index is not None:
+        return index.isavailable(ip_s)
     response = ib_connection.get("record:host_ipv4addr", params={"ipv4addr":ip_address(ip_s).compressed, "network_view":network_view})
     return not response.json()
 
@@ -18,9 +29,35 @@ def isipavailable(ib_connection: Connection, ip_s: str, network_view="default")
 def format_host_data(ip_addresses: list) -> list:
     """
     Return a list of IP address objects with the format required for creating or
-    updating a DNS host record.
+    updating a DNS host record.  A func:nextavailableip value is passed unchanged.
+    """
+    return [{"ipv4addr":ip_s if ip_s.startswith("func:") else ip_address(ip_s).compressed} for ip_s in ip_addresses]
+
+
+def next_available_ip_function(network: str, network_view="default") -> str:
+    """
+    Return the IP address value which has the Grid Master assign the next available
+    address of the network (CIDR) when the record:host is created or updated.
+    """
+    return "func:nextavailableip:{},{}".format(ip_network(network).with_prefixlen, network_view)
+
+
+def next_available_ips(ib_connection: Connection, network: str, num=1, network_view="default", exclude=()) -> list:
     """
-    return [{"ipv4addr":ip_address(ip_s).compressed} for ip_s in ip_addresses]
+    Return up to num available IP addresses of the network (CIDR) from the network
+    object's next_available_ip function.  The addresses are not reserved.
+    """
+    response = ib_connection.get("network", params={"network":ip_network(network).with_prefixlen, "network_view":network_view})
+    if response.status_code != 200 or not response.json():
+        return []
+    response = ib_connection.post(
+        response.json()[0]["_ref"],
+        {"num":num, "exclude":list(exclude)},
+        params={"_function":"next_available_ip"}
+        )
+    if response.status_code == 200:
+        return response.json().get("ips", [])
+    return []
 
 
 def read_host(ib_connection: Connection, reference: str, fields="") -> dict:
@@ -52,15 +89,55 @@ def create_host(ib_connection: Connection, name: str, data: list, ttl=0, comment
     Create a new record:host object in DNS with the name (FQDN) with the list of one or more
     IP addresses.
     """
+    return ib_connection.post(
+        "record:host",
+        data=format_host(name, data, ttl, comment)
+        )
+
+
+def format_host(name: str, data: list, ttl=0, comment="") -> dict:
+    """
+    Return the record:host object, in the default DNS view, to create.
+    """
     host_d = {"name":name,"ipv4addrs":format_host_data(data),"view": "default"}
     if ttl:
         host_d.update({"ttl":ttl})
     if comment:
         host_d.update({"comment":comment})
-    return ib_connection.post(
-        "record:host",
-        data=host_d
-        )
+    return host_d
+
+
+def create_hosts(ib_connection: Connection, hosts: list, chunk_size=100, on_error="continue") -> list:
+    """
+    Create many record:host objects through the WAPI "request" object, chunk_size per
+    HTTP request.  Each host is a dict of the create_host arguments (name, data and,
+    optionally, ttl and comment).  Return a BatchResponse for each host in order.
+    """
+    with ib_connection.batch(chunk_size, on_error) as batch:
+        responses = [create_host(batch, **host) for host in hosts]
+    return responses
+
+
+def create_hosts_in_network(ib_connection: Connection, network: str, names: list, network_view="default", ttl=0, comment="", chunk_size=100) -> dict:
+    """
+    Create a record:host for each name with the next available IP address of the network
+    (CIDR), assigned by the Grid Master as each host is created.  The hosts are created
+    through the WAPI "request" object, chunk_size per HTTP request, so that addresses
+    are allocated and reserved in the same transaction.  A chunk that fails is split
+    and retried, so that only the hosts which cannot be created are left out.
+    Return the IP address assigned to each name, or "" where the host was not created.
+    """
+    from ib_rest.batch import operation
+    ip_function = next_available_ip_function(network, network_view)
+    operations = [
+        operation("POST", "record:host", format_host(name, [ip_function,], ttl, comment), {"_return_fields":"name,ipv4addrs"})
+        for name in names
+        ]
+    assigned = dict()
+    for name, response in zip(names, ib_connection.multi(operations, chunk_size, on_error="split")):
+        ipv4addrs = response.json().get("ipv4addrs", []) if response.ok and isinstance(response.json(), dict) else []
+        assigned.update({name: ipv4addrs[0].get("ipv4addr", "") if ipv4addrs else ""})
+    return assigned
 
 
 def find_host(ib_connection: Connection, name: str, view="default") -> Response:
@@ -71,6 +148,113 @@ def find_host(ib_connection: Connection, name: str, view="default") -> Response:
     return ib_connection.get("record:host", params={"name":name, "view": view})
 
 
+def find_hosts(ib_connection: Connection, names: list, view="default", fields="", strategy="auto", exact_below=4,
+               max_regex=3000, chunk_size=100, page_size=1000) -> dict:
+    """
+    Look up many record:host names (FQDNs) in a few queries instead of one find_host
+    per name.  Return a dict of each name to its record:host object, or None if not
+    found.
+
+    The names are grouped by their domain (all but the first label).  strategy is
+    "auto" - each domain with at least exact_below names is searched with paged
+             name~ regular expressions of up to max_regex characters, each matching
+             many first labels, unless exact lookups would take as few requests,
+             and the other names are looked up exactly;
+    "zone" - each domain with at least exact_below names is paged through whole
+             (zone=domain) and filtered locally, but only for as many pages as the
+             exact lookups of its names would take; the names of a larger zone, and
+             those not found in it (such as hosts of a subdomain which is not a
+             zone of its own), are then looked up exactly;
+    "exact" - every name is looked up exactly.
+    Exact lookups are sent through the WAPI "request" object, chunk_size per request.
+    fields are the _return_fields of the objects, with name added to match them, the
+    default fields if empty.
+    """
+    if strategy not in ("auto", "zone", "exact"):
+        raise ValueError("strategy must be auto, zone or exact.")
+    wanted = {name.strip().rstrip(".").lower(): name for name in names}
+    found = dict()
+    domains = dict()
+    for name in wanted:
+        label, _, domain = name.partition(".")
+        domains.setdefault(domain, list()).append(label)
+    if fields and "name" not in fields.split(","):
+        fields = "name,"+fields
+    params = {"view": view}
+    if fields:
+        params.update({"_return_fields": fields})
+    exact = list()
+    for domain, labels in domains.items():
+        if strategy == "exact" or len(labels) < exact_below or not domain:
+            exact.extend(label+"."+domain if domain else label for label in labels)
+        elif strategy == "zone":
+            budget = -(-len(labels) // chunk_size) * page_size
+            zone_hosts = list()
+            query_params = {"zone": domain}
+            query_params.update(params)
+            stream = ib_connection.stream("record:host", query_params, page_size=page_size)
+            for host in stream:
+                zone_hosts.append(host)
+                if len(zone_hosts) > budget:
+                    stream.close()
+                    break
+            domain_names = [label+"."+domain for label in labels]
+            if len(zone_hosts) > budget:
+                exact.extend(domain_names)
+                continue
+            _match_hosts(zone_hosts, wanted, found)
+            exact.extend(name for name in domain_names if name not in found)
+        else:
+            patterns = list(_label_patterns(labels, domain, max_regex))
+            if len(patterns) >= -(-len(labels) // chunk_size):
+                exact.extend(label+"."+domain for label in labels)
+                continue
+            for pattern in patterns:
+                query_params = {"name~": pattern}
+                query_params.update(params)
+                _match_hosts(ib_connection.stream("record:host", query_params, page_size=page_size), wanted, found)
+    if exact:
+        from ib_rest.batch import operation
+        args = {"view": view}
+        if fields:
+            args.update({"_return_fields": fields})
+        operations = [operation("GET", "record:host", args=dict(args, name=name)) for name in exact]
+        for response in ib_connection.multi(operations, chunk_size):
+            if response.ok and isinstance(response.result, list):
+                _match_hosts(response.result, wanted, found)
+    return {name: found.get(normalized) for normalized, name in wanted.items()}
+
+
+def _label_patterns(labels: list, domain: str, max_regex: int):
+    """
+    Generate regular expressions, of up to about max_regex characters, each matching
+    the FQDNs of a group of the first labels in the domain.
+    """
+    suffix = r")\."+re.escape(domain)+"$"
+    group = list()
+    length = len(suffix) + 2
+    for label in sorted(labels):
+        escaped = re.escape(label)
+        if group and length + len(escaped) + 1 > max_regex:
+            yield "^(" + "|".join(group) + suffix
+            group = list()
+            length = len(suffix) + 2
+        group.append(escaped)
+        length += len(escaped) + 1
+    if group:
+        yield "^(" + "|".join(group) + suffix
+
+
+def _match_hosts(hosts, wanted: dict, found: dict):
+    """
+    Keep the hosts whose name is wanted, by normalized name.
+    """
+    for host in hosts:
+        name = host.get("name", "").rstrip(".").lower()
+        if name in wanted:
+            found[name] = host
+
+
 def update_host_data(ib_connection: Connection, reference: str, data: list) -> Response:
     """
     Update the list of IP addresses assigned to the referenced record:host.
@@ -91,60 +275,11 @@ def update_host_comment(ib_connection: Connection, reference: str, comment: str)
     """
     return ib_connection.put(reference, {"comment": comment})
 
-    
-    
-if __name__ == "__main__":
-    """"""
-    from ltlddslta01_info import url, certificate_bundle
-    import os
-    ib_conn = Connection(url=url, certificate_bundle=certificate_bundle)
-    ib_conn.login(os.environ["TECHLAB_ACCOUNT"],os.environ["TECHLAB_PASSWORD"])
-
-    host_reference = ""
-    
-    #response = create_host(ib_conn, "ddi-host1.humana.com", ["10.32.15.30",], ttl=600, comment="DDI Host 1")
-    #response = ib_conn.get_by_reference('record:host/ZG5zLmhvc3QkLjEwLmNvbS5odW1hbmEuZGRpLWhvc3Qx:ddi-host1.humana.com/default')
-    response = find_host(ib_conn, "ddi-host1.humana.com")
-
-
-    """
-    if response.status_code in (200, 201):
-        host_reference = response.json()[0]["_ref"]
-    """
-    
-    #"""
-    if response.status_code == 200:
-        host_reference = response.json()[0]["_ref"]
-    #"""   
-    #print(host_reference)
 
+if __name__ == "__main__":
     """
-    if host_reference:
-        response = update_host_ttl(ib_conn, host_reference, 60)
-    """
-    #"""
-    if host_reference:
-        response = update_host_data(ib_conn, host_reference, ["10.32.15.31","10.32.15.32"])
-    #"""
-    #print(isipavailable(ib_conn, "10.32.15.27"))
-    
-    print(response.json())
-    
-    """
-    if response.json():
-        print(response.json()[0]["_ref"])
-    """
-    """
-    if host_reference:
-        ip_addresses = read_host_data(ib_conn, host_reference)
-        print(ip_addresses)
-    """
+    Look up hosts of the configured grid, see python -m ib_rest hosts --help.
     """
-    if host_reference:
-        host = read_host(ib_conn, host_reference, "ttl,view,network_view")
-        print(host)
-    """   
-    ib_conn.logout()
-
-    if not ib_conn.isloggedin:
-        print("logged out.")
+    import sys
+    from ib_rest.__main__ import main
+    sys.exit(main(["hosts"] + sys.argv[1:]))
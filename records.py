@@ -0,0 +1,139 @@
+"""
+records - compact, slotted record types for large lists of WAPI objects.
+"""
+import typing
+
+
+class Record:
+    """
+    A Record holds one WAPI object in slots, its _ref as ref and its fields as
+    attributes, taking a fraction of the memory of a dict.  Subclasses list ref and
+    then the fields in __slots__; fields missing from the object are None.
+    """
+    __slots__ = ()
+    wapi_type = ""
+    _page_struct = None
+
+    def __init__(self, *args, **kwargs):
+        """"""
+        for name, value in zip(self.__slots__, args):
+            setattr(self, name, value)
+        for name in self.__slots__[len(args):]:
+            setattr(self, name, kwargs.get(name))
+
+    @classmethod
+    def fields(cls) -> tuple:
+        """
+        The WAPI fields of the record, to request as _return_fields.
+        """
+        return cls.__slots__[1:]
+
+    @classmethod
+    def from_dict(cls, wapi_object:dict):
+        """
+        Make a record from a decoded WAPI object.
+        """
+        record = cls.__new__(cls)
+        record.ref = wapi_object.get("_ref")
+        for name in cls.__slots__[1:]:
+            setattr(record, name, wapi_object.get(name))
+        return record
+
+    @classmethod
+    def from_struct(cls, record_struct):
+        """
+        Make a record from a Struct of page_struct, which holds the same attributes.
+        """
+        record = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(record, name, getattr(record_struct, name))
+        return record
+
+    def to_dict(self) -> dict:
+        """
+        Return the WAPI object as a dict, with its _ref.
+        """
+        wapi_object = {"_ref": self.ref}
+        wapi_object.update({name: getattr(self, name) for name in self.__slots__[1:]})
+        return wapi_object
+
+    @classmethod
+    def page_struct(cls):
+        """
+        Return a msgspec Struct type for a page of these records, whose result is a
+        list of Structs with the same attributes, in the same order, to convert with
+        from_struct.  Requires msgspec.
+        """
+        if cls.__dict__.get("_page_struct") is None:
+            import msgspec
+            record_struct = msgspec.defstruct(
+                cls.__name__+"Struct",
+                [("ref", typing.Any, None)] + [(name, typing.Any, None) for name in cls.__slots__[1:]],
+                rename={"ref": "_ref"}
+                )
+            cls._page_struct = msgspec.defstruct(
+                cls.__name__+"Page",
+                [("result", typing.List[record_struct]), ("next_page_id", typing.Optional[str], None)]
+                )
+        return cls._page_struct
+
+    def __eq__(self, other):
+        """"""
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        """"""
+        return "{}({})".format(type(self).__name__, ", ".join("{}={!r}".format(name, getattr(self, name)) for name in self.__slots__))
+
+
+class HostRecord(Record):
+    """
+    A record:host.
+    """
+    __slots__ = ("ref", "name", "ipv4addrs", "view", "zone", "comment", "ttl", "extattrs")
+    wapi_type = "record:host"
+
+
+class Network(Record):
+    """
+    A network.
+    """
+    __slots__ = ("ref", "network", "network_view", "comment", "extattrs")
+    wapi_type = "network"
+
+
+class ARecord(Record):
+    """
+    A record:a.
+    """
+    __slots__ = ("ref", "name", "ipv4addr", "view", "zone", "comment", "ttl", "extattrs")
+    wapi_type = "record:a"
+
+
+class FixedAddress(Record):
+    """
+    A fixedaddress.
+    """
+    __slots__ = ("ref", "ipv4addr", "mac", "name", "network", "network_view", "comment", "extattrs")
+    wapi_type = "fixedaddress"
+
+
+RECORD_TYPES = {record_type.wapi_type: record_type for record_type in (HostRecord, Network, ARecord, FixedAddress)}
+FIELD_TYPES = dict()
+
+
+def record_type(wapi_type:str, fields=None):
+    """
+    Return the record type for a WAPI type: the built in one unless fields are named,
+    else a slotted type with those fields, made once for each WAPI type and fields.
+    """
+    if not fields and wapi_type in RECORD_TYPES:
+        return RECORD_TYPES[wapi_type]
+    if not fields:
+        raise ValueError("Name the fields of {} records.".format(wapi_type))
+    names = [name.strip() for name in fields.split(",") if name.strip()] if isinstance(fields, str) else list(fields)
+    key = (wapi_type, tuple(names))
+    if key not in FIELD_TYPES:
+        class_name = "".join(part.capitalize() for part in wapi_type.replace(":", "_").split("_"))+"Record"
+        FIELD_TYPES[key] = type(class_name, (Record,), {"__slots__": tuple(["ref"] + names), "wapi_type": wapi_type})
+    return FIELD_TYPES[key]
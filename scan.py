@@ -0,0 +1,192 @@
+"""
+scan - enumerate a large WAPI object type as disjoint shards paged concurrently.
+"""
+import queue
+import string
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def shards_by_network_view(ib_connection, params={}) -> list:
+    """
+    One shard per network view.
+    """
+    return [{"network_view": networkview["name"]}
+            for networkview in ib_connection.get_paged("networkview", {"_return_fields": "name"}, page_size=1000)]
+
+
+def shards_by_zone(ib_connection, params={}) -> list:
+    """
+    One shard per authoritative zone of the DNS view (default unless params has a view).
+    """
+    view = params.get("view", "default")
+    zones = ib_connection.get_paged("zone_auth", {"_return_fields": "fqdn", "view": view}, page_size=1000)
+    return [{"zone": zone["fqdn"], "view": view} for zone in zones]
+
+
+def shards_by_network_container(ib_connection, params={}) -> list:
+    """
+    One shard per network container, by the network_container field which holds the
+    immediate parent, plus a shard for the networks at the top ("/") of the network view.
+    Suitable for the network and networkcontainer types.
+    """
+    network_view = params.get("network_view", "default")
+    containers = ib_connection.get_paged(
+        "networkcontainer", {"_return_fields": "network", "network_view": network_view}, page_size=1000)
+    return [{"network_container": container, "network_view": network_view}
+            for container in ["/"] + [container["network"] for container in containers]]
+
+
+def shards_by_network(ib_connection, params={}) -> list:
+    """
+    One shard per network of the network view.  Suitable for ipv4address, which can
+    only be searched within a network.
+    """
+    network_view = params.get("network_view", "default")
+    networks = ib_connection.get_paged(
+        "network", {"_return_fields": "network", "network_view": network_view}, page_size=1000)
+    return [{"network": network["network"], "network_view": network_view} for network in networks]
+
+
+def shards_by_name_prefix(ib_connection, params={}) -> list:
+    """
+    One regular expression shard per leading digit or letter of the name and a last
+    shard for names starting with anything else.
+    """
+    prefixes = string.digits + string.ascii_lowercase
+    shards = [{"name~": "^" + prefix} for prefix in prefixes]
+    shards.append({"name~": "^[^" + prefixes + "]"})
+    return shards
+
+
+shard_functions = {
+    "network_view": shards_by_network_view,
+    "zone": shards_by_zone,
+    "network_container": shards_by_network_container,
+    "network": shards_by_network,
+    "name_prefix": shards_by_name_prefix,
+    }
+
+
+def make_shards(ib_connection, shard_by, params={}) -> list:
+    """
+    Return the list of shard search parameters for shard_by, which is the name of a
+    shard function above, a function of (ib_connection, params) or a list of dicts.
+    """
+    if isinstance(shard_by, str):
+        if shard_by not in shard_functions:
+            raise ValueError("shard_by must be one of {}.".format(", ".join(shard_functions)))
+        return shard_functions[shard_by](ib_connection, params)
+    if callable(shard_by):
+        return shard_by(ib_connection, params)
+    return list(shard_by)
+
+
+def scan(ib_connection, wapi_type:str, shard_by, params={}, workers=4, page_size=1000, ordered=True, buffer_pages=None):
+    """
+    Generate every object of wapi_type matching params by paging each shard on a pool
+    of workers threads, each thread with its own session.
+
+    With ordered set the objects are generated shard by shard, in shard order, with
+    pages of later shards buffered until their turn; once buffer_pages (default twice
+    workers) are buffered the workers paging later shards wait, so memory stays
+    bounded while the current shard is slow.  Otherwise pages are generated as they
+    arrive.  An exception raised while paging a shard is raised to the consumer.
+    Closing the generator stops the workers after their current requests.
+    """
+    shards = make_shards(ib_connection, shard_by, params)
+    if not shards:
+        return
+    page_q = queue.Queue(maxsize=workers*2)
+    stop = threading.Event()
+    local = threading.local()
+    buffer_pages = max(1, buffer_pages or workers*2)
+    turn = threading.Condition()
+    state = {"current": 0, "buffered": 0}
+
+    def admit(index:int) -> bool:
+        """
+        Wait, for a page of a shard after the one being generated, until there is room
+        in the buffer.  Return whether the page was counted as buffered.
+        """
+        if not ordered:
+            return False
+        with turn:
+            while index != state["current"] and state["buffered"] >= buffer_pages and not stop.is_set():
+                turn.wait(0.1)
+            if index == state["current"]:
+                return False
+            state["buffered"] += 1
+            return True
+
+    def release(count:int, current:int):
+        """
+        Free the buffer of count pages generated, and let the workers know the shard
+        now being generated.
+        """
+        with turn:
+            state["buffered"] -= count
+            state["current"] = current
+            turn.notify_all()
+
+    def put(item) -> bool:
+        """
+        Wait for room in the queue unless the consumer has gone away.
+        """
+        while not stop.is_set():
+            try:
+                page_q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def work(index:int, shard:dict):
+        """
+        Page one shard in to the queue, ending with an empty (None) page.
+        """
+        if not hasattr(local, "session"):
+            local.session = ib_connection.worker_session()
+        shard_params = dict()
+        shard_params.update(params)
+        shard_params.update(shard)
+        try:
+            pages = ib_connection._pages(wapi_type, shard_params, page_size, session=local.session, call="scan")
+            for page in pages:
+                if not put((index, page, None, admit(index))):
+                    pages.close()
+                    return
+            put((index, None, None, False))
+        except Exception as e:
+            put((index, None, e, False))
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ib_rest-scan")
+    for index, shard in enumerate(shards):
+        pool.submit(work, index, shard)
+    buffered = {index: list() for index in range(len(shards))}
+    done = set()
+    current = 0
+    try:
+        while len(done) < len(shards):
+            index, page, error, counted = page_q.get()
+            if error is not None:
+                raise error
+            if page is None:
+                done.add(index)
+            elif not ordered:
+                yield from page
+            else:
+                buffered[index].append((page, counted))
+            while ordered and current < len(shards):
+                for buffered_page, counted in buffered[current]:
+                    yield from buffered_page
+                    if counted:
+                        release(1, current)
+                buffered[current] = list()
+                if current not in done:
+                    break
+                current += 1
+                release(0, current)
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
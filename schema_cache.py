@@ -0,0 +1,114 @@
+"""
+schema_cache - cache the WAPI schema of each object type in memory and on disk.
+"""
+import hashlib
+import json
+import os
+import time
+
+
+class UnknownFieldException(Exception):
+    """"""
+    def __init__(self, wapi_type:str, names:list):
+        """"""
+        self.wapi_type = wapi_type
+        self.names = names
+        self.message = "Unknown or unreadable {} field(s): {}".format(wapi_type, ", ".join(names))
+        super().__init__(self.message)
+
+
+def default_cache_dir() -> str:
+    """
+    The folder for cached schemas: IB_REST_CACHE or ~/.ib_rest, then schema.
+    """
+    return os.path.join(os.environ.get("IB_REST_CACHE", os.path.join(os.path.expanduser("~"), ".ib_rest")), "schema")
+
+
+class SchemaCache:
+    """
+    The schema of a WAPI object type (GET <type>?_schema) lists its fields and what
+    each field supports.  A SchemaCache downloads each type's schema once, keeps it in
+    memory and in a JSON file per WAPI URL and type under cache_dir, and re-downloads
+    it once the file is older than max_age seconds.  The WAPI version is part of the
+    URL so each version has its own files.
+    """
+    def __init__(self, cache_dir="", max_age=7*24*3600):
+        """"""
+        self.cache_dir = cache_dir if cache_dir else default_cache_dir()
+        self.max_age = max_age
+        self.schemas = dict()
+
+    def path(self, url:str, wapi_type:str) -> str:
+        """
+        The file path of the cached schema of wapi_type for the WAPI at url.
+        """
+        url_hash = hashlib.sha256(url.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, url_hash, wapi_type.replace(":", "_")+".json")
+
+    def _read(self, file_path:str) -> dict:
+        """
+        Return the schema saved in the file, or an empty dict if missing or too old.
+        """
+        try:
+            if time.time() - os.path.getmtime(file_path) > self.max_age:
+                return {}
+            with open(file_path) as schema_file:
+                return json.load(schema_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, file_path:str, schema:dict):
+        """
+        Save the schema, replacing the file in one step so readers never see part of it.
+        """
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            temp_path = file_path+".tmp"
+            with open(temp_path, "w") as schema_file:
+                json.dump(schema, schema_file)
+            os.replace(temp_path, file_path)
+        except OSError:
+            pass
+
+    def get(self, ib_connection, wapi_type:str) -> dict:
+        """
+        Return the schema of wapi_type from memory, disk or, failing those, the WAPI.
+        """
+        key = (ib_connection.url, wapi_type)
+        if key not in self.schemas:
+            file_path = self.path(ib_connection.url, wapi_type)
+            schema = self._read(file_path)
+            if not schema:
+                response = ib_connection.get(wapi_type+"?_schema")
+                if response.status_code != 200:
+                    return {}
+                schema = response.json()
+                self._write(file_path, schema)
+            self.schemas[key] = schema
+        return self.schemas[key]
+
+    def fields(self, ib_connection, wapi_type:str) -> dict:
+        """
+        Return the field schemas of wapi_type by field name.
+        """
+        return {field["name"]: field for field in self.get(ib_connection, wapi_type).get("fields", [])}
+
+    def return_fields(self, ib_connection, wapi_type:str, names) -> str:
+        """
+        Validate that the named fields exist and can be read, then return them in the
+        comma separated form of _return_fields.  names may be a list or a string.
+        """
+        if isinstance(names, str):
+            names = [name.strip() for name in names.split(",") if name.strip()]
+        fields = self.fields(ib_connection, wapi_type)
+        if fields:
+            unknown = [name for name in names if "r" not in fields.get(name, {}).get("supports", "")]
+            if unknown:
+                raise UnknownFieldException(wapi_type, unknown)
+        return ",".join(names)
+
+    def clear(self):
+        """
+        Forget the schemas held in memory; the files are re-read when next needed.
+        """
+        self.schemas = dict()
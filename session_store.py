@@ -0,0 +1,98 @@
+"""
+session_store - keep WAPI session cookies and the schema between processes.
+"""
+import hashlib
+import json
+import os
+import stat
+import time
+
+
+def default_store_dir() -> str:
+    """
+    The folder for stored sessions: IB_REST_CACHE or ~/.ib_rest, then sessions.
+    """
+    return os.path.join(os.environ.get("IB_REST_CACHE", os.path.join(os.path.expanduser("~"), ".ib_rest")), "sessions")
+
+
+class SessionStore:
+    """
+    A SessionStore saves the session cookie (ibapauth) and the WAPI schema of a login
+    in a file per WAPI URL and user, so that a new Connection for the same URL and
+    user can reuse the session instead of authenticating and downloading the schema.
+
+    The folder is created readable by the owner only and each file is written with
+    mode 0600; a file which is readable by others, or older than max_age seconds, is
+    ignored.  The Grid Master ends idle sessions (600 seconds by default) so a
+    Connection logs in again when a reused session is refused (401).
+    """
+    def __init__(self, store_dir="", max_age=600):
+        """"""
+        self.store_dir = store_dir if store_dir else default_store_dir()
+        self.max_age = max_age
+
+    def path(self, url:str, user:str) -> str:
+        """
+        The file path of the stored session for the user at the WAPI url.
+        """
+        key = hashlib.sha256("\0".join([url, user]).encode()).hexdigest()
+        return os.path.join(self.store_dir, key+".json")
+
+    def load(self, url:str, user:str) -> dict:
+        """
+        Return the stored session ({"cookies": [...], "schema": {...}, "saved": time})
+        or an empty dict if there is no usable stored session.
+        """
+        file_path = self.path(url, user)
+        try:
+            file_stat = os.stat(file_path)
+            if file_stat.st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+                return {}
+            with open(file_path) as session_file:
+                saved = json.load(session_file)
+        except (OSError, ValueError):
+            return {}
+        if time.time() - saved.get("saved", 0) > self.max_age:
+            return {}
+        return saved
+
+    def save(self, url:str, user:str, cookies, schema:dict):
+        """
+        Store the cookies of a requests cookie jar with the schema, readable by the owner only.
+        """
+        saved = {
+            "saved": time.time(),
+            "cookies": [
+                {"name": cookie.name, "value": cookie.value, "domain": cookie.domain,
+                 "path": cookie.path, "secure": cookie.secure}
+                for cookie in cookies
+                ],
+            "schema": schema
+            }
+        file_path = self.path(url, user)
+        try:
+            os.makedirs(self.store_dir, mode=0o700, exist_ok=True)
+            temp_path = file_path+".tmp"
+            file_descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(file_descriptor, "w") as session_file:
+                json.dump(saved, session_file)
+            os.replace(temp_path, file_path)
+        except OSError:
+            pass
+
+    def restore(self, session, saved:dict):
+        """
+        Set the stored cookies in a requests session.
+        """
+        for cookie in saved.get("cookies", []):
+            session.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"],
+                                path=cookie["path"], secure=cookie["secure"])
+
+    def remove(self, url:str, user:str):
+        """
+        Forget the stored session, for example after logging out.
+        """
+        try:
+            os.remove(self.path(url, user))
+        except OSError:
+            pass
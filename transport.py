@@ -0,0 +1,279 @@
+"""
+transport - the HTTP transports a Connection sends its requests through.
+"""
+import http.cookiejar
+import socket
+import ssl
+import threading
+from urllib.parse import urlencode
+import requests
+from urllib3.connection import HTTPConnection
+
+#
+# TCP keepalive probes, in seconds, so that idle pooled connections to a distant
+# Grid Master are not silently dropped by firewalls and NAT on the way.
+#
+
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 15
+KEEPALIVE_COUNT = 4
+
+
+def keepalive_options(idle=KEEPALIVE_IDLE, interval=KEEPALIVE_INTERVAL, count=KEEPALIVE_COUNT) -> list:
+    """
+    Return the socket options enabling TCP keepalive, with the probe timing where
+    the platform supports setting it, added to urllib3's defaults (TCP_NODELAY).
+    """
+    options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPALIVE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class KeepAliveAdapter(requests.adapters.HTTPAdapter):
+    """
+    A requests HTTPAdapter whose pooled connections are kept open with TCP keepalive,
+    so each connection, and the TLS session negotiated on it, is reused for as many
+    requests as possible.  With pool_block a request waits for a free connection
+    rather than opening one outside the pool, which would be closed after use.
+    urllib3 does not retry: retries are left to the Connection's RetryPolicy.
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, socket_options=None):
+        """"""
+        self.socket_options = socket_options if socket_options is not None else keepalive_options()
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0, pool_block=pool_block)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        """"""
+        pool_kwargs.setdefault("socket_options", self.socket_options)
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+
+    def __setstate__(self, state):
+        """"""
+        self.socket_options = state.get("socket_options", keepalive_options())
+        super().__setstate__(state)
+
+
+class RequestsTransport:
+    """
+    The default transport: requests sessions sharing one KeepAliveAdapter.  They ask
+    for gzip or deflate compressed responses, as every requests Session does, unless
+    compress is False.
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, compress=True):
+        """"""
+        self.adapter = KeepAliveAdapter(pool_connections, pool_maxsize, pool_block)
+        self.compress = compress
+
+    def session(self):
+        """
+        Return a new requests Session sending through the shared connection pool.
+        """
+        session = requests.Session()
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+        if not self.compress:
+            session.headers.update({"Accept-Encoding": "identity"})
+        return session
+
+    def close(self):
+        """"""
+        self.adapter.close()
+
+
+class Http2Response:
+    """
+    An httpx response with the attributes and methods of a requests Response used by
+    ib_rest.
+    """
+    def __init__(self, response, body=None):
+        """"""
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.http_version = response.http_version
+        self.request = requests.models.PreparedRequest()
+        self.request.method = response.request.method
+        self.request.url = str(response.request.url)
+        self.request.body = body
+
+    @property
+    def ok(self) -> bool:
+        """"""
+        return self.status_code < 400
+
+    @property
+    def content(self) -> bytes:
+        """"""
+        try:
+            return self.response.read()
+        except Exception as e:
+            raise Http2Session.converted(e)
+
+    @property
+    def text(self) -> str:
+        """"""
+        self.content
+        return self.response.text
+
+    def json(self, **kwargs):
+        """"""
+        self.content
+        return self.response.json(**kwargs)
+
+    def iter_content(self, chunk_size=1):
+        """"""
+        try:
+            yield from self.response.iter_bytes(chunk_size)
+        except Exception as e:
+            raise Http2Session.converted(e)
+
+    def __repr__(self):
+        """"""
+        return "<Response [{}]>".format(self.status_code)
+
+    def raise_for_status(self):
+        """"""
+        if not self.ok:
+            raise requests.exceptions.HTTPError("{} for url: {}".format(self.status_code, self.url), response=self)
+
+    def close(self):
+        """"""
+        self.response.close()
+
+    def __enter__(self):
+        """"""
+        return self
+
+    def __exit__(self, *args):
+        """"""
+        self.close()
+
+
+class Http2Session:
+    """
+    A session with the request, get and post methods, headers and cookies of a
+    requests Session, sending through the shared httpx client of an Http2Transport.
+    Responses are Http2Responses and httpx errors are raised as the matching requests
+    exceptions, so retries and error handling work as with requests.
+    """
+    def __init__(self, transport):
+        """"""
+        self.transport = transport
+        self.headers = requests.structures.CaseInsensitiveDict()
+        self.cookies = requests.cookies.RequestsCookieJar()
+
+    @staticmethod
+    def converted(error):
+        """
+        Return the requests exception matching an httpx exception.
+        """
+        import httpx
+        if isinstance(error, httpx.TimeoutException):
+            return requests.exceptions.Timeout(str(error))
+        if isinstance(error, httpx.TransportError):
+            return requests.exceptions.ConnectionError(str(error))
+        return error
+
+    def request(self, method:str, url:str, params=None, data=None, json=None, headers=None, auth=None,
+                timeout=None, verify=True, stream=False):
+        """
+        Send the request and return an Http2Response, its body read unless stream.
+        As with requests, params are added to any query already in the url.  A file
+        like data is sent in chunks.
+        """
+        import httpx
+        client = self.transport.client(verify)
+        if params:
+            url += ("&" if "?" in url else "?")+urlencode(params, doseq=True)
+        request_headers = dict(self.headers)
+        request_headers.update(headers or {})
+        content = data
+        if hasattr(data, "read"):
+            if hasattr(data, "__len__"):
+                request_headers.update({"Content-Length": str(len(data))})
+            content = iter(lambda: data.read(64*1024), b"")
+        request = client.build_request(method, url, content=content, json=json, headers=request_headers,
+                                       cookies=self.cookies, timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT)
+        body = None if hasattr(data, "read") else request.read()
+        try:
+            response = client.send(request, auth=auth if auth is not None else httpx.USE_CLIENT_DEFAULT, stream=True)
+            httpx.Cookies(self.cookies).extract_cookies(response)
+            if not stream:
+                response.read()
+                response.close()
+        except Exception as e:
+            raise self.converted(e) from e
+        return Http2Response(response, body)
+
+    def get(self, url:str, **kwargs):
+        """"""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url:str, **kwargs):
+        """"""
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        """"""
+
+
+class SessionCookies(http.cookiejar.CookieJar):
+    """
+    The cookie jar of an httpx client which keeps no cookies, as each Http2Session
+    sends and keeps its own.
+    """
+    def set_cookie(self, cookie):
+        """"""
+
+    def extract_cookies(self, response, request):
+        """"""
+
+
+class Http2Transport:
+    """
+    A transport sending every request of a Connection, from any thread, through one
+    httpx client which multiplexes them as HTTP/2 streams over a single TLS
+    connection to the Grid Master, when it supports HTTP/2, so one handshake serves
+    the whole job.  Responses are compressed as with the default transport.
+    Requires httpx with HTTP/2 support (pip install httpx[http2]).
+    """
+    def __init__(self, max_connections=10, http2=True, compress=True):
+        """"""
+        self.max_connections = max_connections
+        self.http2 = http2
+        self.compress = compress
+        self.clients = dict()
+        self.lock = threading.Lock()
+
+    def client(self, verify):
+        """
+        The httpx client for a certificate bundle (verify), created on first use.
+        """
+        client = self.clients.get(verify)
+        if client is None:
+            import httpx
+            with self.lock:
+                client = self.clients.get(verify)
+                if client is None:
+                    limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+                    context = ssl.create_default_context(cafile=verify) if isinstance(verify, str) else verify
+                    client = self.clients[verify] = httpx.Client(verify=context, http2=self.http2, limits=limits,
+                                                                 timeout=None, cookies=SessionCookies())
+        return client
+
+    def session(self):
+        """
+        Return a new Http2Session sending through the shared client.
+        """
+        session = Http2Session(self)
+        session.headers.update({"Accept-Encoding": "gzip, deflate" if self.compress else "identity"})
+        return session
+
+    def close(self):
+        """"""
+        for client in self.clients.values():
+            client.close()
+        self.clients = dict()